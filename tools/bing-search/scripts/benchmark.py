@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+结果页解析基准
+对保存的 Bing 结果页（fixtures/*.html）逐页测量提取耗时，并与原先的正则级联对比
+
+每页重复解析多次，报告中位数与平均耗时、提取到的结果数和带摘要的结果数。
+另测一次分块喂入（模拟边下载边解析），确认与整页解析结果一致；
+页面旁有同名 .json（预期的提取结果）时核对整页解析结果与之一致。任何一页不一致时以非零状态退出。
+
+用法:
+    python benchmark.py                               # 默认 fixtures 目录，每页 200 次
+    python benchmark.py page1.html page2.html --runs 1000 --limit 5
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+from html import unescape
+from pathlib import Path
+from typing import List, Dict, Callable
+
+from extract import ResultExtractor, extract_results
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "fixtures"
+
+# 分块喂入时的块大小（字节），接近一次 socket 读取
+CHUNK_SIZE = 4096
+
+
+def regex_cascade(html: str, limit: int) -> List[Dict[str, str]]:
+    """原先的解析方式：整页 findall 结果块，再对每块依次尝试多个正则"""
+    results = []
+    for block in re.findall(r'<li class="b_algo"[^>]*>(.*?)</li>', html, re.DOTALL)[:limit]:
+        title_match = re.search(r'<a[^>]*href="([^"]+)"[^>]*><h2>(.*?)</h2>', block, re.DOTALL)
+        if not title_match:
+            continue
+        result = {'url': unescape(title_match.group(1)),
+                  'title': unescape(re.sub(r'<[^>]+>', '', title_match.group(2)).strip())}
+        snippet_match = re.search(r'<div class="b_caption"[^>]*>.*?p>(.*?)"</p>', block, re.DOTALL)
+        if snippet_match:
+            result['snippet'] = unescape(re.sub(r'<[^>]+>', '', snippet_match.group(1)).strip())
+        else:
+            alt_match = re.findall(r'<span>(.*?)"</span>', block)
+            result['snippet'] = (unescape(re.sub(r'<[^>]+>', '', alt_match[-1]).strip())
+                                 if alt_match else '')
+        results.append(result)
+    return results
+
+
+def extract_chunked(html: str, limit: int) -> List[Dict[str, str]]:
+    extractor = ResultExtractor(limit)
+    for start in range(0, len(html), CHUNK_SIZE):
+        if extractor.feed(html[start:start + CHUNK_SIZE]):
+            break
+    return extractor.close()
+
+
+class ParseBenchmark:
+    """结果页解析基准"""
+
+    PARSERS = {
+        'extract': extract_results,
+        'chunked': extract_chunked,
+        'regex': regex_cascade,
+    }
+
+    def __init__(self, runs: int = 200, limit: int = 10):
+        self.runs = runs
+        self.limit = limit
+
+    def measure(self, parse: Callable, html: str) -> Dict:
+        timings = []
+        for _ in range(self.runs):
+            start = time.perf_counter()
+            results = parse(html, self.limit)
+            timings.append(time.perf_counter() - start)
+        return {
+            'p50_ms': statistics.median(timings) * 1000,
+            'mean_ms': statistics.mean(timings) * 1000,
+            'results': len(results),
+            'snippets': sum(1 for r in results if r.get('snippet')),
+            'output': results,
+        }
+
+    def run(self, pages: List[Path]) -> List[Dict]:
+        rows = []
+        for page in pages:
+            html = page.read_text(encoding='utf-8', errors='ignore')
+            measured = {name: self.measure(parse, html) for name, parse in self.PARSERS.items()}
+            expected_file = page.with_suffix('.json')
+            expected = None
+            if expected_file.exists():
+                with open(expected_file, 'r', encoding='utf-8') as f:
+                    expected = json.load(f)[:self.limit]
+            rows.append({
+                'page': page.name,
+                'kb': len(html.encode('utf-8')) / 1024,
+                'consistent': measured['chunked']['output'] == measured['extract']['output'],
+                'expected': expected is None or measured['extract']['output'] == expected,
+                **{name: m for name, m in measured.items()},
+            })
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='结果页解析基准')
+    parser.add_argument('pages', nargs='*', help='结果页 HTML 文件 (默认: fixtures/*.html)')
+    parser.add_argument('--runs', '-r', type=int, default=200, help='每页解析次数 (默认: 200)')
+    parser.add_argument('--limit', '-l', type=int, default=10, help='结果数量 (默认: 10)')
+
+    args = parser.parse_args()
+
+    pages = [Path(p) for p in args.pages] or sorted(FIXTURES_DIR.glob("*.html"))
+    if not pages:
+        print(f"没有找到结果页: {FIXTURES_DIR}", file=sys.stderr)
+        sys.exit(1)
+
+    rows = ParseBenchmark(args.runs, args.limit).run(pages)
+
+    print(f"{'页面':<28}{'大小':>8}  {'解析器':<8}{'p50':>9}{'平均':>9}{'结果':>6}{'摘要':>6}")
+    for row in rows:
+        for name in ParseBenchmark.PARSERS:
+            m = row[name]
+            print(f"{row['page']:<28}{row['kb']:>6.0f}KB  {name:<8}{m['p50_ms']:>7.3f}ms"
+                  f"{m['mean_ms']:>7.3f}ms{m['results']:>6}{m['snippets']:>6}")
+    inconsistent = [row['page'] for row in rows if not row['consistent']]
+    if inconsistent:
+        print(f"\n✗ 分块解析与整页解析结果不一致: {', '.join(inconsistent)}")
+    unexpected = [row['page'] for row in rows if not row['expected']]
+    if unexpected:
+        print(f"\n✗ 提取结果与预期 (.json) 不一致: {', '.join(unexpected)}")
+    if inconsistent or unexpected:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+本机搜索代理
+同一台机器上的多个 Agent 经 Unix 套接字把搜索交给一个常驻进程，由它统一向上游请求
+
+    合并        相同的查询（规范化查询、数量、起始位置、搜索地址）同时到达时只请求上游一次，
+                其余请求等待并共享同一份结果（single-flight）
+    限速        所有上游请求共用一个令牌桶，多个 Agent 的突发请求不会叠加触发频率限制
+    缓存        代理持有结果缓存与 keep-alive 连接池，各 Agent 之间共享
+
+协议为每行一个 JSON 的请求/响应:
+    {"op": "search", "query": "...", "limit": 10, "first": 1, "endpoint": "..."}
+    → {"results": [...]}，搜索失败时 {"error": "...", "error_type": "DeadlineExceeded", ...}
+    {"op": "stats"} → 计数
+
+用法:
+    python broker.py serve                        # 默认套接字见 default_socket_path
+    python broker.py serve --rate 1 --burst 2 --cache-ttl 600
+    python broker.py stats
+    python search.py "Python 教程" --broker        # 或设置 BING_SEARCH_BROKER=<套接字路径>
+"""
+
+import os
+import sys
+import json
+import socket
+import tempfile
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from typing import List, Dict, Callable, Optional, Tuple
+
+from client import HTTPClient, GlobalRateLimiter, DEFAULT_RATE, DEFAULT_BURST
+from cache import ResponseCache, DEFAULT_TTL
+from search import search_bing, BING_URL
+from policy import (LatencyPolicy, SearchError, HTTPStatusError, error_from,
+                    DEFAULT_DEADLINE, DEFAULT_RETRIES)
+
+
+# 单个请求行的最大长度
+MAX_REQUEST_BYTES = 64 * 1024
+
+# 上游并发连接数
+UPSTREAM_CONNECTIONS = 4
+
+
+def default_socket_path() -> str:
+    """$BING_SEARCH_BROKER，其次 $XDG_RUNTIME_DIR/bing-search.sock，默认临时目录下按用户区分"""
+    if os.environ.get('BING_SEARCH_BROKER'):
+        return os.environ['BING_SEARCH_BROKER']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return str(Path(os.environ['XDG_RUNTIME_DIR']) / 'bing-search.sock')
+    return str(Path(tempfile.gettempdir()) / f'bing-search-{os.getuid()}.sock')
+
+
+class BrokerError(OSError):
+    """代理不可用或返回错误"""
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次，其余调用等待并共享结果（或异常）"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, fn: Callable) -> Tuple[object, bool]:
+        """执行 fn 或等待正在执行的同键调用，返回 (结果, 是否共享了其他调用的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # 先移除再唤醒，之后到达的请求不会拿到已完成的调用
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    """一个连接上可以依次发送多个请求"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_BYTES)
+            if not line:
+                return
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+
+
+class SearchBroker(socketserver.ThreadingUnixStreamServer):
+    """
+    搜索代理服务端
+
+        with SearchBroker(path) as broker:
+            broker.serve_forever()
+    """
+
+    daemon_threads = True
+
+    # 多个 Agent 同时连接时不被拒绝（默认只有 5）
+    request_queue_size = 128
+
+    def __init__(self, socket_path: Optional[str] = None, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST, cache: Optional[ResponseCache] = None,
+                 connections: int = UPSTREAM_CONNECTIONS,
+                 policy: Optional[LatencyPolicy] = None):
+        """
+        Args:
+            socket_path: Unix 套接字路径，默认见 default_socket_path
+            rate: 全部上游请求每秒的总数，0 表示不限速
+            burst: 限速允许的突发请求数
+            cache: 结果缓存，None 表示不缓存
+            connections: 每个上游主机的最大并发连接数
+            policy: 上游请求的总期限、重试与对冲策略
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self._remove_stale_socket()
+        super().__init__(self.socket_path, _BrokerHandler)
+        os.chmod(self.socket_path, 0o600)
+        self.cache = cache
+        self.client = HTTPClient(max_per_host=connections,
+                                 limiter=GlobalRateLimiter(rate, burst))
+        self.policy = policy or LatencyPolicy()
+        self.flight = SingleFlight()
+        self._counters = {'requests': 0, 'upstream': 0, 'coalesced': 0, 'errors': 0}
+        self._counter_lock = threading.Lock()
+
+    def _remove_stale_socket(self):
+        """上次未正常退出留下的套接字文件；已有代理在监听时不覆盖"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+        else:
+            raise BrokerError(f"代理已在运行: {self.socket_path}")
+        finally:
+            probe.close()
+
+    def dispatch(self, request: Dict) -> Dict:
+        op = request.get('op')
+        if op == 'stats':
+            return self.stats()
+        if op != 'search':
+            raise ValueError(f"未知操作: {op}")
+        self._count('requests')
+        query = request['query']
+        limit = int(request.get('limit', 10))
+        first = int(request.get('first', 1))
+        endpoint = request.get('endpoint') or BING_URL
+        key = ResponseCache.key(query, limit, endpoint, first)
+        try:
+            results, shared = self.flight.do(
+                key, lambda: self._upstream(query, limit, endpoint, first))
+        except SearchError as e:
+            # 合并的请求共享同一个错误
+            self._count('errors')
+            response = {'error': str(e), 'error_type': type(e).__name__}
+            if isinstance(e, HTTPStatusError):
+                response['status'] = e.status
+            return response
+        if shared:
+            self._count('coalesced')
+        return {'results': results}
+
+    def _upstream(self, query: str, limit: int, endpoint: str, first: int) -> List[Dict]:
+        self._count('upstream')
+        return search_bing(query, limit, self.client, endpoint, self.cache, first,
+                           policy=self.policy)
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict:
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats['http_requests'] = self.client.requests_sent
+        stats['connections_opened'] = self.client.connections_opened
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+class BrokerClient:
+    """搜索代理客户端，线程安全（每个请求一个连接）"""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = 120):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self.failed = False       # 连接失败过，调用方据此改为直接请求
+
+    def search(self, query: str, limit: int = 10, endpoint: str = BING_URL,
+               first: int = 1) -> List[Dict[str, str]]:
+        """
+        经代理搜索
+
+        Raises:
+            BrokerError: 代理不可用
+            SearchError: 代理向上游搜索失败
+        """
+        response = self._call({'op': 'search', 'query': query, 'limit': limit,
+                               'first': first, 'endpoint': endpoint})
+        if 'error_type' in response:
+            raise error_from(response['error_type'], response['error'], response.get('status'))
+        return response['results']
+
+    def stats(self) -> Dict:
+        return self._call({'op': 'stats'})
+
+    def _call(self, request: Dict) -> Dict:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+                with sock.makefile('rb') as reader:
+                    line = reader.readline()
+        except OSError as e:
+            self.failed = True
+            raise BrokerError(f"无法连接搜索代理 {self.socket_path}: {e}") from e
+        if not line:
+            raise BrokerError("搜索代理关闭了连接")
+        response = json.loads(line)
+        if 'error' in response and 'error_type' not in response:
+            raise BrokerError(response['error'])
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本机搜索代理')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='启动代理')
+    serve_parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                              help=f'全部上游请求每秒总数，0 为不限速 (默认: {DEFAULT_RATE})')
+    serve_parser.add_argument('--burst', type=int, default=DEFAULT_BURST,
+                              help=f'限速允许的突发请求数 (默认: {DEFAULT_BURST})')
+    serve_parser.add_argument('--connections', type=int, default=UPSTREAM_CONNECTIONS,
+                              help=f'上游并发连接数 (默认: {UPSTREAM_CONNECTIONS})')
+    serve_parser.add_argument('--deadline', type=float, default=DEFAULT_DEADLINE,
+                              help=f'每次上游搜索的总期限（秒，默认: {DEFAULT_DEADLINE:g}）')
+    serve_parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                              help=f'上游失败后最多重试次数 (默认: {DEFAULT_RETRIES})')
+    serve_parser.add_argument('--no-cache', action='store_true', help='不读写结果缓存')
+    serve_parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                              help=f'缓存有效期（秒，默认: {DEFAULT_TTL}）')
+    serve_parser.add_argument('--cache-dir', help='缓存目录 (默认: ~/.cache/bing-search)')
+
+    subparsers.add_parser('stats', help='代理统计')
+
+    for sub in subparsers.choices.values():
+        sub.add_argument('--socket', '-s', help='Unix 套接字路径 (默认: $BING_SEARCH_BROKER)')
+
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        try:
+            stats = BrokerClient(args.socket).stats()
+        except BrokerError as e:
+            print(f"✗ {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"请求: {stats['requests']}，上游查询: {stats['upstream']}，"
+              f"合并: {stats['coalesced']}，失败: {stats['errors']}")
+        print(f"HTTP 请求: {stats['http_requests']}，新建连接: {stats['connections_opened']}")
+        return
+
+    cache = None if args.no_cache else ResponseCache(args.cache_dir, args.cache_ttl)
+    try:
+        broker = SearchBroker(args.socket, args.rate, args.burst, cache, args.connections,
+                              LatencyPolicy(args.deadline, args.retries))
+    except BrokerError as e:
+        if cache is not None:
+            cache.close()
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"搜索代理已启动: {broker.socket_path}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+搜索结果缓存
+把解析后的搜索结果按 (规范化查询, 数量, 搜索地址, 起始位置) 存入本地 SQLite，重复的查询不再访问网络
+
+    新鲜（未过 TTL）      直接返回缓存的结果，进程内再次命中只是一次字典查找
+    过期但有 ETag/Last-Modified   带 If-None-Match/If-Modified-Since 重新请求，304 时续期并沿用结果
+    过期且请求失败        返回过期结果（stale-if-error）
+
+总大小超过上限时按最近访问时间淘汰（LRU）。命中时的访问时间与计数先记在内存中，
+关闭缓存或写入新结果时一并落盘，命中路径不写数据库。
+
+用法:
+    python cache.py stats
+    python cache.py purge                 # 清空
+    python cache.py purge --expired       # 只删除过期条目
+    python cache.py purge --query "Python 教程"
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import unicodedata
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Dict, Optional, NamedTuple
+
+
+# 默认有效期（秒）
+DEFAULT_TTL = 3600
+
+# 缓存总大小上限（字节）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 进程内保留的已解码结果数
+MEMORY_ENTRIES = 256
+
+# 统计计数
+COUNTERS = ['hits', 'misses', 'revalidated', 'stale_served', 'stored', 'evicted']
+
+
+def default_cache_dir() -> Path:
+    """$BING_SEARCH_CACHE，其次 $XDG_CACHE_HOME/bing-search，默认 ~/.cache/bing-search"""
+    if os.environ.get('BING_SEARCH_CACHE'):
+        return Path(os.environ['BING_SEARCH_CACHE'])
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'bing-search'
+
+
+def normalize_query(query: str) -> str:
+    """全角半角统一、大小写折叠、合并空白；只差这些的查询共用缓存"""
+    return " ".join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+class CachedResults(NamedTuple):
+    """缓存的一次查询结果"""
+    results: List[Dict[str, str]]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """重新验证用的条件请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """搜索结果的持久缓存，线程安全"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        query TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        endpoint TEXT NOT NULL,
+        body TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        stored_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        accessed_at REAL NOT NULL,
+        size INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed_at);
+
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir: 缓存目录，默认见 default_cache_dir
+            ttl: 结果有效期（秒）
+            max_bytes: 缓存总大小上限，超出时淘汰最久未访问的条目
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = self.cache_dir / "cache.db"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()      # key → CachedResults
+        self._touched = {}                # key → 最近访问时间，待落盘
+        self._counts = dict.fromkeys(COUNTERS, 0)
+
+    @staticmethod
+    def key(query: str, count: int, endpoint: str, first: int = 1) -> str:
+        raw = f"{endpoint}\0{normalize_query(query)}\0{count}"
+        if first > 1:
+            # 分页请求按起始位置区分；第一页的键与不分页时相同
+            raw += f"\0{first}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResults]:
+        """查找缓存（含过期条目，由调用方按 fresh 决定是否重新验证）"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT body, etag, last_modified, expires_at FROM results WHERE key = ?",
+                    (key,)).fetchone()
+                if row is None:
+                    return None
+                entry = CachedResults(json.loads(row[0]), row[1], row[2], row[3])
+                self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+            self._touched[key] = time.time()
+            return entry
+
+    def put(self, key: str, query: str, count: int, endpoint: str,
+            results: List[Dict[str, str]], etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> CachedResults:
+        """写入一次查询的结果，随后按大小上限淘汰"""
+        body = json.dumps(results, ensure_ascii=False)
+        now = time.time()
+        entry = CachedResults(results, etag, last_modified, now + self.ttl)
+        with self._lock:
+            self._flush()
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO results (key, query, count, endpoint, body, etag, "
+                    "last_modified, stored_at, expires_at, accessed_at, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, normalize_query(query), count, endpoint, body, etag, last_modified,
+                     now, entry.expires_at, now, len(body.encode('utf-8'))))
+            self._remember(key, entry)
+            self._counts['stored'] += 1
+            self._evict()
+        return entry
+
+    def renew(self, key: str) -> Optional[CachedResults]:
+        """重新验证通过（304）后续期"""
+        with self._lock:
+            expires_at = time.time() + self.ttl
+            with self.conn:
+                self.conn.execute("UPDATE results SET expires_at = ? WHERE key = ?",
+                                  (expires_at, key))
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry = entry._replace(expires_at=expires_at)
+                self._remember(key, entry)
+            return entry
+
+    def record(self, name: str, n: int = 1):
+        """累加统计计数，关闭时落盘"""
+        with self._lock:
+            self._counts[name] += n
+
+    def _remember(self, key: str, entry: CachedResults):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """总大小超过上限时删除最久未访问的条目，直到降到上限的九成"""
+        total = self.conn.execute("SELECT total(size) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        victims = []
+        for key, size in self.conn.execute(
+                "SELECT key, size FROM results ORDER BY accessed_at"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM results WHERE key = ?", victims)
+        for (key,) in victims:
+            self._memory.pop(key, None)
+        self._counts['evicted'] += len(victims)
+
+    def _flush(self):
+        """把访问时间与计数写入数据库"""
+        if not self._touched and not any(self._counts.values()):
+            return
+        with self.conn:
+            self.conn.executemany("UPDATE results SET accessed_at = ? WHERE key = ?",
+                                  [(at, key) for key, at in self._touched.items()])
+            self.conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [(name, n) for name, n in self._counts.items() if n])
+        self._touched.clear()
+        self._counts = dict.fromkeys(COUNTERS, 0)
+
+    def stats(self) -> Dict:
+        """条目数、大小、过期条目数与累计计数"""
+        with self._lock:
+            self._flush()
+            entries, size, expired = self.conn.execute(
+                "SELECT count(*), total(size), total(expires_at < ?) FROM results",
+                (time.time(),)).fetchone()
+            counters = dict.fromkeys(COUNTERS, 0)
+            counters.update(self.conn.execute("SELECT name, value FROM counters"))
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'entries': entries,
+            'bytes': int(size),
+            'expired': int(expired),
+            'max_bytes': self.max_bytes,
+            'hit_rate': counters['hits'] / lookups if lookups else None,
+            **counters,
+        }
+
+    def purge(self, expired_only: bool = False, query: Optional[str] = None) -> int:
+        """
+        删除缓存条目
+
+        Args:
+            expired_only: 只删除过期条目
+            query: 只删除此查询（任意数量与搜索地址）的条目
+
+        Returns:
+            删除的条目数
+        """
+        where, params = [], []
+        if expired_only:
+            where.append("expires_at < ?")
+            params.append(time.time())
+        if query is not None:
+            where.append("query = ?")
+            params.append(normalize_query(query))
+        sql = "DELETE FROM results" + (f" WHERE {' AND '.join(where)}" if where else "")
+        with self._lock:
+            self._flush()
+            with self.conn:
+                removed = self.conn.execute(sql, params).rowcount
+                if not where:
+                    self.conn.execute("DELETE FROM counters")
+            self._memory.clear()
+        if not where:
+            self.conn.execute("VACUUM")
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索结果缓存')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('stats', help='缓存统计')
+
+    purge_parser = subparsers.add_parser('purge', help='删除缓存条目')
+    purge_parser.add_argument('--expired', action='store_true', help='只删除过期条目')
+    purge_parser.add_argument('--query', '-q', help='只删除此查询的条目')
+
+    for sub in subparsers.choices.values():
+        sub.add_argument('--cache-dir', help='缓存目录 (默认: ~/.cache/bing-search)')
+
+    args = parser.parse_args()
+
+    with ResponseCache(args.cache_dir) as cache:
+        if args.command == 'stats':
+            stats = cache.stats()
+            hit_rate = f"{stats['hit_rate']:.1%}" if stats['hit_rate'] is not None else "-"
+            print(f"缓存: {cache.db_file}")
+            print(f"条目: {stats['entries']}（过期 {stats['expired']}）")
+            print(f"大小: {stats['bytes'] / 1024:.1f} KB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+            print(f"命中率: {hit_rate}（命中 {stats['hits']}，未命中 {stats['misses']}）")
+            print(f"重新验证: {stats['revalidated']}，过期兜底: {stats['stale_served']}，"
+                  f"写入: {stats['stored']}，淘汰: {stats['evicted']}")
+        else:
+            removed = cache.purge(args.expired, args.query)
+            print(f"✓ 删除 {removed} 个缓存条目")
+
+
+if __name__ == '__main__':
+    main()
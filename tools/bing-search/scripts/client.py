@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+HTTP 客户端
+按主机复用 keep-alive 连接，并按主机限速，供多个线程并发调用
+
+urllib.request.urlopen 每次请求都新建 TCP/TLS 连接；这里每个主机维护一个空闲连接池，
+请求结束且服务端未要求关闭时把连接放回池中，下一次请求直接复用，省去握手。
+同一主机的并发连接数有上限，超出时等待其他请求归还连接。
+stream() 返回尚未读取响应体的响应，可以边接收边处理，并在读够之后提前断开。
+请求头带 Accept-Encoding（见 ACCEPT_ENCODING）时，iter_decoded() 按 Content-Encoding 边接收边解压；
+gzip/deflate 使用标准库 zlib，br 需要安装 brotli（未安装时不声明 br）。
+"""
+
+import ssl
+import zlib
+import time
+import threading
+import http.client
+import urllib.parse
+from collections import defaultdict
+from typing import Dict, Iterator, Optional, NamedTuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# 每个主机的默认请求速率（次/秒）与突发量，避免并发查询触发搜索引擎的频率限制
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+
+# 每个主机的最大并发连接数
+MAX_PER_HOST = 4
+
+# 最多跟随的重定向次数
+MAX_REDIRECTS = 5
+
+# 流式读取时每块的最大字节数
+CHUNK_SIZE = 64 * 1024
+
+# 提前结束读取时，剩余响应体不超过 DRAIN_BYTES 且能在 DRAIN_TIMEOUT 秒内读完的，读完后复用连接；
+# 否则断开连接，下一次请求重新握手
+DRAIN_BYTES = 64 * 1024
+DRAIN_TIMEOUT = 0.25
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+# 可以解压的内容编码，作为请求头 Accept-Encoding 的值
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+_DECODE_ERRORS = (zlib.error, brotli.error) if brotli is not None else (zlib.error,)
+
+# 复用的空闲连接可能已被服务端关闭，发送时遇到这些错误在新连接上重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+class Response(NamedTuple):
+    """完整读取的响应"""
+    status: int
+    headers: Dict[str, str]   # 键为小写
+    body: bytes               # 已按 Content-Encoding 解压
+    url: str                  # 跟随重定向后的最终地址
+
+
+class ContentDecodingError(http.client.HTTPException):
+    """响应体无法按 Content-Encoding 解压"""
+
+
+class _ZlibDecoder:
+    """gzip 与 zlib 格式（deflate）"""
+
+    def __init__(self):
+        # wbits 加 32 时按头部自动识别 gzip 或 zlib
+        self._zlib = zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def decode(self, data: bytes, size: int) -> Iterator[bytes]:
+        """解压一块输入，每次产出至多 size 字节，高压缩比的输入不会一次展开到内存中"""
+        while data:
+            out = self._zlib.decompress(data, size)
+            data = self._zlib.unconsumed_tail
+            if out:
+                yield out
+
+    def flush(self) -> bytes:
+        return self._zlib.flush()
+
+
+class _BrotliDecoder:
+    """brotli 格式；按输入块整体解压后再切分，单次解压的输出不设上限"""
+
+    def __init__(self):
+        self._brotli = brotli.Decompressor()
+
+    def decode(self, data: bytes, size: int) -> Iterator[bytes]:
+        out = self._brotli.process(data)
+        for i in range(0, len(out), size):
+            yield out[i:i + size]
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decoder(encoding: Optional[str]):
+    """Content-Encoding 对应的解压器，未编码时为 None"""
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return None
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return _ZlibDecoder()
+    if encoding == 'br' and brotli is not None:
+        return _BrotliDecoder()
+    raise ContentDecodingError(f"不支持的内容编码: {encoding}")
+
+
+class StreamedResponse:
+    """
+    未读取完的响应，持有连接直到关闭
+
+    响应体读完且服务端未要求关闭时，关闭即把连接放回池中。未读完就关闭时，剩余部分较小
+    （见 DRAIN_BYTES/DRAIN_TIMEOUT）则先读完再放回，省去下一次请求的握手，代价是关闭前多接收这部分数据；
+    剩余部分较大、读取超时或因异常关闭时连接一并关闭。
+    """
+
+    def __init__(self, client: 'HTTPClient', key, conn: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, url: str, slot: threading.BoundedSemaphore):
+        self.status = response.status
+        self.headers = {name.lower(): value for name, value in response.getheaders()}
+        self.url = url
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._slot = slot
+        self.bytes_received = 0   # 已接收的响应体字节数（解压前）
+
+    def iter_chunks(self, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """逐块产出响应体（解压前），每块是已到达的数据，至多 size 字节"""
+        while True:
+            chunk = self._response.read1(size)
+            if not chunk:
+                return
+            self.bytes_received += len(chunk)
+            yield chunk
+
+    def iter_decoded(self, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        逐块产出按 Content-Encoding 解压后的响应体，每块至多 size 字节
+
+        gzip/deflate 每一步解压的输出都不超过 size 字节；br 按输入块整体解压后再切分。
+
+        Raises:
+            ContentDecodingError: 不支持的内容编码或压缩数据损坏
+        """
+        decoder = _decoder(self.headers.get('content-encoding'))
+        if decoder is None:
+            yield from self.iter_chunks(size)
+            return
+        try:
+            for chunk in self.iter_chunks(size):
+                yield from decoder.decode(chunk, size)
+            tail = decoder.flush()
+        except _DECODE_ERRORS as e:
+            raise ContentDecodingError(f"解压失败: {e}") from e
+        if tail:
+            yield tail
+
+    def read(self) -> bytes:
+        """读取剩余的响应体（解压前）"""
+        body = self._response.read()
+        self.bytes_received += len(body)
+        return body
+
+    def close(self, drain: bool = True):
+        """
+        Args:
+            drain: 响应体未读完时，是否尝试读完剩余部分以复用连接
+        """
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        response = self._response
+        if drain and not self._finished() and not response.will_close:
+            self._drain(conn)
+        reusable = self._finished() and not response.will_close
+        if not reusable:
+            response.close()
+        try:
+            self._client._release(self._key, conn, reusable)
+        finally:
+            self._slot.release()
+
+    def _finished(self) -> bool:
+        """响应体是否已读完"""
+        response = self._response
+        if not response.isclosed() and response.length == 0:
+            # read1 读完 Content-Length 指定的长度后不会把响应标记为关闭，连接因此无法发送下一个请求；
+            # 此时 read() 不再读取数据，只把响应标记为关闭
+            response.read()
+        return response.isclosed()
+
+    def _drain(self, conn: http.client.HTTPConnection):
+        """读完较小的剩余响应体；剩余过多、超时或出错时停止，由调用方断开连接"""
+        response = self._response
+        # 有 Content-Length 时可以预先判断；分块传输时读到上限为止
+        if response.length is not None and response.length > DRAIN_BYTES:
+            return
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        budget = DRAIN_BYTES
+        try:
+            while not self._finished() and budget > 0:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                conn.sock.settimeout(left)
+                chunk = response.read1(min(budget, CHUNK_SIZE))
+                if not chunk:
+                    return
+                self.bytes_received += len(chunk)
+                budget -= len(chunk)
+        except (OSError, http.client.HTTPException):
+            return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 因异常（如读取超时）关闭时不再读取
+        self.close(drain=exc_type is None)
+
+
+class RateLimiter:
+    """按主机的令牌桶限速，线程安全"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        """
+        Args:
+            rate: 每个主机每秒的请求数，0 表示不限速
+            burst: 允许连续发出的请求数
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._next = {}           # 主机 → 令牌桶为空时下一个令牌的到达时刻
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str):
+        """取得一个令牌，必要时等待"""
+        if self.rate <= 0:
+            return
+        interval = 1.0 / self.rate
+        with self._lock:
+            now = time.monotonic()
+            arrival = max(self._next.get(host, now), now)
+            wait = arrival - now - (self.burst - 1) * interval
+            # 先预订再等待，并发的线程各自排在后面
+            self._next[host] = arrival + interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class GlobalRateLimiter(RateLimiter):
+    """所有主机共用一个令牌桶"""
+
+    def acquire(self, host: str):
+        super().acquire('*')
+
+
+class HTTPClient:
+    """带连接池与按主机限速的 HTTP 客户端，线程安全"""
+
+    def __init__(self, max_per_host: int = MAX_PER_HOST, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST, timeout: float = 10,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        Args:
+            max_per_host: 每个主机的最大并发连接数
+            rate: 每个主机每秒的请求数，0 表示不限速
+            burst: 限速允许的突发请求数
+            timeout: 连接与读取超时（秒）
+            limiter: 自定义限速器，给出时忽略 rate/burst
+        """
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter(rate, burst)
+        self.max_per_host = max_per_host
+        self._idle = defaultdict(list)     # (scheme, host, port) → 空闲连接
+        self._slots = {}                   # (scheme, host, port) → 并发连接信号量
+        self._lock = threading.Lock()
+        self._context = ssl.create_default_context()
+        # 统计新建连接与请求数，用于确认连接复用
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None,
+            timeout: Optional[float] = None) -> Response:
+        """
+        GET 请求，跟随重定向，读取完整响应体并按 Content-Encoding 解压
+
+        Args:
+            timeout: 本次请求的连接与读取超时（秒），默认为客户端的 timeout
+
+        Raises:
+            OSError: 连接失败或超时（含 socket.timeout）
+            http.client.HTTPException: 响应格式错误
+        """
+        with self.stream(url, headers, timeout) as response:
+            body = b"".join(response.iter_decoded())
+        return Response(response.status, response.headers, body, response.url)
+
+    def stream(self, url: str, headers: Optional[Dict[str, str]] = None,
+               timeout: Optional[float] = None) -> 'StreamedResponse':
+        """
+        GET 请求，跟随重定向，返回尚未读取响应体的响应
+
+            with client.stream(url) as response:
+                for chunk in response.iter_chunks():
+                    ...                   # 提前 break 时连接被关闭而不是放回池中
+
+        响应关闭前一直占用该主机的一个并发连接名额。
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._open(url, headers or {}, timeout)
+            location = response.headers.get('location')
+            if response.status not in _REDIRECTS or not location:
+                return response
+            with response:
+                response.read()
+            url = urllib.parse.urljoin(url, location)
+        return response
+
+    def _open(self, url: str, headers: Dict[str, str],
+              timeout: Optional[float] = None) -> 'StreamedResponse':
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        timeout = self.timeout if timeout is None else timeout
+        self.limiter.acquire(parts.hostname)
+        slot = self._slot(key)
+        if not slot.acquire(timeout=timeout):
+            raise TimeoutError(f"等待 {parts.hostname} 的空闲连接超时")
+        try:
+            conn, reused = self._checkout(key)
+            try:
+                try:
+                    response = self._send(conn, path, headers, timeout)
+                except _STALE_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    conn, reused = self._connect(key), False
+                    response = self._send(conn, path, headers, timeout)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            slot.release()
+            raise
+        return StreamedResponse(self, key, conn, response, url, slot)
+
+    def _send(self, conn: http.client.HTTPConnection, path: str, headers: Dict[str, str],
+              timeout: float) -> http.client.HTTPResponse:
+        # 复用的连接沿用上次的超时，按本次请求重新设置
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request('GET', path, headers={'Connection': 'keep-alive', **headers})
+        with self._lock:
+            self.requests_sent += 1
+        return conn.getresponse()
+
+    def _release(self, key, conn: http.client.HTTPConnection, reusable: bool):
+        if reusable:
+            with self._lock:
+                self._idle[key].append(conn)
+        else:
+            conn.close()
+
+    def _slot(self, key) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def _checkout(self, key):
+        """取一个空闲连接（最近归还的优先），没有时新建；返回 (连接, 是否复用)"""
+        with self._lock:
+            idle = self._idle[key]
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _connect(self, key) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout,
+                                               context=self._context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def close(self):
+        """关闭全部空闲连接"""
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
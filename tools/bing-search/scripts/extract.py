@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Bing 结果页提取
+按顺序扫描一遍结果页，流式产出每条结果的标题、URL 和摘要
+
+结果块之外的大段脚本、样式和导航只用编译好的模式查找下一个 <li class="b_algo"> 跳过，
+不逐个解析标签；进入结果块后只在 li/a/h2/p 等相关标签之间跳转，标题与摘要整段到达后一次取出。可以分块喂入（边下载边解析），
+取满 limit 条后立即停止，不再处理页面的其余部分。
+
+兼容两种结果块标记:
+    <h2><a href="URL">标题</a></h2>          当前版本
+    <a href="URL"><h2>标题</h2></a>          旧版本
+摘要取标题之后结果块中的第一个 <p>，忽略其中的 “网页” 等图标文字。
+
+用法:
+    python extract.py page.html --limit 5           # 解析保存的结果页，输出 JSON
+"""
+
+import re
+import sys
+import json
+import argparse
+from html import unescape
+from typing import List, Dict, Optional
+
+
+# 结果块的起始标签
+_BLOCK_START = re.compile(r'<li\b[^>]*?\bclass\s*=\s*["\'][^"\']*\bb_algo\b')
+
+# 结果块内需要处理的标签与注释开头；其余标签只作为标题/摘要片段的一部分整体去除
+_TAG = re.compile(r'<(?:(/?)(li|a|h2|p|script|style|template|noscript)\b'
+                  r'((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>|(!--))', re.IGNORECASE)
+
+_ATTR = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+
+_HREF = re.compile(r'<a\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))',
+                   re.IGNORECASE)
+
+# 摘要中不属于正文的图标/标记文字，如 <span class="algoSlug_icon">网页</span>
+_SKIP = re.compile(r'<span\b[^>]*\bclass\s*=\s*["\'][^"\']*\b(?:algoSlug_icon|c_tlbxTrgIcn)\b[^>]*>'
+                   r'[^<]*</span>', re.IGNORECASE)
+
+_MARKUP = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+
+# 内容不是 HTML 的元素，整体跳过
+_RAW_TEXT = {'script', 'style', 'template', 'noscript'}
+
+# 整段取出的元素的结束标签：名称之后须是空白、/ 或 >（</p 不匹配 </pre>、</param>），不区分大小写
+_END_TAG = {name: re.compile(rf'</{name}[\s/>]', re.IGNORECASE)
+            for name in _RAW_TEXT | {'h2', 'p'}}
+
+# 片段之间视为换行的标签
+_BREAK = re.compile(r'<(?:br|/?div|/?li)\b[^>]*>', re.IGNORECASE)
+
+
+def _attr(text: str, name: str) -> Optional[str]:
+    for match in _ATTR.finditer(text):
+        if match.group(1).lower() == name:
+            value = match.group(2)
+            if value is None:
+                value = match.group(3) if match.group(3) is not None else match.group(4) or ''
+            return unescape(value)
+    return None
+
+
+def _text(fragment: str) -> str:
+    """HTML 片段的纯文本，合并空白"""
+    fragment = _BREAK.sub(' ', fragment)
+    return " ".join(unescape(_MARKUP.sub('', fragment)).split())
+
+
+class ResultExtractor:
+    """
+    结果页的流式提取器
+
+        extractor = ResultExtractor(limit=10)
+        for chunk in chunks:
+            if extractor.feed(chunk):
+                break                     # 已取满，可以提前断开
+        results = extractor.close()
+    """
+
+    def __init__(self, limit: int = 10):
+        self.limit = limit
+        self.results = []
+        self.done = limit <= 0
+        self._buffer = ""
+        self._pos = 0
+        self._block = None        # 当前结果块的状态，块外为 None
+
+    def feed(self, data: str) -> bool:
+        """喂入下一段 HTML，返回是否已取满 limit 条"""
+        if self.done:
+            return True
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        self._run(final=False)
+        return self.done
+
+    def close(self) -> List[Dict[str, str]]:
+        """输入结束，处理剩余内容并返回结果"""
+        if not self.done:
+            self._run(final=True)
+            # 页面截断在最后一个结果块中间时，已取得标题的结果仍然有效
+            if self._block is not None:
+                self._finish_block()
+        self._buffer = ""
+        self._pos = 0
+        return self.results
+
+    def _run(self, final: bool):
+        buffer = self._buffer
+        pos = self._pos
+        while not self.done:
+            block = self._block
+            if block is None:
+                match = _BLOCK_START.search(buffer, pos)
+                if match is None:
+                    # 只保留可能是块起始标签前半截的末尾部分
+                    last = buffer.rfind('<', pos)
+                    pos = len(buffer) if last == -1 or final else last
+                    break
+                pos = match.start()
+                block = self._block = {'depth': 0, 'anchors': [], 'title': None, 'url': None,
+                                       'snippet': None}
+
+            match = _TAG.search(buffer, pos)
+            if match is None:
+                last = buffer.rfind('<', pos)
+                pos = len(buffer) if last == -1 or final else last
+                break
+
+            if match.group(4):
+                end = buffer.find('-->', match.end())
+                if end == -1:
+                    pos = len(buffer) if final else match.start()
+                    break
+                pos = end + 3
+                continue
+
+            closing, name, attrs = match.group(1), match.group(2).lower(), match.group(3)
+            pos = match.end()
+            if closing:
+                if name == 'li':
+                    block['depth'] -= 1
+                    if block['depth'] <= 0:
+                        self._finish_block()
+                elif name == 'a' and block['anchors']:
+                    block['anchors'].pop()
+                continue
+
+            if name in _END_TAG:
+                # 整段到达之后再处理：原始文本跳过，标题/摘要一次取出
+                close = _END_TAG[name].search(buffer, pos)
+                if close is not None:
+                    end = close.start()
+                elif not final:
+                    pos = match.start()
+                    break
+                else:
+                    end = len(buffer)
+                if name == 'h2':
+                    self._title(buffer[pos:end])
+                elif name == 'p' and block['title'] is not None and block['snippet'] is None:
+                    block['snippet'] = _text(_SKIP.sub('', buffer[pos:end]))
+                pos = end
+            elif name == 'li':
+                block['depth'] += 1
+            else:
+                block['anchors'].append(_attr(attrs, 'href'))
+        self._pos = pos
+
+    def _title(self, fragment: str):
+        block = self._block
+        if block['title'] is not None:
+            return
+        block['title'] = _text(fragment)
+        if block['url'] is None:
+            # 当前版本 <h2><a href>，旧版本 <a href><h2>
+            match = _HREF.search(fragment)
+            if match:
+                block['url'] = unescape(next(g for g in match.groups() if g is not None))
+            else:
+                block['url'] = next((a for a in reversed(block['anchors']) if a), None)
+
+    def _finish_block(self):
+        block = self._block
+        self._block = None
+        if not block['title'] or not block['url']:
+            return
+        self.results.append({'url': block['url'], 'title': block['title'],
+                             'snippet': block['snippet'] or ''})
+        if len(self.results) >= self.limit:
+            self.done = True
+
+
+def extract_results(html: str, limit: int = 10) -> List[Dict[str, str]]:
+    """从完整的结果页中提取至多 limit 条结果"""
+    extractor = ResultExtractor(limit)
+    extractor.feed(html)
+    return extractor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bing 结果页提取')
+    parser.add_argument('file', help='保存的结果页 HTML (- 为标准输入)')
+    parser.add_argument('--limit', '-l', type=int, default=10, help='结果数量 (默认: 10)')
+
+    args = parser.parse_args()
+
+    if args.file == '-':
+        html = sys.stdin.read()
+    else:
+        with open(args.file, 'r', encoding='utf-8', errors='ignore') as f:
+            html = f.read()
+    print(json.dumps(extract_results(html, args.limit), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+结果页正文抓取
+并发下载搜索结果指向的网页，边接收边把 HTML 转成纯文本，输出带字节预算的紧凑记录
+
+    下载      有界线程池并发，按域名限制同时连接数与请求速率；每页至多下载 max_bytes 字节
+    正文      流式 HTML 转文本，跳过脚本、样式、导航、页眉页脚与侧栏；页面有 <article>/<main>
+              时只取其中的文字。正文达到 text_bytes 后立即停止下载并断开连接
+    记录      在搜索结果上增加 text、truncated（正文被截断）、bytes（实际下载字节数），
+              失败时 text 为空并带 error
+
+用法:
+    python fetch.py https://example.com/a https://example.com/b
+    python fetch.py --urls-file urls.txt --text-bytes 2000 --per-domain 1
+    python search.py "Python 教程" --fetch                # 搜索后抓取每条结果的正文
+"""
+
+import re
+import sys
+import json
+import time
+import codecs
+import argparse
+import http.client
+from collections import deque
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Optional
+
+from client import HTTPClient, ACCEPT_ENCODING, DEFAULT_RATE, DEFAULT_BURST
+
+
+# 默认并发下载数
+DEFAULT_FETCH_WORKERS = 8
+
+# 每个域名的最大并发连接数
+PER_DOMAIN = 2
+
+# 每页最多接收的字节数（按解压后的大小，压缩传输时实际下载更少）
+MAX_DOWNLOAD_BYTES = 2 * 1024 * 1024
+
+# 每条记录正文的字节预算（UTF-8）
+TEXT_BYTES = 4000
+
+FETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml;q=0.9,text/plain;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': ACCEPT_ENCODING,
+}
+
+_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+
+
+class TextExtractor(HTMLParser):
+    """
+    流式 HTML 转文本
+
+        extractor = TextExtractor(budget=4000)
+        for text in chunks:
+            extractor.feed(text)
+            if extractor.done:
+                break
+        extractor.close()
+        extractor.text, extractor.title
+    """
+
+    # 内容不是正文的元素
+    SKIP = {'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'header',
+            'footer', 'aside', 'form', 'button', 'select'}
+
+    # 前后换行的块级元素
+    BLOCK = {'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'table', 'section', 'article', 'main',
+             'pre', 'blockquote', 'dd', 'dt', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr'}
+
+    # 正文容器，出现时只取其中的文字
+    MAIN = {'article', 'main'}
+
+    # 没有结束标签的元素
+    VOID = {'br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'base', 'col', 'embed',
+            'source', 'track', 'wbr'}
+
+    def __init__(self, budget: int = TEXT_BYTES):
+        super().__init__(convert_charrefs=True)
+        self.budget = budget
+        self.title = ""
+        self.done = False
+        self._skip = 0
+        self._main = 0
+        self._in_title = False
+        self._parts = {'all': [], 'main': []}
+        self._sizes = {'all': 0, 'main': 0}
+        self._seen_main = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID:
+            if tag in self.BLOCK:
+                self._append("\n")
+            return
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.MAIN:
+            self._main += 1
+            self._seen_main = True
+        elif tag == 'title':
+            self._in_title = True
+        if tag in self.BLOCK:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.MAIN:
+            self._main = max(0, self._main - 1)
+        elif tag == 'title':
+            self._in_title = False
+        if tag in self.BLOCK:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = " ".join((self.title + data).split())
+        elif not self._skip:
+            self._append(data)
+
+    def _append(self, text: str):
+        if self.done:
+            return
+        targets = ('all', 'main') if self._main else ('all',)
+        for name in targets:
+            self._parts[name].append(text)
+            self._sizes[name] += len(text.encode('utf-8'))
+        # 正文容器里的文字已够，或还没遇到正文容器时全文已够
+        if self._sizes['main'] > self.budget or (
+                not self._seen_main and self._sizes['all'] > self.budget * 2):
+            self.done = True
+
+    @property
+    def text(self) -> str:
+        """合并空白后的正文（未截断）"""
+        parts = self._parts['main'] if self._seen_main else self._parts['all']
+        lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def truncate_bytes(text: str, budget: int) -> str:
+    """按 UTF-8 字节数截断，不截断多字节字符"""
+    data = text.encode('utf-8')
+    if len(data) <= budget:
+        return text
+    return data[:budget].decode('utf-8', errors='ignore')
+
+
+def _charset(content_type: str, head: bytes) -> str:
+    match = re.search(r'charset\s*=\s*["\']?([\w-]+)', content_type, re.IGNORECASE)
+    name = match.group(1) if match else None
+    if name is None:
+        match = _CHARSET.search(head[:2048])
+        name = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return 'utf-8'
+    return name
+
+
+class PageFetcher:
+    """结果页的并发抓取器，线程安全"""
+
+    def __init__(self, client: Optional[HTTPClient] = None, workers: int = DEFAULT_FETCH_WORKERS,
+                 per_domain: int = PER_DOMAIN, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST, max_bytes: int = MAX_DOWNLOAD_BYTES,
+                 text_bytes: int = TEXT_BYTES, timeout: float = 10):
+        """
+        Args:
+            client: HTTP 客户端，默认新建一个按 per_domain/rate 限制每个域名的客户端
+            workers: 同时下载的页数
+            per_domain: 每个域名的最大并发连接数
+            rate: 每个域名每秒的请求数，0 表示不限速
+            max_bytes: 每页最多接收的字节数（按解压后的大小）
+            text_bytes: 每条记录正文的字节预算
+        """
+        self._own_client = client is None
+        self.client = client or HTTPClient(max_per_host=per_domain, rate=rate, burst=burst,
+                                           timeout=timeout)
+        self.workers = max(1, workers)
+        self.max_bytes = max_bytes
+        self.text_bytes = text_bytes
+
+    def fetch(self, url: str) -> Dict:
+        """下载一页并提取正文，失败时返回带 error 的记录"""
+        record = {'text': "", 'truncated': False, 'bytes': 0}
+        start = time.perf_counter()
+        try:
+            with self.client.stream(url, FETCH_HEADERS) as response:
+                content_type = response.headers.get('content-type', '')
+                if response.status != 200:
+                    record['error'] = f"HTTP {response.status}"
+                elif content_type and not re.search(r'html|text/plain', content_type, re.I):
+                    record['error'] = f"不支持的内容类型: {content_type.split(';')[0]}"
+                else:
+                    self._extract(response, content_type, record)
+        except (OSError, http.client.HTTPException) as e:
+            record['error'] = str(e) or type(e).__name__
+        record['elapsed_ms'] = round((time.perf_counter() - start) * 1000)
+        return record
+
+    def _extract(self, response, content_type: str, record: Dict):
+        extractor = TextExtractor(self.text_bytes)
+        decoder = None
+        received = 0
+        for chunk in response.iter_decoded():
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(_charset(content_type, chunk))('replace')
+            received += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            # 正文已够或达到上限（按解压后的大小）时提前断开，不再接收页面的其余部分
+            if extractor.done or received >= self.max_bytes:
+                record['truncated'] = True
+                break
+        else:
+            if decoder is not None:
+                extractor.feed(decoder.decode(b'', final=True))
+        extractor.close()
+        text = extractor.text
+        record['text'] = truncate_bytes(text, self.text_bytes)
+        record['truncated'] = record['truncated'] or len(record['text']) < len(text)
+        record['bytes'] = response.bytes_received
+        if extractor.title:
+            record['page_title'] = extractor.title
+
+    def fetch_all(self, results: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        抓取每条结果的正文，按输入顺序逐条产出 {**结果, text, truncated, bytes, ...}
+
+        输入可以是生成器（如 search_pages），结果到达即开始下载。
+        """
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        try:
+            for result in results:
+                pending.append((result, pool.submit(self.fetch, result['url'])))
+                # 提前提交一些，使下载与按序产出重叠
+                while len(pending) > self.workers * 2 or (pending and pending[0][1].done()):
+                    result, future = pending.popleft()
+                    yield {**result, **future.result()}
+            while pending:
+                result, future = pending.popleft()
+                yield {**result, **future.result()}
+        finally:
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def close(self):
+        if self._own_client:
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_urls(path: str) -> List[str]:
+    """URL 文件，每行一个，忽略空行；- 表示标准输入"""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='结果页正文抓取')
+    parser.add_argument('urls', nargs='*', help='网页地址，可给出多个')
+    parser.add_argument('--urls-file', '-f', help='URL 文件，每行一个 (- 为标准输入)')
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_FETCH_WORKERS,
+                        help=f'同时下载的页数 (默认: {DEFAULT_FETCH_WORKERS})')
+    parser.add_argument('--per-domain', type=int, default=PER_DOMAIN,
+                        help=f'每个域名的最大并发连接数 (默认: {PER_DOMAIN})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'每个域名每秒请求数，0 为不限速 (默认: {DEFAULT_RATE})')
+    parser.add_argument('--max-bytes', type=int, default=MAX_DOWNLOAD_BYTES,
+                        help=f'每页最多下载的字节数 (默认: {MAX_DOWNLOAD_BYTES})')
+    parser.add_argument('--text-bytes', type=int, default=TEXT_BYTES,
+                        help=f'每条记录正文的字节预算 (默认: {TEXT_BYTES})')
+
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.urls_file:
+        urls += read_urls(args.urls_file)
+    if not urls:
+        parser.error("需要网页地址或 --urls-file")
+
+    with PageFetcher(workers=args.workers, per_domain=args.per_domain, rate=args.rate,
+                     max_bytes=args.max_bytes, text_bytes=args.text_bytes) as fetcher:
+        for record in fetcher.fetch_all({'url': url} for url in urls):
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+if __name__ == '__main__':
+    main()
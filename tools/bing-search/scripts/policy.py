@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+请求延迟策略
+为一次搜索请求设定总期限，在期限内按指数退避重试，并在慢请求上发出对冲请求
+
+    总期限      重试、退避与对冲都计入一个总期限（默认 10 秒），每次尝试的超时取剩余时间
+    重试        连接失败、单次超时、HTTP 429/5xx 可重试，按指数退避（带随机抖动）等待，
+                服务端给出 Retry-After 时按其等待；其他 HTTP 错误不重试
+    对冲        一次尝试超过近期成功请求的 p95 耗时仍未返回时，再发出一个相同的请求，
+                取先成功的一个；样本不足时使用固定的对冲延迟
+
+失败时抛出 SearchError 的子类，调用方可以区分 “搜索失败” 与 “没有结果”:
+    DeadlineExceeded    总期限内没有成功
+    TransportError      连接失败或超时（重试用尽）
+    HTTPStatusError     服务端返回错误状态（.status）
+"""
+
+import time
+import queue
+import random
+import socket
+import threading
+import http.client
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from client import HTTPClient, Response, StreamedResponse
+
+
+# 默认总期限（秒）
+DEFAULT_DEADLINE = 10.0
+
+# 默认最多重试次数（不含首次）
+DEFAULT_RETRIES = 2
+
+# 退避的初始与最大等待（秒）
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 2.0
+
+# 耗时样本不足时的对冲延迟，以及对冲延迟的下限（秒）
+HEDGE_DEFAULT = 1.5
+HEDGE_MIN = 0.05
+
+# 计算 p95 所需的最少样本数与保留的样本数
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# 视为可重试的状态码
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class SearchError(Exception):
+    """搜索失败（区别于没有结果）"""
+
+    retryable = False
+
+
+class DeadlineExceeded(SearchError):
+    """总期限内没有成功"""
+
+
+class TransportError(SearchError):
+    """连接失败、连接被重置或单次请求超时"""
+
+    retryable = True
+
+
+class HTTPStatusError(SearchError):
+    """服务端返回错误状态"""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = status in RETRYABLE_STATUS
+
+
+def error_from(name: str, message: str, status: Optional[int] = None) -> SearchError:
+    """按类型名重建错误，用于经搜索代理传回的错误"""
+    if name == 'HTTPStatusError' and status is not None:
+        return HTTPStatusError(status)
+    cls = {cls.__name__: cls for cls in (DeadlineExceeded, TransportError)}.get(name, SearchError)
+    return cls(message)
+
+
+def _retry_after(headers: Dict[str, str]) -> Optional[float]:
+    try:
+        return max(0.0, float(headers['retry-after']))
+    except (KeyError, ValueError):
+        return None
+
+
+class LatencyTracker:
+    """近期成功请求的耗时，线程安全"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class LatencyPolicy:
+    """
+    请求的总期限、重试与对冲策略，线程安全；同一个策略对象累积耗时样本用于对冲
+
+        policy = LatencyPolicy(deadline=5, retries=3)
+        response = policy.get(client, url, headers)      # 失败时抛出 SearchError
+    """
+
+    def __init__(self, deadline: float = DEFAULT_DEADLINE, retries: int = DEFAULT_RETRIES,
+                 backoff: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 hedge: bool = True, hedge_after: Optional[float] = None):
+        """
+        Args:
+            deadline: 总期限（秒），包括重试、退避与对冲
+            retries: 最多重试次数（不含首次）
+            backoff: 第一次重试前的等待（秒），之后每次翻倍，不超过 backoff_max
+            hedge: 是否发出对冲请求
+            hedge_after: 固定的对冲延迟（秒），默认按近期成功请求的 p95 耗时
+        """
+        self.deadline = deadline
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.tracker = LatencyTracker()
+        self._counts = {'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+
+    def get(self, client: HTTPClient, url: str, headers: Dict[str, str]) -> Response:
+        """
+        按策略执行 GET，返回状态为 2xx 或 304 的响应
+
+        Raises:
+            SearchError: 重试用尽、不可重试的错误或超过总期限
+        """
+        return self.stream(client, url, headers, lambda response: Response(
+            response.status, response.headers, b"".join(response.iter_decoded()), response.url))
+
+    def stream(self, client: HTTPClient, url: str, headers: Dict[str, str],
+               consume: Callable[[StreamedResponse], object]):
+        """
+        按策略执行 GET，对状态为 2xx 或 304 的响应调用 consume(response) 边接收边处理，返回其结果
+
+        读取响应体的时间计入总期限，读取中断同样按策略重试。重试与对冲的每次尝试各调用一次 consume，
+        对冲时可能在两个线程中同时调用，consume 不应共享可变状态。consume 返回后连接关闭或归还。
+
+        Raises:
+            SearchError: 重试用尽、不可重试的错误或超过总期限
+        """
+        return self.run(lambda timeout: self._attempt(client, url, headers, timeout, consume))
+
+    def run(self, attempt: Callable[[float], object]):
+        """
+        执行 attempt(timeout)，按策略重试与对冲
+
+        attempt 失败时应抛出 SearchError；retryable 为真时重试。
+        """
+        deadline = time.monotonic() + self.deadline
+        for n in range(self.retries + 1):
+            if n:
+                self._count('retries')
+            try:
+                return self._hedged(attempt, deadline)
+            except DeadlineExceeded:
+                raise
+            except SearchError as e:
+                if not e.retryable or n == self.retries:
+                    raise
+                error = e
+            delay = min(self.backoff_max, self.backoff * 2 ** n) * random.uniform(0.5, 1.0)
+            if getattr(error, 'retry_after', None) is not None:
+                delay = error.retry_after
+            if time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded(f"{self.deadline:g} 秒内没有成功，最后一次错误: {error}")
+            time.sleep(delay)
+
+    def hedge_delay(self) -> Optional[float]:
+        """发出对冲请求前等待的时间，不对冲时为 None"""
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        p95 = self.tracker.percentile(0.95)
+        return HEDGE_DEFAULT if p95 is None else max(HEDGE_MIN, p95)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counts)
+        stats['p95'] = self.tracker.percentile(0.95)
+        return stats
+
+    def _hedged(self, attempt: Callable[[float], object], deadline: float):
+        """一次尝试，必要时加一个对冲请求；先成功的结果返回，都失败时抛出后失败的错误"""
+        results = queue.Queue()
+
+        def launch(hedge: bool):
+            self._count('hedges' if hedge else 'attempts')
+            threading.Thread(target=run, args=(hedge,), daemon=True).start()
+
+        def run(hedge: bool):
+            start = time.monotonic()
+            try:
+                value = attempt(max(0.001, deadline - start))
+            except SearchError as e:
+                results.put((False, e, hedge))
+            except Exception as e:
+                results.put((False, TransportError(str(e) or type(e).__name__), hedge))
+            else:
+                self.tracker.record(time.monotonic() - start)
+                results.put((True, value, hedge))
+
+        launch(False)
+        running = 1
+        hedge_at = None
+        delay = self.hedge_delay()
+        if delay is not None:
+            hedge_at = time.monotonic() + delay
+        error = None
+        while running:
+            now = time.monotonic()
+            if now >= deadline:
+                raise DeadlineExceeded(f"{self.deadline:g} 秒内没有成功")
+            wait = deadline - now
+            if hedge_at is not None:
+                wait = min(wait, max(0.0, hedge_at - now))
+            try:
+                ok, value, hedge = results.get(timeout=wait)
+            except queue.Empty:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    launch(True)
+                    running += 1
+                continue
+            running -= 1
+            if ok:
+                if hedge:
+                    self._count('hedge_wins')
+                return value
+            error = value
+            # 首个请求失败时不再等待对冲时刻，由外层决定是否重试
+            hedge_at = None
+        raise error
+
+    def _attempt(self, client: HTTPClient, url: str, headers: Dict[str, str], timeout: float,
+                 consume: Callable[[StreamedResponse], object]):
+        try:
+            with client.stream(url, headers, timeout) as response:
+                if response.status == 304 or 200 <= response.status < 300:
+                    return consume(response)
+                # 读完错误页，连接仍可复用
+                response.read()
+        except socket.timeout as e:
+            raise TransportError(f"请求超时（{timeout:.1f} 秒）") from e
+        except (OSError, http.client.HTTPException) as e:
+            raise TransportError(str(e) or type(e).__name__) from e
+        raise HTTPStatusError(response.status, _retry_after(response.headers))
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+
+def default_policy() -> LatencyPolicy:
+    """进程内共享的策略，多次搜索累积耗时样本"""
+    global _default_policy
+    with _default_policy_lock:
+        if _default_policy is None:
+            _default_policy = LatencyPolicy()
+        return _default_policy
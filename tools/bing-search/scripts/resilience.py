@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+延迟策略验证
+先逐项检查失败的类型，再对注入故障的桩服务器执行一批搜索，比较不同策略下的成功率、失败类型与耗时分布
+
+    baseline        不重试、不对冲（相当于原先的固定超时）
+    retry           指数退避重试
+    retry+hedge     重试，并在慢请求上发出对冲请求
+
+每个策略使用新的桩服务器（相同的故障种子）与新的连接池，查询互不相同且不使用缓存。
+
+逐项检查（每项一个只注入一种故障的桩服务器）:
+    503 重试用尽后抛出 HTTPStatusError(503)，上游请求数为 1 + 重试次数
+    连接断开重试用尽后抛出 TransportError
+    404 不重试，直接抛出 HTTPStatusError(404)
+    响应一直不返回时在总期限内抛出 DeadlineExceeded
+    按 Retry-After 等待后重试；Retry-After 超出剩余期限时立即抛出 DeadlineExceeded
+    没有结果时返回空列表而不是抛出错误
+
+批量对比之后检查：失败都是带类型的 SearchError（不会把失败报告为没有结果）、
+重试的成功率不低于不重试、重试 + 对冲的成功率不低于 --min-success、最长一次搜索不明显超过总期限。
+任何一项不满足时以非零状态退出。
+
+用法:
+    python resilience.py
+    python resilience.py --searches 500 --error-rate 0.2 --slow-rate 0.05 --slow-delay 5000
+    python resilience.py --deadline 2 --retries 3 --hedge-after 0.3
+    python resilience.py --error-rate 0.5 --min-success 0      # 故障率很高时不检查成功率下限
+"""
+
+import sys
+import time
+import argparse
+import statistics
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Type
+
+from client import HTTPClient
+from policy import (LatencyPolicy, SearchError, DeadlineExceeded, TransportError,
+                    HTTPStatusError)
+from search import search_bing
+from stub_server import StubServer, Faults
+
+
+# 最长一次搜索允许超出总期限的时间（秒）
+DEADLINE_SLACK = 0.5
+
+
+class ResilienceTest:
+    """延迟策略验证"""
+
+    def __init__(self, faults: Faults, searches: int = 200, workers: int = 8,
+                 delay: float = 0.02):
+        self.faults = faults
+        self.searches = searches
+        self.workers = workers
+        self.delay = delay
+
+    def run(self, name: str, policy: LatencyPolicy) -> Dict:
+        with StubServer(delay=self.delay, faults=self.faults) as server, \
+                HTTPClient(max_per_host=self.workers * 2, rate=0) as client:
+
+            def one(i: int):
+                start = time.perf_counter()
+                try:
+                    results = search_bing(f"查询 {name} {i}", 5, client, server.endpoint,
+                                          policy=policy)
+                    outcome = 'ok' if results else 'empty'
+                except SearchError as e:
+                    outcome = type(e).__name__
+                return outcome, time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                outcomes = list(pool.map(one, range(self.searches)))
+            elapsed = time.perf_counter() - start
+            server_stats = server.stats()
+
+        latencies = sorted(seconds for _, seconds in outcomes)
+        counts = Counter(outcome for outcome, _ in outcomes)
+        return {
+            'policy': name,
+            'success_rate': counts['ok'] / len(outcomes),
+            'outcomes': dict(counts),
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95) - 1],
+            'p99': latencies[int(len(latencies) * 0.99) - 1],
+            'max': latencies[-1],
+            'elapsed': elapsed,
+            'upstream_requests': server_stats['requests'],
+            **policy.stats(),
+        }
+
+    def expect(self, name: str, faults: Faults, policy: LatencyPolicy,
+               error: Optional[Type[SearchError]] = None, status: Optional[int] = None,
+               requests: Optional[int] = None, min_seconds: float = 0.0,
+               max_seconds: Optional[float] = None, available: int = 1000,
+               path: str = '/search') -> Optional[str]:
+        """
+        执行一次搜索并核对结果，不符合预期时返回问题描述
+
+        Args:
+            error: 预期抛出的错误类型，None 表示预期成功（available 为 0 时预期空列表）
+            status: 预期的 HTTPStatusError.status
+            requests: 预期的上游请求数
+            min_seconds / max_seconds: 搜索耗时的范围
+            path: 请求的路径，用于访问不存在的地址
+        """
+        with StubServer(delay=self.delay, faults=faults, available=available) as server, \
+                HTTPClient(rate=0) as client:
+            endpoint = server.endpoint.rsplit('/', 1)[0] + path
+            start = time.perf_counter()
+            try:
+                results = search_bing(f"检查 {name}", 5, client, endpoint, policy=policy)
+                outcome = None
+            except SearchError as e:
+                results = None
+                outcome = e
+            seconds = time.perf_counter() - start
+            upstream = server.stats()['requests']
+
+        got = type(outcome).__name__ if outcome else f"{len(results)} 条结果"
+        if error is None and outcome is not None:
+            return f"{name}: 预期成功，实际抛出 {got}: {outcome}"
+        if error is None and bool(results) != bool(available):
+            return f"{name}: 预期 {'有' if available else '没有'}结果，实际 {got}"
+        if error is not None and type(outcome) is not error:
+            return f"{name}: 预期 {error.__name__}，实际 {got}"
+        if status is not None and getattr(outcome, 'status', None) != status:
+            return f"{name}: 预期状态 {status}，实际 {getattr(outcome, 'status', None)}"
+        if requests is not None and upstream != requests:
+            return f"{name}: 预期上游请求 {requests} 次，实际 {upstream} 次"
+        if seconds < min_seconds or (max_seconds is not None and seconds > max_seconds):
+            upper = f"{max_seconds:g}" if max_seconds is not None else "∞"
+            return f"{name}: 耗时 {seconds:.2f}s 不在 [{min_seconds:g}, {upper}] 秒内"
+        return None
+
+    def check(self, deadline: float, retries: int) -> List[str]:
+        """逐项检查失败类型、重试次数、Retry-After 与总期限，返回发现的问题"""
+        def policy(**kwargs) -> LatencyPolicy:
+            kwargs.setdefault('hedge', False)
+            return LatencyPolicy(deadline, retries, backoff=0.01, **kwargs)
+
+        retry_after = min(0.3, deadline / (retries + 2))
+        checks = [
+            ('503 重试用尽', Faults(error_rate=1), policy(),
+             dict(error=HTTPStatusError, status=503, requests=retries + 1)),
+            ('连接断开重试用尽', Faults(reset_rate=1), policy(),
+             dict(error=TransportError)),
+            ('404 不重试', Faults(), policy(),
+             dict(error=HTTPStatusError, status=404, requests=1, path='/missing')),
+            ('总期限', Faults(slow_rate=1, slow_delay=deadline + 1), policy(hedge=True),
+             dict(error=DeadlineExceeded, min_seconds=deadline * 0.9,
+                  max_seconds=deadline + DEADLINE_SLACK)),
+            ('Retry-After', Faults(error_rate=1, retry_after=retry_after), policy(),
+             dict(error=HTTPStatusError, status=503, requests=retries + 1,
+                  min_seconds=retry_after * retries)),
+            ('Retry-After 超出期限', Faults(error_rate=1, retry_after=deadline * 2), policy(),
+             dict(error=DeadlineExceeded, requests=1, max_seconds=DEADLINE_SLACK)),
+            ('没有结果', Faults(), policy(), dict(available=0)),
+        ]
+
+        problems = []
+        for name, faults, check_policy, expected in checks:
+            problem = self.expect(name, faults, check_policy, **expected)
+            print(f"  {'✗' if problem else '✓'} {problem or name}")
+            if problem:
+                problems.append(problem)
+        return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='延迟策略验证')
+    parser.add_argument('--searches', '-n', type=int, default=200, help='每个策略的搜索次数 (默认: 200)')
+    parser.add_argument('--workers', '-w', type=int, default=8, help='并发数 (默认: 8)')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='返回 503 的比例 (默认: 0.1)')
+    parser.add_argument('--slow-rate', type=float, default=0.08, help='延迟返回的比例 (默认: 0.08)')
+    parser.add_argument('--slow-delay', type=float, default=3000,
+                        help='延迟返回时的延迟（毫秒，默认: 3000）')
+    parser.add_argument('--reset-rate', type=float, default=0.05,
+                        help='直接断开连接的比例 (默认: 0.05)')
+    parser.add_argument('--deadline', type=float, default=2.0, help='总期限（秒，默认: 2）')
+    parser.add_argument('--retries', type=int, default=2, help='最多重试次数 (默认: 2)')
+    parser.add_argument('--hedge-after', type=float,
+                        help='固定的对冲延迟（秒），默认按 p95 耗时')
+    parser.add_argument('--seed', type=int, default=1, help='故障随机种子 (默认: 1)')
+    parser.add_argument('--min-success', type=float, default=0.95,
+                        help='重试 + 对冲策略的成功率下限，0 为不检查 (默认: 0.95)')
+
+    args = parser.parse_args()
+
+    faults = Faults(args.error_rate, args.slow_rate, args.reset_rate, args.slow_delay / 1000,
+                    args.seed)
+    test = ResilienceTest(faults, args.searches, args.workers)
+    policies = [
+        ('baseline', LatencyPolicy(args.deadline, retries=0, hedge=False)),
+        ('retry', LatencyPolicy(args.deadline, args.retries, hedge=False)),
+        ('retry+hedge', LatencyPolicy(args.deadline, args.retries, hedge_after=args.hedge_after)),
+    ]
+
+    print(f"逐项检查（总期限 {args.deadline:g}s，重试 {args.retries} 次）:")
+    problems = test.check(args.deadline, args.retries)
+
+    print(f"\n故障: 503 {args.error_rate:.0%}，慢 {args.slow_rate:.0%}（{args.slow_delay:.0f}ms），"
+          f"断开 {args.reset_rate:.0%}；总期限 {args.deadline:g}s，{args.searches} 次搜索")
+    print(f"\n{'策略':<12}{'成功率':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>9}"
+          f"{'上游请求':>9}{'重试':>6}{'对冲':>6}  失败")
+    results = {}
+    for name, policy in policies:
+        r = results[name] = test.run(name, policy)
+        failures = ", ".join(f"{k} {v}" for k, v in sorted(r['outcomes'].items()) if k != 'ok')
+        print(f"{name:<12}{r['success_rate']:>8.1%}{r['p50'] * 1000:>7.0f}ms"
+              f"{r['p95'] * 1000:>7.0f}ms{r['p99'] * 1000:>7.0f}ms{r['max'] * 1000:>7.0f}ms"
+              f"{r['upstream_requests']:>9}{r['retries']:>6}{r['hedges']:>6}  {failures or '-'}")
+
+    for name, r in results.items():
+        # 桩服务器总是返回结果，空列表意味着失败被报告成了没有结果
+        if r['outcomes'].get('empty'):
+            problems.append(f"{name}: {r['outcomes']['empty']} 次搜索失败却返回了空列表")
+        # 总期限是硬上限：任何一次搜索都不应明显超过它
+        if r['max'] > args.deadline + DEADLINE_SLACK:
+            problems.append(f"{name}: 最长一次搜索 {r['max']:.2f}s 超过总期限 {args.deadline:g}s")
+    if results['retry']['success_rate'] < results['baseline']['success_rate']:
+        problems.append(f"retry: 成功率 {results['retry']['success_rate']:.1%} "
+                        f"低于不重试的 {results['baseline']['success_rate']:.1%}")
+    if results['retry+hedge']['success_rate'] < args.min_success:
+        problems.append(f"retry+hedge: 成功率 {results['retry+hedge']['success_rate']:.1%} "
+                        f"低于下限 {args.min_success:.0%}")
+
+    if problems:
+        print(f"\n✗ 发现 {len(problems)} 个问题:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("\n✓ 失败类型、重试、Retry-After、总期限与成功率均符合预期")
+
+
+if __name__ == '__main__':
+    main()
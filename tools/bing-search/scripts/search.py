@@ -6,125 +6,458 @@ Bing 搜索工具
 用法:
     python search.py "Python 教程"
     python search.py "Python 教程" --limit 10 --output results.json
+    python search.py "Python 教程" "Rust 教程" "Go 教程" --workers 3   # 多个查询并发执行
+    python search.py --queries-file queries.txt --rate 1                 # 每行一个查询，- 为标准输入
+    python search.py "测试" --endpoint http://127.0.0.1:8765/search      # 指向本地桩服务器，见 stub_server.py
+    python search.py "Python 教程" --cache-ttl 600                       # 结果缓存 10 分钟，见 cache.py
+    python search.py "Python 教程" --no-cache
+    python search.py "Python 教程" --total 100 --jsonl                   # 分页获取 100 条，逐行输出 JSON
+    python search.py "Python 教程" --fetch --text-bytes 2000             # 同时抓取结果页正文，见 fetch.py
+    python search.py "Python 教程" --broker                              # 经本机搜索代理，见 broker.py
+    python search.py "Python 教程" --deadline 3 --retries 3              # 总期限 3 秒，见 policy.py
 """
 
-import re
+import os
+import sys
 import json
-import urllib.request
+import codecs
+import threading
 import urllib.parse
 import argparse
-from html import unescape
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional, Union
 
+from client import HTTPClient, StreamedResponse, ACCEPT_ENCODING, DEFAULT_RATE, DEFAULT_BURST
+from cache import ResponseCache, DEFAULT_TTL
+from extract import ResultExtractor
+from fetch import PageFetcher, DEFAULT_FETCH_WORKERS, PER_DOMAIN, TEXT_BYTES
+from policy import (LatencyPolicy, SearchError, HTTPStatusError, default_policy,
+                    DEFAULT_DEADLINE, DEFAULT_RETRIES)
 
-def search_bing(query: str, limit: int = 10) -> List[Dict[str, str]]:
+
+BING_URL = "https://www.bing.com/search"
+
+# 多查询模式的默认并发数
+DEFAULT_WORKERS = 4
+
+# 分页模式每页请求的结果数
+PAGE_SIZE = 10
+
+# 分页模式中页间重复时，最多额外请求的页数
+MAX_EXTRA_PAGES = 3
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': ACCEPT_ENCODING,
+}
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> HTTPClient:
+    """进程内共享的客户端，多次调用 search_bing 复用同一个连接池"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
+
+
+def search_bing(query: str, limit: int = 10, client: Optional[HTTPClient] = None,
+                endpoint: str = BING_URL, cache: Optional[ResponseCache] = None,
+                first: int = 1, broker=None,
+                policy: Optional[LatencyPolicy] = None) -> List[Dict[str, str]]:
     """
     使用 Bing 搜索
 
     Args:
         query: 搜索关键词
         limit: 返回结果数量
+        client: HTTP 客户端，默认使用进程内共享的连接池
+        endpoint: 搜索地址，可指向本地桩服务器
+        cache: 结果缓存，给出时未过期的查询直接返回缓存结果
+        first: 第一条结果的位置（从 1 开始），用于分页
+        broker: 搜索代理客户端（broker.BrokerClient），给出时经代理搜索，代理不可用时改为直接请求
+        policy: 总期限、重试与对冲策略，默认使用进程内共享的策略
 
     Returns:
-        搜索结果列表，每项包含 title、url、snippet
+        搜索结果列表，每项包含 title、url、snippet；空列表表示确实没有结果
+
+    Raises:
+        SearchError: 搜索失败（超过总期限、重试用尽或服务端错误），且没有可用的过期缓存
     """
+    if broker is not None and not broker.failed:
+        try:
+            return broker.search(query, limit, endpoint, first)
+        except OSError as e:
+            print(f"{e}，改为直接请求", file=sys.stderr)
+
+    cached = None
+    if cache is not None:
+        key = cache.key(query, limit, endpoint, first)
+        cached = cache.get(key)
+        if cached is not None and cached.fresh:
+            cache.record('hits')
+            return cached.results
+        cache.record('misses')
+
     # 编码搜索词
     encoded_query = urllib.parse.quote(query)
 
     # 构造请求
-    url = f"https://www.bing.com/search?q={encoded_query}&count={limit}"
+    url = f"{endpoint}?q={encoded_query}&count={limit}"
+    if first > 1:
+        url += f"&first={first}"
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-    }
+    headers = HEADERS
+    if cached is not None:
+        # 过期的缓存带条件请求头重新验证，未变化时服务端只回 304
+        headers = {**HEADERS, **cached.conditional_headers()}
 
-    request = urllib.request.Request(url, headers=headers)
+    def consume(response: StreamedResponse):
+        return response, None if response.status == 304 else read_results(response, limit)
 
     try:
-        with urllib.request.urlopen(request, timeout=10) as response:
-            html = response.read().decode('utf-8', errors='ignore')
-    except Exception as e:
-        print(f"搜索失败: {e}")
-        return []
-
-    # 解析结果
-    results = []
-
-    # Bing 搜索结果的正则模式
-    # 匹配搜索结果块
-    result_pattern = r'<li class="b_algo"[^>]*>(.*?)</li>'
-    result_blocks = re.findall(result_pattern, html, re.DOTALL)
-
-    for block in result_blocks[:limit]:
-        result = {}
-
-        # 提取标题和链接
-        title_pattern = r'<a[^>]*href="([^"]+)"[^>]*><h2>(.*?)</h2>'
-        title_match = re.search(title_pattern, block, re.DOTALL)
-
-        if title_match:
-            result['url'] = unescape(title_match.group(1))
-            # 清理标题中的 HTML 标签
-            title = re.sub(r'<[^>]+>', '', title_match.group(2))
-            result['title'] = unescape(title.strip())
-        else:
-            continue
+        response, results = (policy or default_policy()).stream(
+            client or default_client(), url, headers, consume)
+    except SearchError:
+        if cached is not None:
+            # 请求失败时沿用过期结果
+            cache.record('stale_served')
+            return cached.results
+        raise
+    if response.status == 304:
+        if cached is None:
+            raise HTTPStatusError(304)
+        cache.record('revalidated')
+        cache.renew(key)
+        return cached.results
+
+    # 空结果可能是验证码或拦截页，不缓存
+    if cache is not None and results:
+        cache.put(key, query, limit, endpoint, results,
+                  response.headers.get('etag'), response.headers.get('last-modified'))
+    return results
 
-        # 提取摘要
-        snippet_pattern = r'<div class="b_caption"[^>]*>.*?p>(.*?)"</p>'
-        snippet_match = re.search(snippet_pattern, block, re.DOTALL)
 
-        if snippet_match:
-            snippet = re.sub(r'<[^>]+>', '', snippet_match.group(1))
-            result['snippet'] = unescape(snippet.strip())
-        else:
-            # 尝试其他摘要模式
-            alt_snippet_pattern = r'<span>(.*?)"</span>'
-            alt_match = re.findall(alt_snippet_pattern, block)
-            if alt_match:
-                snippet = re.sub(r'<[^>]+>', '', alt_match[-1])
-                result['snippet'] = unescape(snippet.strip())
-            else:
-                result['snippet'] = ''
+def search_many(queries: List[str], limit: int = 10, workers: int = DEFAULT_WORKERS,
+                client: Optional[HTTPClient] = None, endpoint: str = BING_URL,
+                cache: Optional[ResponseCache] = None, broker=None,
+                policy: Optional[LatencyPolicy] = None) -> Dict[str, Union[List[Dict[str, str]],
+                                                                          SearchError]]:
+    """
+    并发执行多个查询，共享同一个连接池与按主机限速
 
-        results.append(result)
+    Args:
+        queries: 查询列表，重复的查询只请求一次
+        workers: 并发线程数
 
-    return results
+    Returns:
+        {查询: 结果列表}，按 queries 中首次出现的顺序；失败的查询对应 SearchError 而不是列表
+    """
+    client = client or default_client()
+    unique = list(dict.fromkeys(queries))
+
+    def one(query: str):
+        try:
+            return search_bing(query, limit, client, endpoint, cache, 1, broker, policy)
+        except SearchError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(unique, pool.map(one, unique)))
+
+
+def search_pages(query: str, total: int = 50, page_size: int = PAGE_SIZE,
+                 workers: int = DEFAULT_WORKERS, client: Optional[HTTPClient] = None,
+                 endpoint: str = BING_URL, cache: Optional[ResponseCache] = None,
+                 broker=None,
+                 policy: Optional[LatencyPolicy] = None) -> Iterator[Dict[str, str]]:
+    """
+    分页获取至多 total 条结果，逐条产出
+
+    按 first= 偏移同时请求至多 workers 页，按页序产出：第一页解析完即开始产出，
+    后面的页仍在下载。URL 相同（忽略片段与末尾斜杠）的结果只产出第一次出现的。
+    某页没有新结果时（已到末页）停止；某页搜索失败时，在它之前的结果产出之后抛出 SearchError。
+
+        for result in search_pages("Python 教程", total=100):
+            ...                           # 提前 break 时不再请求后续页
+
+    Yields:
+        结果，包含 title、url、snippet 与去重后的名次 rank
+    """
+    client = client or default_client()
+    workers = max(1, workers)
+    budget = -(-total // page_size)
+    max_pages = budget + MAX_EXTRA_PAGES
+    seen = set()
+    produced = 0
+    pending = deque()
+    next_page = 0
+    pool = ThreadPoolExecutor(max_workers=min(workers, max_pages))
+    try:
+        while produced < total:
+            while next_page < budget and len(pending) < workers:
+                pending.append(pool.submit(search_bing, query, page_size, client, endpoint,
+                                           cache, next_page * page_size + 1, broker, policy))
+                next_page += 1
+            if not pending:
+                break
+            fresh = 0
+            for result in pending.popleft().result():
+                key = _dedup_key(result['url'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                fresh += 1
+                produced += 1
+                yield {**result, 'rank': produced}
+                if produced >= total:
+                    return
+            if fresh == 0:
+                break
+            # 页间重复的结果不计数，少的部分由后面追加的页补足
+            if fresh < page_size and budget < max_pages:
+                budget += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def _dedup_key(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                                    parts.path.rstrip('/'), parts.query, ''))
+
+
+def read_results(response: StreamedResponse, limit: int) -> List[Dict[str, str]]:
+    """
+    边接收边解压、解码并解析结果页
+
+    结果块在响应体仍在到达时就被提取，取满 limit 条后不再解析。响应关闭时剩余部分较小则读完并复用连接，
+    较大时断开连接（见 client.DRAIN_BYTES）。
+    """
+    extractor = ResultExtractor(limit)
+    decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+    for chunk in response.iter_decoded():
+        if extractor.feed(decoder.decode(chunk)):
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+    return extractor.close()
+
+
+def fetch_many(fetcher: PageFetcher, results: Dict) -> Dict:
+    """抓取全部查询结果的正文；各查询的结果一起下载，跨查询重复的 URL 只下载一次；失败的查询原样保留"""
+    succeeded = {query: rs for query, rs in results.items() if not isinstance(rs, SearchError)}
+    unique = list({result['url']: result for rs in succeeded.values() for result in rs}.values())
+    pages = {record['url']: record for record in fetcher.fetch_all(unique)}
+    return {query: rs if query not in succeeded else
+            [{**pages[result['url']], **result} for result in rs]
+            for query, rs in results.items()}
+
+
+def report_error(query: str, error: SearchError):
+    print(f"搜索失败 [{query}] ({type(error).__name__}): {error}", file=sys.stderr)
+
+
+def error_record(error: SearchError) -> Dict:
+    """失败的查询在 -o 输出中的表示"""
+    record = {'error': str(error), 'error_type': type(error).__name__}
+    if isinstance(error, HTTPStatusError):
+        record['status'] = error.status
+    return record
+
+
+def read_queries(path: str) -> List[str]:
+    """查询文件，每行一个，忽略空行；- 表示标准输入"""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def print_results(results: List[Dict[str, str]]):
+    if not results:
+        print("未找到搜索结果")
+        return
+
+    for i, result in enumerate(results, 1):
+        print_result(i, result)
+
+
+def print_result(i: int, result: Dict[str, str]):
+    print(f"\n{i}. {result['title']}")
+    print(f"   URL: {result['url']}")
+    if result.get('snippet'):
+        snippet = result['snippet'][:150] + '...' if len(result['snippet']) > 150 else result['snippet']
+        print(f"   摘要: {snippet}")
+    if result.get('error'):
+        print(f"   抓取失败: {result['error']}")
+    elif result.get('text'):
+        text = " ".join(result['text'].split())
+        print(f"   正文: {text[:200] + '...' if len(text) > 200 else text}")
+
+
+def stream_pages(queries: List[str], args, client: HTTPClient, cache: Optional[ResponseCache],
+                 fetcher: Optional[PageFetcher] = None, broker=None,
+                 policy: Optional[LatencyPolicy] = None) -> Dict:
+    """
+    分页模式：逐个查询分页获取，每条结果解析出来（给出 fetcher 时抓取完正文）就输出
+
+    Returns:
+        {查询: 结果列表}；中途失败的查询对应 SearchError，失败前的结果已经输出
+    """
+    collected = {}
+    for query in queries:
+        if not args.jsonl:
+            print("\n" + "=" * 60)
+            print(f"查询: {query}")
+            print("-" * 60)
+        results = collected[query] = []
+        source = search_pages(query, args.total, args.page_size, args.workers, client,
+                              args.endpoint, cache, broker, policy)
+        if fetcher is not None:
+            source = fetcher.fetch_all(source)
+        try:
+            for result in source:
+                results.append(result)
+                if args.jsonl:
+                    print(json.dumps({'query': query, **result}, ensure_ascii=False), flush=True)
+                else:
+                    print_result(result['rank'], result)
+                    sys.stdout.flush()
+        except SearchError as e:
+            report_error(query, e)
+            collected[query] = e
+            continue
+        if not results and not args.jsonl:
+            print("未找到搜索结果")
+    return collected
 
 
 def main():
     parser = argparse.ArgumentParser(description='Bing 搜索工具')
-    parser.add_argument('query', help='搜索关键词')
+    parser.add_argument('query', nargs='*', help='搜索关键词，可给出多个')
+    parser.add_argument('--queries-file', '-f', help='查询文件，每行一个 (- 为标准输入)')
     parser.add_argument('--limit', '-l', type=int, default=10,
                         help='返回结果数量 (默认: 10)')
     parser.add_argument('--output', '-o', help='输出 JSON 文件')
+    parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS,
+                        help=f'多个查询或分页的并发数 (默认: {DEFAULT_WORKERS})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'每个主机每秒请求数，0 为不限速 (默认: {DEFAULT_RATE})')
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST,
+                        help=f'限速允许的突发请求数 (默认: {DEFAULT_BURST})')
+    parser.add_argument('--endpoint', default=BING_URL, help='搜索地址 (默认: Bing)')
+    parser.add_argument('--no-cache', action='store_true', help='不读写结果缓存')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL,
+                        help=f'缓存有效期（秒，默认: {DEFAULT_TTL}）')
+    parser.add_argument('--cache-dir', help='缓存目录 (默认: ~/.cache/bing-search)')
+    parser.add_argument('--total', '-n', type=int,
+                        help='分页获取至多 N 条去重后的结果，边下载边输出')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE,
+                        help=f'分页模式每页结果数 (默认: {PAGE_SIZE})')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='每条结果输出一行 JSON（含 query 字段），不输出其他信息')
+    parser.add_argument('--broker', nargs='?', const='', metavar='SOCKET',
+                        help='经本机搜索代理搜索（见 broker.py），设置 $BING_SEARCH_BROKER 时默认启用')
+    parser.add_argument('--no-broker', action='store_true', help='不经搜索代理，直接请求')
+    parser.add_argument('--deadline', type=float, default=DEFAULT_DEADLINE,
+                        help=f'每次搜索的总期限（秒，含重试与对冲，默认: {DEFAULT_DEADLINE:g}）')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'失败后最多重试次数 (默认: {DEFAULT_RETRIES})')
+    parser.add_argument('--hedge-after', type=float,
+                        help='请求超过此秒数仍未返回时发出对冲请求 (默认: 近期请求的 p95 耗时)')
+    parser.add_argument('--no-hedge', action='store_true', help='不发出对冲请求')
+    parser.add_argument('--fetch', action='store_true',
+                        help='抓取每条结果的网页，提取正文加入 text 字段')
+    parser.add_argument('--fetch-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                        help=f'同时抓取的网页数 (默认: {DEFAULT_FETCH_WORKERS})')
+    parser.add_argument('--per-domain', type=int, default=PER_DOMAIN,
+                        help=f'抓取时每个域名的最大并发连接数 (默认: {PER_DOMAIN})')
+    parser.add_argument('--text-bytes', type=int, default=TEXT_BYTES,
+                        help=f'每条结果正文的字节预算 (默认: {TEXT_BYTES})')
 
     args = parser.parse_args()
 
-    print(f"正在搜索: {args.query}")
-    print("-" * 60)
+    queries = list(args.query)
+    if args.queries_file:
+        queries += read_queries(args.queries_file)
+    if not queries:
+        parser.error("需要搜索关键词或 --queries-file")
 
-    results = search_bing(args.query, args.limit)
+    broker = None
+    if not args.no_broker and (args.broker is not None or os.environ.get('BING_SEARCH_BROKER')):
+        # 代理模块依赖本模块，用到时才导入
+        from broker import BrokerClient
+        broker = BrokerClient(args.broker or None)
 
-    if not results:
-        print("未找到搜索结果")
-        return
+    # 经代理时由代理持有缓存
+    cache = None if args.no_cache or broker else ResponseCache(args.cache_dir, args.cache_ttl)
+    client = HTTPClient(max_per_host=max(1, args.workers), rate=args.rate, burst=args.burst)
+    policy = LatencyPolicy(args.deadline, args.retries, hedge=not args.no_hedge,
+                           hedge_after=args.hedge_after)
+    fetcher = None
+    if args.fetch:
+        fetcher = PageFetcher(workers=args.fetch_workers, per_domain=args.per_domain,
+                              text_bytes=args.text_bytes)
+    try:
+        if args.total:
+            results = stream_pages(queries, args, client, cache, fetcher, broker, policy)
+        else:
+            if not args.jsonl:
+                if len(queries) == 1:
+                    print(f"正在搜索: {queries[0]}")
+                    print("-" * 60)
+                else:
+                    print(f"正在搜索 {len(queries)} 个查询 (并发 {args.workers})")
+            results = search_many(queries, args.limit, args.workers, client, args.endpoint,
+                                  cache, broker, policy)
+            if fetcher is not None:
+                results = fetch_many(fetcher, results)
+            for query, query_results in results.items():
+                if isinstance(query_results, SearchError):
+                    report_error(query, query_results)
+                elif args.jsonl:
+                    for result in query_results:
+                        print(json.dumps({'query': query, **result}, ensure_ascii=False))
+                else:
+                    if len(results) > 1:
+                        print("\n" + "=" * 60)
+                        print(f"查询: {query}")
+                        print("-" * 60)
+                    print_results(query_results)
+    finally:
+        client.close()
+        if fetcher is not None:
+            fetcher.close()
+        if cache is not None:
+            cache.close()
 
-    # 输出结果
-    for i, result in enumerate(results, 1):
-        print(f"\n{i}. {result['title']}")
-        print(f"   URL: {result['url']}")
-        if result.get('snippet'):
-            snippet = result['snippet'][:150] + '...' if len(result['snippet']) > 150 else result['snippet']
-            print(f"   摘要: {snippet}")
+    failed = [query for query, rs in results.items() if isinstance(rs, SearchError)]
 
-    # 保存到文件
+    # 保存到文件；多个查询时为 {查询: 结果列表}，失败的查询为 {error, error_type}
     if args.output:
+        saved = {query: error_record(rs) if isinstance(rs, SearchError) else rs
+                 for query, rs in results.items()}
+        if len(queries) == 1:
+            saved = saved[queries[0]]
         with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"\n结果已保存到: {args.output}")
+            json.dump(saved, f, ensure_ascii=False, indent=2)
+        if not args.jsonl:
+            print(f"\n结果已保存到: {args.output}")
+
+    # 搜索失败与没有结果区分：有查询失败时以非零状态退出
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
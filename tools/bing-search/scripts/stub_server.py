@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Bing 桩服务器
+在本地模拟 Bing 搜索结果页，用于在不访问外网的情况下验证 search.py 的并发、连接复用与限速
+
+    GET /search?q=<查询>&count=<数量>[&first=<位置>]
+                                        按 Bing 结果页的标记返回确定性的结果，带 ETag，
+                                        If-None-Match 一致时返回 304
+    GET /page/<查询>/<序号>             结果链接指向的正文页，正文外有导航、脚本、侧栏与页脚
+    GET /stats                          已接受的连接数、请求数、304 次数、正文页请求数、
+                                        同时处理的最大请求数、压缩的响应数与发送的字节数（JSON）
+
+可以在 /search 上注入故障（按给定比例随机，种子固定时可复现）:
+    error       返回 503（retry_after 给出时带 Retry-After 头）
+    slow        延迟 slow_delay 秒后正常返回，模拟长尾延迟
+    reset       不返回响应直接断开连接
+
+服务端使用 HTTP/1.1 keep-alive，客户端复用连接时连接数远小于请求数。
+请求带 Accept-Encoding 时按 br（已安装 brotli 时）、gzip、deflate 的顺序压缩响应体。
+tail 在结果列表之后附加页面脚本（Bing 结果页在结果之后还有大段脚本与页脚），
+trickle 把响应体分块发送、块间等待，模拟慢速传输，用于观察边接收边解析与取满后提前断开。
+
+用法:
+    python stub_server.py --port 8765
+    python stub_server.py --port 8765 --delay 50          # 每个请求延迟 50 毫秒
+    python stub_server.py --available 120 --overlap 2     # 共 120 条结果，分页间重复 2 条
+    python stub_server.py --error-rate 0.2 --slow-rate 0.1 --slow-delay 3000 --reset-rate 0.05
+    python stub_server.py --tail 200 --trickle 20         # 结果后附加 200KB 脚本，每 8KB 等待 20 毫秒
+    python stub_server.py --no-compress
+    python search.py "测试" --endpoint http://127.0.0.1:8765/search
+"""
+
+import sys
+import gzip
+import json
+import zlib
+import hashlib
+import time
+import random
+import threading
+import argparse
+import urllib.parse
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, NamedTuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# trickle 时每次发送的字节数
+TRICKLE_CHUNK = 8 * 1024
+
+
+def result_page(query: str, count: int, host: str, first: int = 1, available: int = 1000,
+                overlap: int = 0, tail: int = 0) -> str:
+    """
+    查询对应的结果页，相同参数总是返回相同内容
+
+    Args:
+        first: 第一条结果的位置（从 1 开始）
+        available: 查询共有的结果数，超出后返回空页
+        overlap: 第二页起重复上一页末尾的结果数，模拟 Bing 分页间的重复
+        tail: 结果列表之后附加的脚本字节数
+    """
+    slug = urllib.parse.quote(query, safe='')
+    start = first - 1
+    if start > 0:
+        start = max(0, start - overlap)
+    items = []
+    for i in range(start, min(start + count, available)):
+        url = f"http://{host}/page/{slug}/{i}"
+        title = f"{escape(query)} 结果 {i + 1}"
+        # 交替使用当前版本 <h2><a> 与旧版本 <a><h2> 两种标记
+        heading = (f'<h2><a href="{url}" target="_blank">{title}</a></h2>' if i % 2 == 0
+                   else f'<a href="{url}" target="_blank"><h2>{title}</h2></a>')
+        items.append(
+            f'<li class="b_algo" data-rank="{i + 1}">{heading}'
+            f'<div class="b_caption"><p>关于 {escape(query)} 的第 {i + 1} 条摘要</p></div>'
+            f'</li>')
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>'
+            f'{escape(query)} - 搜索</title></head><body><ol id="b_results">'
+            + "".join(items) + '</ol>' + _page_tail(tail) + '</body></html>')
+
+
+def _page_tail(size: int) -> str:
+    """结果之后的相关搜索、页脚与脚本，约 size 字节"""
+    if size <= 0:
+        return ""
+    line = 'window._w.push({"id":"%06d","t":"instrumentation","v":[1,2,3,4,5,6,7,8]});\n'
+    script = "".join(line % i for i in range(size // len(line % 0) + 1))[:size]
+    return ('<div id="b_related"><h2>相关搜索</h2></div>'
+            '<footer id="b_footer">© 桩服务器</footer>'
+            f'<script>{script}</script>')
+
+
+def _compress(body: bytes, accept_encoding: str):
+    """按 Accept-Encoding 选择编码并压缩，返回 (编码, 压缩后的数据)，不压缩时编码为 None"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().lower().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            accepted.add(name)
+    if 'br' in accepted and brotli is not None:
+        return 'br', brotli.compress(body)
+    if 'gzip' in accepted:
+        return 'gzip', gzip.compress(body, compresslevel=6)
+    if 'deflate' in accepted:
+        return 'deflate', zlib.compress(body, 6)
+    return None, body
+
+
+def article_page(slug: str, index: int, paragraphs: int = 40) -> str:
+    """结果链接指向的正文页：导航、脚本、侧栏与页脚包围一篇 <article>"""
+    topic = escape(urllib.parse.unquote(slug))
+    body = "".join(
+        f'<p>{topic} 第 {index + 1} 篇第 {n + 1} 段：这一段正文用于验证抓取与正文提取，'
+        f'包含 &lt;转义&gt; 字符与 <a href="/x">链接</a> 文字。</p>'
+        for n in range(paragraphs))
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<title>{topic} 文章 {index + 1}</title>'
+            '<style>body { font: 14px sans-serif } .nav { display: flex }</style>'
+            '<script>window.analytics = { track: function () { return "不应出现在正文中"; } };</script>'
+            '</head><body>'
+            '<header><nav class="nav"><a href="/">首页</a><a href="/about">关于</a></nav></header>'
+            f'<main><article><h1>{topic} 文章 {index + 1}</h1>{body}</article></main>'
+            '<aside>相关推荐：侧栏内容</aside>'
+            '<footer>© 桩服务器 版权所有</footer></body></html>')
+
+
+class Faults(NamedTuple):
+    """/search 上注入故障的比例"""
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    reset_rate: float = 0.0
+    slow_delay: float = 2.0       # 秒
+    seed: int = 0
+    retry_after: Optional[float] = None     # 503 响应的 Retry-After（秒），None 为不带
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """桩服务器的请求处理"""
+
+    protocol_version = "HTTP/1.1"
+
+    # 响应头与响应体分两次写出，关闭 Nagle 算法以免与客户端的延迟确认叠加出约 40 毫秒的等待
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def do_GET(self):
+        self.server.count('requests')
+        self.server.enter()
+        try:
+            self._get()
+        finally:
+            self.server.leave()
+
+    def _get(self):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        parts = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(parts.query)
+        if parts.path == '/stats':
+            self._send(200, json.dumps(self.server.stats()).encode('utf-8'), 'application/json')
+        elif parts.path == '/search':
+            fault = self.server.draw_fault()
+            if fault == 'reset':
+                self.close_connection = True
+                return
+            if fault == 'error':
+                retry_after = self.server.faults.retry_after
+                self._send(503, b'service unavailable', 'text/plain',
+                           {'Retry-After': f'{retry_after:g}'} if retry_after is not None else None)
+                return
+            if fault == 'slow':
+                time.sleep(self.server.faults.slow_delay)
+            query = params.get('q', [''])[0]
+            count = int(params.get('count', ['10'])[0])
+            first = int(params.get('first', ['1'])[0])
+            body = result_page(query, count, self.headers.get('Host', 'localhost'), first,
+                               self.server.available, self.server.overlap,
+                               self.server.tail).encode('utf-8')
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.server.count('not_modified')
+                self._send(304, b'', None, {'ETag': etag})
+            else:
+                self._send(200, body, 'text/html; charset=utf-8', {'ETag': etag})
+        elif parts.path.startswith('/page/'):
+            _, _, slug, index = parts.path.split('/', 3)
+            self.server.count('pages')
+            body = article_page(slug, int(index)).encode('utf-8')
+            self._send(200, body, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def _send(self, status: int, body: bytes, content_type: Optional[str],
+              headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status == 200 and body and self.server.compress:
+            encoding, body = _compress(body, self.headers.get('Accept-Encoding', ''))
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+                self.server.count('compressed')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not self.server.trickle:
+            self.wfile.write(body)
+            self.server.count('bytes_sent', len(body))
+            return
+        for i in range(0, len(body), TRICKLE_CHUNK):
+            if i:
+                time.sleep(self.server.trickle)
+            self.wfile.write(body[i:i + TRICKLE_CHUNK])
+            self.wfile.flush()
+            self.server.count('bytes_sent', len(body[i:i + TRICKLE_CHUNK]))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    可在进程内启动的桩服务器
+
+        with StubServer() as server:
+            search_bing("测试", endpoint=server.endpoint)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0, host: str = '127.0.0.1',
+                 available: int = 1000, overlap: int = 0, faults: Optional[Faults] = None,
+                 compress: bool = True, tail: int = 0, trickle: float = 0):
+        """
+        Args:
+            port: 监听端口，0 为随机空闲端口
+            delay: 每个请求的延迟（秒）
+            available: 每个查询共有的结果数
+            overlap: 分页时第二页起与上一页重复的结果数
+            faults: /search 上注入的故障，默认不注入
+            compress: 是否按 Accept-Encoding 压缩响应体
+            tail: 结果页在结果列表之后附加的脚本字节数
+            trickle: 分块发送响应体时每块（8KB）之间的等待（秒），0 为一次发送
+        """
+        super().__init__((host, port), StubHandler)
+        self.delay = delay
+        self.available = available
+        self.overlap = overlap
+        self.faults = faults or Faults()
+        self.compress = compress
+        self.tail = tail
+        self.trickle = trickle
+        self._random = random.Random(self.faults.seed)
+        self._counters = {'connections': 0, 'requests': 0, 'not_modified': 0, 'pages': 0,
+                          'max_active': 0, 'errors': 0, 'slow': 0, 'resets': 0,
+                          'compressed': 0, 'bytes_sent': 0}
+        self._active = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/search"
+
+    def count(self, name: str, n: int = 1):
+        with self._counter_lock:
+            self._counters[name] += n
+
+    def draw_fault(self) -> Optional[str]:
+        """按比例抽取本次请求的故障，None 表示正常"""
+        faults = self.faults
+        with self._counter_lock:
+            x = self._random.random()
+            for name, rate, counter in (('error', faults.error_rate, 'errors'),
+                                        ('slow', faults.slow_rate, 'slow'),
+                                        ('reset', faults.reset_rate, 'resets')):
+                if x < rate:
+                    self._counters[counter] += 1
+                    return name
+                x -= rate
+        return None
+
+    def enter(self):
+        with self._counter_lock:
+            self._active += 1
+            self._counters['max_active'] = max(self._counters['max_active'], self._active)
+
+    def leave(self):
+        with self._counter_lock:
+            self._active -= 1
+
+    def handle_error(self, request, client_address):
+        # 客户端读够之后提前断开是预期行为
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self._counters)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bing 桩服务器')
+    parser.add_argument('--port', '-p', type=int, default=8765, help='监听端口 (默认: 8765)')
+    parser.add_argument('--delay', type=float, default=0, help='每个请求的延迟（毫秒）')
+    parser.add_argument('--available', type=int, default=1000,
+                        help='每个查询共有的结果数 (默认: 1000)')
+    parser.add_argument('--overlap', type=int, default=0,
+                        help='分页时与上一页重复的结果数 (默认: 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='返回 503 的比例')
+    parser.add_argument('--slow-rate', type=float, default=0, help='延迟返回的比例')
+    parser.add_argument('--slow-delay', type=float, default=2000,
+                        help='延迟返回时的延迟（毫秒，默认: 2000）')
+    parser.add_argument('--reset-rate', type=float, default=0, help='直接断开连接的比例')
+    parser.add_argument('--seed', type=int, default=0, help='故障抽取的随机种子')
+    parser.add_argument('--retry-after', type=float, help='503 响应附带的 Retry-After（秒）')
+    parser.add_argument('--no-compress', action='store_true', help='不压缩响应体')
+    parser.add_argument('--tail', type=int, default=0,
+                        help='结果页在结果之后附加的脚本大小（KB，默认: 0）')
+    parser.add_argument('--trickle', type=float, default=0,
+                        help='分块发送响应体，每 8KB 之间等待的毫秒数 (默认: 0)')
+
+    args = parser.parse_args()
+
+    faults = Faults(args.error_rate, args.slow_rate, args.reset_rate, args.slow_delay / 1000,
+                    args.seed, args.retry_after)
+    server = StubServer(args.port, args.delay / 1000, available=args.available,
+                        overlap=args.overlap, faults=faults, compress=not args.no_compress,
+                        tail=args.tail * 1024, trickle=args.trickle / 1000)
+    print(f"桩服务器已启动: {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+记忆基准测试
+在合成语料（见 corpus.py）上测量捕获吞吐、回忆延迟与整合耗时，结果可存为 JSON 供回归对比
+
+每个规模依次执行:
+    capture      前 --capture-sample 条经 capture_batch 批量写入，计算吞吐；
+                 其余按日志格式直接生成（SQLite 后端经 import 导入），随后测单条 capture 延迟
+    recall       首次回忆（含补建索引）单独计时，之后按相关度/日期排序各跑一组查询，取 p50/p99
+    consolidate  首次整合（解析全部日志、计算签名）与紧接着的增量整合
+
+用法:
+    python benchmark.py                                   # 1k、10k 两档，约半分钟内完成
+    python benchmark.py --sizes 1k,10k --json bench.json
+    python benchmark.py --sizes 1k,100k,1m                # 1m 档耗时以小时计，需显式指定
+    python benchmark.py --sizes 100k --steps capture,recall --baseline bench.json
+    python benchmark.py --sizes 10k --backend sqlite --queries 500
+"""
+
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from corpus import CorpusGenerator, write_corpus, parse_size
+from metrics import percentile, summarize
+from protocol import BACKENDS
+from capture import MemoryCapture, BATCH_SIZE
+from recall import MemoryRecall
+from consolidate import MemoryConsolidate
+
+
+STEPS = ['capture', 'recall', 'consolidate']
+
+# 合成语料覆盖的天数上限，条目更多时加大每天的条数
+CORPUS_DAYS = 730
+
+
+class _Collector:
+    """收集计量记录的 sink"""
+
+    def __init__(self):
+        self.records = []
+
+    def observe(self, record: Dict):
+        self.records.append(record)
+
+
+class MemoryBenchmark:
+    """记忆基准测试"""
+
+    def __init__(self, workdir: str, backend: str = "markdown", seed: int = 1,
+                 queries: int = 200, capture_sample: int = 10000, singles: int = 100,
+                 steps: Optional[List[str]] = None, generator_options: Optional[Dict] = None):
+        """
+        Args:
+            workdir: 工作目录，每个规模一个子目录，测试前清空
+            backend: 存储后端
+            seed: 语料与查询的随机种子
+            queries: 每种排序方式的查询数
+            capture_sample: 经 capture_batch 写入、用于计算吞吐的条目数
+            singles: 测单条 capture 延迟的次数
+            steps: 执行的步骤，默认全部
+            generator_options: 传给 CorpusGenerator 的其他参数
+        """
+        self.workdir = Path(workdir)
+        self.backend = backend
+        self.seed = seed
+        self.queries = queries
+        self.capture_sample = capture_sample
+        self.singles = singles
+        self.steps = steps or STEPS
+        self.generator_options = generator_options or {}
+
+    def run(self, size: int) -> Dict:
+        """测试一个规模，返回指标字典（耗时单位为秒）"""
+        memory_dir = self.workdir / f"{self.backend}-{size}"
+        if memory_dir.exists():
+            shutil.rmtree(memory_dir)
+        memory_dir.mkdir(parents=True)
+
+        result = {'size': size, 'backend': self.backend}
+        generator = CorpusGenerator(self.seed, **self.generator_options)
+        per_day = max(20, -(-size // CORPUS_DAYS))
+        days = generator.days(size, per_day)
+
+        collector = _Collector()
+        capture = MemoryCapture(str(memory_dir), self.backend, metric_sinks=[collector])
+        try:
+            self._load(capture, days, memory_dir, result)
+            if 'capture' in self.steps:
+                self._capture_singles(capture, generator, result)
+        finally:
+            capture.store.close()
+
+        if 'recall' in self.steps:
+            recall = MemoryRecall(str(memory_dir), self.backend, metric_sinks=[collector])
+            try:
+                self._recall(recall, generator, result)
+            finally:
+                recall.store.close()
+
+        if 'consolidate' in self.steps:
+            consolidate = MemoryConsolidate(str(memory_dir), self.backend,
+                                            metric_sinks=[collector])
+            try:
+                start = time.perf_counter()
+                report = consolidate.consolidate()
+                result['consolidate_first'] = time.perf_counter() - start
+                result['duplicates_removed'] = report['duplicates_removed']
+                start = time.perf_counter()
+                consolidate.consolidate()
+                result['consolidate_again'] = time.perf_counter() - start
+            finally:
+                consolidate.store.close()
+
+        result['phases'] = {op: info['phases'] for op, info in
+                            summarize(collector.records).items()}
+        return result
+
+    def _load(self, capture: MemoryCapture, days, memory_dir: Path, result: Dict):
+        """写入语料：先经 capture_batch 计算吞吐，其余直接生成"""
+        sample = self.capture_sample if 'capture' in self.steps else 0
+        captured = 0
+        elapsed = 0.0
+        batch = []
+
+        def flush():
+            nonlocal captured, elapsed
+            start = time.perf_counter()
+            capture.capture_batch(batch)
+            elapsed += time.perf_counter() - start
+            captured += len(batch)
+            batch.clear()
+
+        # 按整天取用，捕获的日期与之后直接生成的日期不重叠
+        while captured + len(batch) < sample:
+            day = next(days, None)
+            if day is None:
+                break
+            batch.extend(day[1])
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        if captured:
+            result['captured'] = captured
+            result['capture_rate'] = captured / elapsed if elapsed else 0.0
+
+        # 余下的日期直接写成日志
+        start = time.perf_counter()
+        if self.backend == "sqlite":
+            with tempfile.TemporaryDirectory(dir=self.workdir) as staging:
+                write_corpus(staging, days)
+                capture.store.import_markdown(staging)
+        else:
+            write_corpus(str(memory_dir), days)
+        result['load'] = time.perf_counter() - start
+
+    def _capture_singles(self, capture: MemoryCapture, generator: CorpusGenerator,
+                         result: Dict):
+        """在已有语料上逐条 capture 的延迟"""
+        latencies = []
+        for _ in range(self.singles):
+            record = generator.record("", "")
+            start = time.perf_counter()
+            capture.capture(record['content'], record['category'], record['tags'])
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        result['capture_p50'] = percentile(latencies, 50)
+        result['capture_p99'] = percentile(latencies, 99)
+
+    def _recall(self, recall: MemoryRecall, generator: CorpusGenerator, result: Dict):
+        queries = generator.queries(self.queries)
+
+        # 首次回忆补建索引（markdown 后端），单独计时
+        start = time.perf_counter()
+        recall.recall(queries[0], limit=5)
+        result['recall_cold'] = time.perf_counter() - start
+
+        for sort, prefix in (("relevance", "recall"), ("date", "recall_date")):
+            latencies = []
+            hits = 0
+            for query in queries:
+                start = time.perf_counter()
+                hits += len(recall.recall(query, limit=5, sort=sort))
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            result[f'{prefix}_p50'] = percentile(latencies, 50)
+            result[f'{prefix}_p99'] = percentile(latencies, 99)
+            result[f'{prefix}_hits'] = hits / len(queries)
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.2f}ms"
+
+
+def print_result(result: Dict, baseline: Optional[Dict] = None):
+    def delta(key):
+        if not baseline or key not in baseline or key not in result or not baseline[key]:
+            return ""
+        change = result[key] / baseline[key] - 1
+        return f" ({change:+.0%})"
+
+    print(f"规模 {result['size']:,} 条  [{result['backend']}]")
+    if 'capture_rate' in result:
+        print(f"  捕获吞吐      {result['capture_rate']:,.0f} 条/秒"
+              f"（{result['captured']:,} 条，capture_batch）{delta('capture_rate')}")
+    print(f"  语料载入      {result['load']:.2f}s")
+    if 'capture_p50' in result:
+        print(f"  单条捕获      p50 {_ms(result['capture_p50'])}{delta('capture_p50')}"
+              f"  p99 {_ms(result['capture_p99'])}{delta('capture_p99')}")
+    if 'recall_cold' in result:
+        print(f"  首次回忆      {_ms(result['recall_cold'])}{delta('recall_cold')}（含补建索引）")
+        print(f"  回忆/相关度   p50 {_ms(result['recall_p50'])}{delta('recall_p50')}"
+              f"  p99 {_ms(result['recall_p99'])}{delta('recall_p99')}"
+              f"  平均命中 {result['recall_hits']:.1f}")
+        print(f"  回忆/日期     p50 {_ms(result['recall_date_p50'])}{delta('recall_date_p50')}"
+              f"  p99 {_ms(result['recall_date_p99'])}{delta('recall_date_p99')}")
+    if 'consolidate_first' in result:
+        print(f"  整合          首次 {result['consolidate_first']:.2f}s"
+              f"{delta('consolidate_first')}  增量 {result['consolidate_again']:.2f}s"
+              f"{delta('consolidate_again')}  移除重复 {result['duplicates_removed']}")
+    for op, phases in result.get('phases', {}).items():
+        top = sorted(phases.items(), key=lambda p: p[1], reverse=True)[:4]
+        print(f"  {op:<13} 平均阶段耗时 " + "  ".join(f"{k} {_ms(v)}" for k, v in top))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆基准测试')
+    parser.add_argument('--sizes', default='1k,10k',
+                        help='语料规模，逗号分隔，100k/1m 需显式指定 (默认: 1k,10k)')
+    parser.add_argument('--steps', default=','.join(STEPS),
+                        help=f'执行的步骤，逗号分隔 (默认: {",".join(STEPS)})')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--workdir', '-w',
+                        help='工作目录 (默认: 临时目录，结束后删除)')
+    parser.add_argument('--queries', '-q', type=int, default=200,
+                        help='每种排序方式的查询数 (默认: 200)')
+    parser.add_argument('--capture-sample', type=int, default=10000,
+                        help='经 capture_batch 写入的条目数 (默认: 10000)')
+    parser.add_argument('--cjk', type=float, default=0.6, help='CJK 词比例 (默认: 0.6)')
+    parser.add_argument('--dup-rate', type=float, default=0.05, help='重复条目比例 (默认: 0.05)')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='与之前 --json 保存的结果对比')
+
+    args = parser.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(',') if s.strip()]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        parser.error(f"未知的步骤: {', '.join(sorted(unknown))}")
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {(r['backend'], r['size']): r for r in json.load(f)['results']}
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="memory-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    benchmark = MemoryBenchmark(str(workdir), args.backend, args.seed, args.queries,
+                                args.capture_sample, steps=steps,
+                                generator_options={'cjk_ratio': args.cjk,
+                                                   'dup_rate': args.dup_rate})
+    results = []
+    try:
+        for size in sizes:
+            result = benchmark.run(size)
+            results.append(result)
+            print_result(result, baseline.get((args.backend, size)))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'generated': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"✓ 结果已保存到: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+回忆结果的上下文预算
+按 token 或字符预算贪心装入得分最高的条目，每条只保留命中词附近的片段
+
+条目的代价按输出的紧凑行计算: [日期 时间] 分类 #标签: 片段
+token 数为估算值：CJK 字符各计 1，其余字符每 4 个计 1。
+
+倒排索引中记录了每个条目内容（去掉来源、标签行）的字符数，读取条目之前即可得到代价下限，
+剩余预算必然放不下的候选不必读取。
+"""
+
+import re
+import math
+from typing import List, Dict, Optional
+
+
+BUDGET_UNITS = ['tokens', 'chars']
+
+# 默认片段窗口（字符）
+SNIPPET_CHARS = 240
+
+# 剩余预算少于此值（按单位）时停止装入
+MIN_COST = 16
+
+# 连续这么多条读取后放不下时停止装入，避免为填满零头读遍全部候选
+MAX_MISSES = 8
+
+# 输出行头部 "[YYYY-MM-DD HH:MM] CATEGORY: " 的最少字符数
+HEADER_CHARS = 24
+
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+# 条目正文中的字段行
+_FIELD = re.compile(r'^\*\*(内容|来源|标签)\*\*:\s*', re.MULTILINE)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：CJK 字符各计 1，其余字符每 4 个计 1"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def plain_content(content: str) -> str:
+    """条目正文去掉来源/标签行与字段标记，合并为一行"""
+    parts = []
+    keep = True
+    last = 0
+    for match in _FIELD.finditer(content):
+        if keep:
+            parts.append(content[last:match.start()])
+        keep = match.group(1) == '内容'
+        last = match.end()
+    if keep:
+        parts.append(content[last:])
+    return " ".join(" ".join(parts).split())
+
+
+def snippet(text: str, terms: List[str], window: int = SNIPPET_CHARS) -> str:
+    """
+    取覆盖最多不同查询词的 window 个字符，截断处加省略号
+
+    没有命中（如语义检索）时取开头。
+    """
+    if len(text) <= window:
+        return text
+
+    lowered = text.lower()
+    positions = sorted((m.start(), term) for term in set(terms) if term
+                       for m in re.finditer(re.escape(term), lowered))
+    best_start, best_count = 0, 0
+    for pos, _ in positions:
+        # 命中词前留出四分之一窗口作为上下文
+        start = max(0, min(pos - window // 4, len(text) - window))
+        covered = {term for p, term in positions if start <= p and p + len(term) <= start + window}
+        if len(covered) > best_count:
+            best_start, best_count = start, len(covered)
+
+    start, end = best_start, best_start + window
+    # 避免从英文单词中间截断
+    if start > 0 and text[start - 1].isalnum() and text[start].isascii():
+        space = text.find(" ", start, start + 16)
+        if space != -1:
+            start = space + 1
+    if end < len(text) and text[end - 1].isascii() and text[end].isalnum():
+        space = text.rfind(" ", end - 16, end)
+        if space > start:
+            end = space
+    return ("…" if start > 0 else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+def render(entry: Dict) -> str:
+    """条目的紧凑输出行"""
+    tags = "".join(f" #{tag}" for tag in entry.get('tags') or [])
+    text = entry.get('snippet')
+    if text is None:
+        text = plain_content(entry['content'])
+    return f"[{entry['date']} {entry['time']}] {entry['category']}{tags}: {text}"
+
+
+class ContextBudget:
+    """一次回忆的预算，装入的条目带 snippet 与 cost"""
+
+    def __init__(self, limit: int, unit: str = "tokens", window: int = SNIPPET_CHARS,
+                 terms: Optional[List[str]] = None):
+        """
+        Args:
+            limit: 预算
+            unit: tokens 或 chars
+            window: 片段窗口字符数
+            terms: 定位片段用的查询词（小写）
+        """
+        if unit not in BUDGET_UNITS:
+            raise ValueError(f"未知的预算单位: {unit}")
+        self.limit = limit
+        self.unit = unit
+        self.window = window
+        self.terms = terms or []
+        self.used = 0
+        self.misses = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.limit - self.used
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining < min(MIN_COST, self.limit) or self.misses >= MAX_MISSES
+
+    def measure(self, text: str) -> int:
+        return estimate_tokens(text) if self.unit == "tokens" else len(text)
+
+    def bound(self, chars: int) -> int:
+        """
+        内容为 chars 个字符（plain_content 之后）的条目的代价下限，用于读取前跳过放不下的候选
+
+        片段截断时最少保留 window - 32 个字符，另加输出行头部；标签不计入，
+        下限偏小只会多读候选，不会漏装。token 估算每个字符至少计 1/4。
+        """
+        chars = HEADER_CHARS + min(chars, self.window - 32)
+        return chars // 4 if self.unit == "tokens" else chars
+
+    def take(self, entry: Dict) -> bool:
+        """为条目生成片段并计入预算，放不下时返回 False"""
+        entry['snippet'] = snippet(plain_content(entry['content']), self.terms, self.window)
+        cost = self.measure(render(entry))
+        if cost > self.remaining:
+            self.misses += 1
+            return False
+        entry['cost'] = cost
+        self.used += cost
+        self.misses = 0
+        return True
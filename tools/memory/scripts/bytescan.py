@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+日志的字节级查询匹配
+在内存映射的 UTF-8 原文上直接查找查询子串，只有命中的条目才解码为字符串
+
+entry_matches 的语义是 query.lower() 出现在 content.lower() 或分类中。
+把小写查询的每个字符展开为所有小写后等于它的字符（"a" → a/A，"k" 另含开尔文符号 U+212A），
+各自按 UTF-8 编码拼成字节正则，在原文上的命中即是 str 层命中的超集：
+不会漏掉条目，多出的命中（如头部的日期）由 entry_matches 校验剔除。
+不含大小写字符的查询（如纯中文、数字）直接用 find 查找字节串。
+"""
+
+import re
+import mmap
+from contextlib import contextmanager
+from typing import Optional, Union
+
+# 小写形式不能由 upper()/title() 还原的字符，小写 → 原字符；
+# 由 for cp in range(0x110000) 穷举得到（Unicode 15）
+_IRREGULAR_FOLDS = {
+    'i': ['\u0130'],       # İ → i̇（取首字符，命中偏多由校验剔除）
+    'k': ['\u212a'],       # 开尔文符号
+    '\u00df': ['\u1e9e'],  # ẞ
+    '\u03b8': ['\u03f4'],  # ϴ
+    '\u03c9': ['\u2126'],  # 欧姆符号
+    '\u00e5': ['\u212b'],  # 埃符号
+}
+
+# 字节层无法判定的查询字符：İ 小写后的组合点、解码错误替换符
+_UNSUPPORTED = '\u0307\ufffd'
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def _variants(char: str):
+    """小写后等于 char 的全部字符（含自身）"""
+    variants = {char}
+    for other in (char.upper(), char.title()):
+        if len(other) == 1 and other.lower() == char:
+            variants.add(other)
+    variants.update(_IRREGULAR_FOLDS.get(char, ()))
+    return sorted(variants)
+
+
+class ByteMatcher:
+    """小写查询在 UTF-8 原文上的大小写无关匹配"""
+
+    def __init__(self, query: str):
+        lowered = query.lower()
+        self.needle = lowered.encode('utf-8')
+        self._pattern = None
+        if any(len(_variants(c)) > 1 for c in lowered):
+            parts = []
+            for char in lowered:
+                options = [re.escape(v.encode('utf-8')) for v in _variants(char)]
+                parts.append(options[0] if len(options) == 1
+                             else b"(?:" + b"|".join(options) + b")")
+            self._pattern = re.compile(b"".join(parts))
+
+    def search(self, buffer: Buffer, start: int = 0, end: Optional[int] = None) -> int:
+        """buffer[start:end] 中第一个命中的位置，没有时返回 -1；不复制 buffer"""
+        if end is None:
+            end = len(buffer)
+        if self._pattern is None:
+            return buffer.find(self.needle, start, end)
+        match = self._pattern.search(buffer, start, end)
+        return match.start() if match else -1
+
+
+def byte_matcher(query: str) -> Optional[ByteMatcher]:
+    """
+    查询对应的字节匹配器
+
+    Returns:
+        空查询（匹配全部条目）或含字节层无法判定的字符时返回 None，调用方逐条解析校验
+    """
+    if not query or any(c in _UNSUPPORTED for c in query.lower()):
+        return None
+    return ByteMatcher(query)
+
+
+@contextmanager
+def mapped(path):
+    """只读映射文件；空文件无法映射，返回 b''"""
+    with open(path, 'rb') as f:
+        try:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b''
+            return
+        with view:
+            yield view
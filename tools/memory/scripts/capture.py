@@ -5,22 +5,45 @@
 
 用法:
     python capture.py "关键信息" --category tech --tags "python,async"
+    python capture.py --stdin --category meeting < notes.txt        # 每行一条
+    python capture.py --jsonl transcript.jsonl                      # 每行一个 JSON 对象
+    python capture.py "关键信息" --metrics                           # 记录耗时，见 metrics.py
+
+server.py 运行时自动经由守护进程写入
 """
 
 import os
+import sys
 import json
 import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Dict, Optional, Iterable, Iterator
+
+from protocol import BACKENDS, connect, call
+from metrics import measure, log_sinks
+
+
+CATEGORIES = ['general', 'tech', 'decision', 'meeting', 'idea']
+
+# 批量导入时每批的条目数，控制单次写入与守护进程请求的大小
+BATCH_SIZE = 1000
 
 
 class MemoryCapture:
     """记忆捕获器"""
 
-    def __init__(self, memory_dir: str = "memory"):
+    def __init__(self, memory_dir: str = "memory", backend: str = "markdown", store=None,
+                 metric_sinks: Optional[List] = None):
         self.memory_dir = Path(memory_dir)
         self.memory_dir.mkdir(exist_ok=True)
+        if store is None:
+            # 延迟导入：经守护进程转发时无需加载存储层
+            from storage import open_store
+            store = open_store(memory_dir, backend)
+        self.store = store
+        # 每次捕获的计量记录交给这些 sink（见 metrics.py），为空时不计量
+        self.metric_sinks = list(metric_sinks or [])
 
     def capture(self, content: str, category: str = "general",
                 tags: Optional[List[str]] = None, source: str = "") -> str:
@@ -34,85 +57,168 @@ class MemoryCapture:
             source: 来源/上下文
 
         Returns:
-            记忆文件路径
+            记忆存储位置
         """
         now = datetime.now()
         date_str = now.strftime("%Y-%m-%d")
         time_str = now.strftime("%H:%M")
 
-        # 构建记忆条目
-        memory_entry = f"""
-## {date_str} {time_str} [{category.upper()}]
-
-**内容**: {content}
-
-"""
-        if source:
-            memory_entry += f"**来源**: {source}\n\n"
-
-        if tags:
-            tag_str = " ".join(f"#{tag}" for tag in tags)
-            memory_entry += f"**标签**: {tag_str}\n\n"
-
-        memory_entry += "---\n"
-
-        # 写入文件
-        memory_file = self.memory_dir / f"{date_str}.md"
-
-        if memory_file.exists():
-            with open(memory_file, 'a', encoding='utf-8') as f:
-                f.write(memory_entry)
-        else:
-            with open(memory_file, 'w', encoding='utf-8') as f:
-                f.write(f"# 记忆日志 - {date_str}\n\n")
-                f.write(memory_entry)
-
-        # 更新索引
-        self._update_index(date_str, content, category, tags)
-
-        return str(memory_file)
+        with measure('capture', self.metric_sinks) as m:
+            location = self.store.add(date_str, time_str, category, content, source, tags)
+            m.add('entries_written')
+        return location
 
-    def _update_index(self, date: str, content: str, category: str,
-                      tags: Optional[List[str]]):
-        """更新索引文件"""
-        index_file = self.memory_dir / "index.json"
-
-        if index_file.exists():
-            with open(index_file, 'r', encoding='utf-8') as f:
-                index = json.load(f)
-        else:
-            index = {"entries": []}
+    def capture_batch(self, items: List[Dict]) -> List[str]:
+        """
+        批量捕获记忆，每个日志文件只写入一次，索引每批只更新一次
 
-        index["entries"].append({
-            "date": date,
-            "category": category,
-            "preview": content[:100] + "..." if len(content) > 100 else content,
-            "tags": tags or []
-        })
+        Args:
+            items: [{'content', 'category', 'tags', 'source', 'date', 'time'}]，
+                   除 content 外均可省略，省略日期/时间时取当前时间（回放记录时可保留原时间）
 
-        with open(index_file, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        Returns:
+            与 items 一一对应的存储位置
+        """
+        now = datetime.now()
+        records = [{
+            'date': item.get('date') or now.strftime("%Y-%m-%d"),
+            'time': item.get('time') or now.strftime("%H:%M"),
+            'category': item.get('category') or "general",
+            'content': item['content'],
+            'source': item.get('source') or "",
+            'tags': item.get('tags') or [],
+        } for item in items]
+        if not records:
+            return []
+        with measure('capture', self.metric_sinks) as m:
+            locations = self.store.add_batch(records)
+            m.add('entries_written', len(records))
+        return locations
+
+
+def read_items(lines: Iterable[str], jsonl: bool, category: str,
+               tags: List[str], source: str) -> Iterator[Dict]:
+    """
+    解析批量输入
+
+    纯文本每个非空行为一条记忆，使用命令行给出的分类/标签/来源；
+    JSON Lines 每行一个对象，未给出的字段同样取命令行的值，tags 可为列表或逗号分隔的字符串。
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not jsonl:
+            yield {'content': line, 'category': category, 'tags': tags, 'source': source}
+            continue
+
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第 {line_no} 行不是有效的 JSON: {e}")
+        if not isinstance(item, dict) or not item.get('content'):
+            raise ValueError(f"第 {line_no} 行缺少 content")
+        item.setdefault('category', category)
+        if item['category'] not in CATEGORIES:
+            raise ValueError(f"第 {line_no} 行的分类无效: {item['category']}")
+        item_tags = item.get('tags', tags)
+        item['tags'] = item_tags.split(',') if isinstance(item_tags, str) else item_tags
+        item.setdefault('source', source)
+        yield item
+
+
+def _batches(items: Iterable[Dict]) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def main():
     parser = argparse.ArgumentParser(description='捕获记忆')
-    parser.add_argument('content', help='记忆内容')
-    parser.add_argument('--category', '-c', default='general',
-                        choices=['general', 'tech', 'decision', 'meeting', 'idea'],
+    parser.add_argument('content', nargs='?', help='记忆内容')
+    parser.add_argument('--stdin', action='store_true',
+                        help='从标准输入批量读取，每个非空行为一条记忆')
+    parser.add_argument('--jsonl', metavar='FILE',
+                        help='从 JSON Lines 文件批量读取（- 为标准输入）')
+    parser.add_argument('--category', '-c', default='general', choices=CATEGORIES,
                         help='记忆分类')
     parser.add_argument('--tags', '-t', help='标签，逗号分隔')
     parser.add_argument('--source', '-s', help='来源/上下文')
     parser.add_argument('--memory-dir', '-d', default='memory',
                         help='记忆目录')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--socket', help='守护进程套接字 (默认: 记忆目录下的 .memory-<后端>.sock)')
+    parser.add_argument('--metrics', nargs='?', const='', metavar='FILE',
+                        help='记录计量数据 (默认: 记忆目录下的 .index/metrics.jsonl)')
 
     args = parser.parse_args()
 
-    tags = args.tags.split(',') if args.tags else []
-
-    capture = MemoryCapture(args.memory_dir)
-    file_path = capture.capture(args.content, args.category, tags, args.source)
+    if sum(bool(x) for x in (args.content, args.stdin, args.jsonl)) != 1:
+        parser.error("需要且只能指定记忆内容、--stdin 或 --jsonl 之一")
 
-    print(f"✓ 记忆已保存到: {file_path}")
+    tags = args.tags.split(',') if args.tags else []
+    sinks = log_sinks(args.memory_dir, args.metrics)
+
+    if args.content:
+        conn = connect(args.memory_dir, args.backend, args.socket)
+        if conn is not None:
+            try:
+                with measure('capture', sinks) as m:
+                    file_path = call(conn, 'capture', {
+                        'content': args.content, 'category': args.category,
+                        'tags': tags, 'source': args.source or ""})
+                    m.lap('rpc')
+                    m.add('entries_written')
+            except RuntimeError as e:
+                print(f"保存失败: {e}")
+                sys.exit(1)
+        else:
+            capture = MemoryCapture(args.memory_dir, args.backend, metric_sinks=sinks)
+            file_path = capture.capture(args.content, args.category, tags, args.source or "")
+            capture.store.close()
+
+        print(f"✓ 记忆已保存到: {file_path}")
+        return
+
+    if args.jsonl and args.jsonl != '-':
+        stream = open(args.jsonl, 'r', encoding='utf-8')
+    else:
+        stream = sys.stdin
+    items = read_items(stream, bool(args.jsonl), args.category, tags, args.source or "")
+
+    capture = None
+    locations = []
+    try:
+        for batch in _batches(items):
+            conn = connect(args.memory_dir, args.backend, args.socket)
+            if conn is not None:
+                with measure('capture', sinks) as m:
+                    locations.extend(call(conn, 'capture_batch', {'items': batch}))
+                    m.lap('rpc')
+                    m.add('entries_written', len(batch))
+                continue
+            if capture is None:
+                capture = MemoryCapture(args.memory_dir, args.backend, metric_sinks=sinks)
+            locations.extend(capture.capture_batch(batch))
+    except (ValueError, RuntimeError) as e:
+        # RuntimeError 来自守护进程（执行失败或连接中断），此前各批已经保存
+        print(f"导入中止: {e}（已保存 {len(locations)} 条）")
+        sys.exit(1)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if capture is not None:
+            capture.store.close()
+
+    # SQLite 的位置带 #条目号，汇总时只列出文件
+    files = list(dict.fromkeys(location.split('#')[0] for location in locations))
+    print(f"✓ {len(locations)} 条记忆已保存到: {', '.join(files) if files else '-'}")
 
 
 if __name__ == '__main__':
@@ -6,55 +6,198 @@
 用法:
     python consolidate.py --dry-run
     python consolidate.py --archive-before 2023-01-01
+    python consolidate.py --similarity 0.9
+    python consolidate.py --metrics          # 记录各阶段耗时，见 metrics.py
+
+server.py 运行时自动交由守护进程执行
 """
 
 import os
 import re
+import sys
 import json
+import base64
 import argparse
+from array import array
 from pathlib import Path
-from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import List, Dict, Set
+from typing import List, Dict, Tuple, Optional
+
+from protocol import BACKENDS, connect, call
+from metrics import measure, log_sinks, current as current_metrics
+from minhash import LSHIndex, signature, shingles
+
+
+# 整合状态文件格式版本，签名算法、分桶等变化时递增以丢弃旧状态
+STATE_VERSION = 4
+
+
+class _Signatures(dict):
+    """条目编号 → MinHash 签名，第一次访问时从 base64 解码"""
+
+    def __init__(self, encoded: Dict[int, str]):
+        super().__init__()
+        self._encoded = encoded
+
+    def __missing__(self, n: int) -> Tuple[int, ...]:
+        sig = self[n] = _decode_sig(self._encoded[n])
+        return sig
+
+
+def _decode_sig(encoded: str) -> Tuple[int, ...]:
+    sig = array('I')
+    sig.frombytes(base64.b64decode(encoded))
+    return tuple(sig)
+
+
+class _SignatureIndex:
+    """
+    各数据源条目的签名与 LSH 分桶，保存在 lsh_file 中
+
+    条目按递增的编号进入分桶；数据源改动时只移除并重新加入该数据源的条目。
+    只保存查重需要的编号与签名，条目的定位信息每次从改动过的数据源重新解析。
+    """
+
+    def __init__(self, threshold: float, data: Optional[Dict] = None):
+        data = data or {}
+        self.token = data.get('token')
+        self.next_id = data.get('next_id', 0)
+        self.entries = data.get('entries', {})      # 数据源 → [[编号, base64 签名], ...]
+        self.encoded = {}                           # 编号 → base64 签名
+        self.owner = {}                             # 编号 → 数据源
+        for key, items in self.entries.items():
+            for n, encoded in items:
+                self.encoded[n] = encoded
+                self.owner[n] = key
+        self.lsh = LSHIndex(threshold, data.get('buckets'), _Signatures(self.encoded))
+
+    def drop(self, key: str):
+        """移除一个数据源的全部条目"""
+        for n, _ in self.entries.pop(key, ()):
+            self.lsh.remove(n, self.lsh.signatures[n])
+            del self.encoded[n], self.owner[n]
+
+    def add(self, key: str, sig: Tuple[int, ...], indexed: bool = True):
+        """记录一个条目的签名；indexed 为假时（判为重复的条目）不进入分桶"""
+        n = self.next_id
+        self.next_id += 1
+        encoded = base64.b64encode(array('I', sig).tobytes()).decode('ascii')
+        self.entries.setdefault(key, []).append([n, encoded])
+        self.encoded[n] = encoded
+        self.owner[n] = key
+        if indexed:
+            self.lsh.insert(n, sig)
+
+    def to_dict(self) -> Dict:
+        return {'version': STATE_VERSION, 'token': self.token, 'next_id': self.next_id,
+                'entries': self.entries, 'buckets': [dict(band) for band in self.lsh.buckets]}
 
 
 class MemoryConsolidate:
     """记忆整合器"""
 
-    def __init__(self, memory_dir: str = "memory"):
+    def __init__(self, memory_dir: str = "memory", backend: str = "markdown", store=None,
+                 metric_sinks: Optional[List] = None):
         self.memory_dir = Path(memory_dir)
         self.archive_dir = self.memory_dir / "archive"
         self.archive_dir.mkdir(exist_ok=True)
-
-    def consolidate(self, dry_run: bool = False, archive_before: str = None) -> Dict:
+        if store is None:
+            # 延迟导入：经守护进程转发时无需加载存储层
+            from storage import open_store
+            store = open_store(memory_dir, backend)
+        self.store = store
+        # 各数据源的快速指纹、内容哈希与条目数，每次整合只读这个小文件判断哪些数据源改动过
+        self.state_file = self.memory_dir / ".index" / f"consolidate-{backend}.json"
+        # 条目签名与 LSH 分桶，只在有数据源改动时读取和更新
+        self.lsh_file = self.memory_dir / ".index" / f"consolidate-{backend}.lsh.json"
+        # 每次整合的计量记录交给这些 sink（见 metrics.py），为空时不计量
+        self.metric_sinks = list(metric_sinks or [])
+
+    def consolidate(self, dry_run: bool = False, archive_before: str = None,
+                    similarity: float = 0.8) -> Dict:
         """
         整合记忆文件
 
+        只解析上次整合后改动过的数据源，并只拿这些数据源的条目查询已保存的 LSH 分桶：
+        已整合过的条目保留，新条目与其重复时删除新条目。没有数据源改动时直接返回。
+
         Args:
-            dry_run: 只报告，不执行
+            dry_run: 只报告，不执行（也不保存整合状态）
             archive_before: 归档此日期之前的记忆
+            similarity: 近似重复的相似度阈值 (0-1)，1 表示只处理完全重复
 
         Returns:
             整合报告
         """
+        with measure('consolidate', self.metric_sinks) as m:
+            report = self._consolidate(dry_run, archive_before, similarity)
+            m.add('sources_parsed', report['sources_parsed'])
+            m.add('duplicates_found', report['duplicates_found'])
+        return report
+
+    def _consolidate(self, dry_run: bool, archive_before: Optional[str],
+                     similarity: float) -> Dict:
+        m = current_metrics()
         report = {
             'duplicates_found': 0,
             'duplicates_removed': 0,
             'archived_files': 0,
             'short_entries_removed': 0,
+            'sources_parsed': 0,
             'actions': []
         }
 
-        # 查找重复
-        duplicates = self._find_duplicates()
+        state = self._load_state()
+        changed, removed, touched = self._refresh_sources(state)
+        report['sources_parsed'] = len(changed)
+        m.lap('glob')
+
+        if not changed and not removed and not archive_before:
+            # 没有数据源改动：不读签名、不重建索引；只有快速指纹变了（如 touch）时保存小的状态文件
+            if touched and not dry_run:
+                self._save_state(state)
+                m.lap('write')
+            return report
+
+        index = self._load_index(state, similarity)
+        if index.token is None:
+            # 没有可用的签名（第一次整合或状态不一致），全部数据源按改动处理
+            for key in state['sources']:
+                if key not in changed:
+                    changed[key] = self.store.load_source(key)[1]
+            report['sources_parsed'] = len(changed)
+        for key in removed:
+            index.drop(key)
+
+        # 查找重复和短条目；改动的条目与排在后面、未改动的数据源中的条目重复时，
+        # 后者才是重复项，把那些数据源也重新解析后再扫描一遍
+        signatures = {}       # 本次整合中 条目原文 → 签名，改写后重新解析的条目不必再算
+        while True:
+            duplicates, short_entries, later = self._scan(index, changed, signatures)
+            if not later:
+                break
+            for key in later:
+                changed[key] = self.store.load_source(key)[1]
+            report['sources_parsed'] = len(changed)
+        m.lap('match')
         report['duplicates_found'] = len(duplicates)
 
-        if duplicates and not dry_run:
-            self._remove_duplicates(duplicates)
-            report['duplicates_removed'] = len(duplicates)
-
         for dup in duplicates:
-            report['actions'].append(f"发现重复: {dup['content'][:50]}...")
+            report['actions'].append(
+                f"发现重复 ({dup['similarity']:.0%}): {dup['content'][:50]}...")
+
+        # 重复与短条目一并删除，每个日志文件只改写一次
+        if not dry_run and (duplicates or short_entries):
+            self.store.remove([dup['entry'] for dup in duplicates] + short_entries)
+            report['duplicates_removed'] = len(duplicates)
+            # 趁被改写的文件还在页缓存里更新其指纹与签名；删除时被其他进程改动而跳过的条目、
+            # 扫描之后追加的条目仍需查重，这样的数据源不记为已整合，留给下次整合重新解析
+            rewritten, _, _ = self._refresh_sources(state)
+            leftover, leftover_short, later = self._scan(index, rewritten, signatures)
+            dirty = {located.get('file', located['date'])
+                     for located in [dup['entry'] for dup in leftover] + leftover_short}
+            for key in dirty | later:
+                if key in state['sources']:
+                    state['sources'][key]['quick'] = state['sources'][key]['hash'] = None
 
         # 归档旧记忆
         if archive_before:
@@ -63,50 +206,164 @@ class MemoryConsolidate:
             if archived > 0:
                 report['actions'].append(f"归档了 {archived} 个旧文件")
 
-        # 清理短条目
-        short_removed = self._clean_short_entries(dry_run)
-        report['short_entries_removed'] = short_removed
-        if short_removed > 0:
-            report['actions'].append(f"清理了 {short_removed} 个短条目")
+        report['short_entries_removed'] = len(short_entries)
+        if short_entries:
+            report['actions'].append(f"清理了 {len(short_entries)} 个短条目")
+
+        if dry_run:
+            return report
+
+        # 归档后不再存在的数据源移出状态
+        live = {key for key, _ in self.store.iter_sources()}
+        for key in [key for key in state['sources'] if key not in live]:
+            del state['sources'][key]
+            index.drop(key)
+        for key, source in state['sources'].items():
+            source['entries'] = len(index.entries.get(key, ()))
 
         # 更新索引
-        if not dry_run:
-            self._rebuild_index()
+        self._rebuild_index({key: s['entries'] for key, s in state['sources'].items()})
 
+        self._save_state(state, index)
+        m.lap('write')
         return report
 
-    def _find_duplicates(self) -> List[Dict]:
-        """查找重复记忆"""
-        seen = {}
-        duplicates = []
+    def _load_state(self) -> Dict:
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION:
+                    return state
+            except (OSError, ValueError):
+                pass
+        return {'version': STATE_VERSION, 'sources': {}}
+
+    def _load_index(self, state: Dict, similarity: float) -> _SignatureIndex:
+        """读取签名与分桶；与状态文件不是同一次保存的（如保存中途中断）时丢弃"""
+        if state.get('token') and self.lsh_file.exists():
+            try:
+                with open(self.lsh_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == STATE_VERSION and data.get('token') == state['token']:
+                    return _SignatureIndex(similarity, data)
+            except (OSError, ValueError):
+                pass
+        return _SignatureIndex(similarity)
+
+    def _save_state(self, state: Dict, index: Optional[_SignatureIndex] = None):
+        """保存状态（给出 index 时连同签名与分桶，两者带相同的 token）"""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        if index is not None:
+            index.token = state['token'] = os.urandom(8).hex()
+            self._write_json(self.lsh_file, index.to_dict())
+        self._write_json(self.state_file, state)
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict):
+        # 多个整合进程可能同时保存，各自写临时文件再替换，后写入的完整覆盖先写入的；
+        # 两个文件的 token 不一致时下次整合重新计算签名
+        tmp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        os.replace(tmp_file, path)
+
+    def _refresh_sources(self, state: Dict) -> Tuple[Dict[str, List[Dict]], List[str], bool]:
+        """
+        按快速指纹和内容哈希更新数据源状态
+
+        快速指纹（大小 + mtime）不变时直接复用；指纹变了但内容哈希相同时
+        （例如只是 touch 过）只更新指纹；否则重新解析。
 
-        for memory_file in self.memory_dir.glob("*.md"):
-            if memory_file.name in ["index.md", "template.md"]:
+        Returns:
+            (改动过的数据源 → 条目列表, 已不存在的数据源, 是否有数据源只更新了指纹)
+        """
+        cached = state['sources']
+        current = {}
+        changed = {}
+        touched = False
+        for key, quick in self.store.iter_sources():
+            source = cached.get(key)
+            if source is not None and source['quick'] == quick:
+                current[key] = source
                 continue
 
-            with open(memory_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+            digest, entries = self.store.load_source(key)
+            if source is not None and source['hash'] == digest:
+                source['quick'] = quick
+                current[key] = source
+                touched = True
+                continue
 
-            entries = self._extract_entry_contents(content)
+            current[key] = {'quick': quick, 'hash': digest, 'entries': len(entries)}
+            changed[key] = entries
+        removed = [key for key in cached if key not in current]
+        state['sources'] = current
+        return changed, removed, touched
+
+    def _fingerprint(self, entry: Dict, signatures: Optional[Dict] = None
+                     ) -> Tuple[Dict, Tuple[int, ...]]:
+        """条目的定位信息、预览、短条目标记，以及 MinHash 签名；signatures 缓存本次已算过的签名"""
+        ref = {k: v for k, v in entry.items()
+               if k not in ('raw', 'content', 'tags')}
+        ref['preview'] = entry['raw'][:50]
+        # 少于 50 字符的条目视为过短
+        ref['short'] = len(entry['raw'].strip()) < 50
+        sig = signatures.get(entry['raw']) if signatures is not None else None
+        if sig is None:
+            sig = signature(shingles(self._normalize(entry['raw'])))
+            if signatures is not None:
+                signatures[entry['raw']] = sig
+        return ref, sig
+
+    def _scan(self, index: _SignatureIndex, changed: Dict[str, List[Dict]],
+              signatures: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict], set]:
+        """
+        一遍扫描改动过的数据源，找出重复（MinHash/LSH）和过短条目
 
-            for entry in entries:
-                normalized = self._normalize(entry)
+        数据源按键排序，每组重复保留排在最前的数据源中最先出现的一条，与全量扫描的结果相同；
+        原件不取决于哪次整合先看到哪个条目，多个整合进程同时运行也不会把一组重复全部删掉。
 
-                if normalized in seen:
+        Returns:
+            (重复列表, 短条目列表, 含有本次条目的重复项、需要重新解析的未改动数据源)；
+            已判为重复的条目不再计入短条目
+        """
+        duplicates = []
+        short_entries = []
+        later = set()
+
+        for key in changed:
+            index.drop(key)
+        for key in sorted(changed):
+            for entry in changed[key]:
+                ref, sig = self._fingerprint(entry, signatures)
+                located = {k: v for k, v in ref.items() if k not in ('short', 'preview')}
+
+                # 分桶中排在后面的数据源的条目不能作为原件
+                matches = []
+                for n, score in index.lsh.query(sig):
+                    if index.owner[n] > key:
+                        later.add(index.owner[n])
+                    else:
+                        matches.append((n, score))
+                if matches:
+                    original, score = matches[0]
                     duplicates.append({
-                        'content': entry,
-                        'file': memory_file.name,
-                        'duplicate_of': seen[normalized]
+                        'content': ref['preview'],
+                        'file': located.get('file', located['date']),
+                        'duplicate_of': index.owner[original],
+                        'similarity': score,
+                        'entry': located
                     })
-                else:
-                    seen[normalized] = memory_file.name
+                    # 只有原件进入分桶，重复项不会再派生新的重复链
+                    index.add(key, sig, indexed=False)
+                    continue
 
-        return duplicates
+                index.add(key, sig)
+                if ref['short']:
+                    short_entries.append(located)
 
-    def _extract_entry_contents(self, content: str) -> List[str]:
-        """提取条目内容"""
-        pattern = r'##\s+\d{4}-\d{2}-\d{2}.+?(?=\n---|\Z)'
-        return re.findall(pattern, content, re.DOTALL)
+        return duplicates, short_entries, later
 
     def _normalize(self, content: str) -> str:
         """标准化内容用于比较"""
@@ -118,88 +375,13 @@ class MemoryConsolidate:
         # 清理空白
         return ' '.join(normalized.split())
 
-    def _remove_duplicates(self, duplicates: List[Dict]):
-        """移除重复条目"""
-        # 简化的去重：重新写入不含重复的文件
-        pass
-
     def _archive_old_memories(self, before_date: str, dry_run: bool) -> int:
         """归档旧记忆"""
-        cutoff = datetime.strptime(before_date, "%Y-%m-%d")
-        archived = 0
-
-        for memory_file in self.memory_dir.glob("*.md"):
-            if memory_file.name in ["index.md"]:
-                continue
-
-            # 解析文件名日期
-            try:
-                file_date = datetime.strptime(memory_file.stem, "%Y-%m-%d")
-            except ValueError:
-                continue
+        return self.store.archive(before_date, dry_run)
 
-            if file_date < cutoff:
-                if not dry_run:
-                    target = self.archive_dir / memory_file.name
-                    memory_file.rename(target)
-                archived += 1
-
-        return archived
-
-    def _clean_short_entries(self, dry_run: bool) -> int:
-        """清理过短的记忆条目"""
-        removed = 0
-
-        for memory_file in self.memory_dir.glob("*.md"):
-            if memory_file.name in ["index.md"]:
-                continue
-
-            with open(memory_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 移除少于 50 字符的条目
-            original_entries = self._extract_entry_contents(content)
-
-            for entry in original_entries:
-                if len(entry.strip()) < 50:
-                    removed += 1
-                    if not dry_run:
-                        content = content.replace(entry, '')
-
-            if not dry_run and removed > 0:
-                with open(memory_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-
-        return removed
-
-    def _rebuild_index(self):
+    def _rebuild_index(self, entry_counts: Optional[Dict[str, int]] = None):
         """重建索引文件"""
-        entries = []
-
-        for memory_file in self.memory_dir.glob("*.md"):
-            if memory_file.name in ["index.md", "template.md"]:
-                continue
-
-            with open(memory_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 提取基本信息
-            date_match = re.search(r'# 记忆日志 - (\d{4}-\d{2}-\d{2})', content)
-            if date_match:
-                entries.append({
-                    'file': memory_file.name,
-                    'date': date_match.group(1),
-                    'entry_count': len(self._extract_entry_contents(content))
-                })
-
-        index = {
-            'last_updated': datetime.now().isoformat(),
-            'total_files': len(entries),
-            'files': sorted(entries, key=lambda x: x['date'], reverse=True)
-        }
-
-        with open(self.memory_dir / "index.json", 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        self.store.rebuild(entry_counts)
 
 
 def main():
@@ -208,13 +390,35 @@ def main():
                         help='只报告，不执行')
     parser.add_argument('--archive-before',
                         help='归档此日期之前的记忆 (YYYY-MM-DD)')
+    parser.add_argument('--similarity', type=float, default=0.8,
+                        help='近似重复的相似度阈值 (默认: 0.8，1 为仅完全重复)')
     parser.add_argument('--memory-dir', default='memory',
                         help='记忆目录')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--socket', help='守护进程套接字 (默认: 记忆目录下的 .memory-<后端>.sock)')
+    parser.add_argument('--metrics', nargs='?', const='', metavar='FILE',
+                        help='记录计量数据 (默认: 记忆目录下的 .index/metrics.jsonl)')
 
     args = parser.parse_args()
 
-    consolidate = MemoryConsolidate(args.memory_dir)
-    report = consolidate.consolidate(args.dry_run, args.archive_before)
+    sinks = log_sinks(args.memory_dir, args.metrics)
+
+    conn = connect(args.memory_dir, args.backend, args.socket)
+    if conn is not None:
+        try:
+            with measure('consolidate', sinks) as m:
+                report = call(conn, 'consolidate', {
+                    'dry_run': args.dry_run, 'archive_before': args.archive_before,
+                    'similarity': args.similarity})
+                m.lap('rpc')
+        except RuntimeError as e:
+            print(f"整合失败: {e}")
+            sys.exit(1)
+    else:
+        consolidate = MemoryConsolidate(args.memory_dir, args.backend, metric_sinks=sinks)
+        report = consolidate.consolidate(args.dry_run, args.archive_before, args.similarity)
+        consolidate.store.close()
 
     print("记忆整合报告")
     print("=" * 50)
@@ -222,6 +426,7 @@ def main():
     print(f"移除重复: {report['duplicates_removed']}")
     print(f"归档文件: {report['archived_files']}")
     print(f"清理短条目: {report['short_entries_removed']}")
+    print(f"重新解析: {report['sources_parsed']}")
 
     if report['actions']:
         print("\n执行的操作:")
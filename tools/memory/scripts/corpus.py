@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+合成记忆语料
+按 capture 写入的日志格式生成每日日志，用于基准测试与回归对比
+
+词项按 Zipf 分布抽取：内置的常用词排在前面，其后是合成的长尾词（CJK 组合词、
+拼音式英文词），标签同样按 Zipf 分布；
+可控制中英文比例、条目长度、完全重复与近似重复的比例。固定种子时输出完全一致。
+
+用法:
+    python corpus.py --output bench/memory --days 365 --per-day 30
+    python corpus.py --output bench/memory --entries 100000 --cjk 0.5 --dup-rate 0.1
+"""
+
+import math
+import random
+import argparse
+import itertools
+from pathlib import Path
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from storage import format_entry
+from capture import CATEGORIES
+
+
+CJK_WORDS = (
+    "数据库 架构 缓存 索引 部署 会议 决策 性能 接口 服务 用户 需求 测试 发布 监控 日志 "
+    "配置 迁移 重构 优化 延迟 吞吐 容量 集群 节点 分片 副本 事务 队列 消息 网关 鉴权 "
+    "权限 前端 后端 移动端 产品 设计 评审 排期 风险 预算 合同 客户 反馈 故障 告警 回滚 "
+    "版本 分支 合并 依赖 升级 安全 加密 备份 恢复 存储 网络 带宽 带宽峰值 模型 训练 推理 "
+    "向量 检索 召回 排序 特征 样本 标注 评估 指标 实验 灰度 开关 文档 规范 流程 复盘 "
+    "目标 里程碑 负责人 周报 例会 访谈 调研 竞品 定价 增长 留存 转化 漏斗 报表 看板"
+).split()
+
+ASCII_WORDS = (
+    "python async redis postgres mysql kafka docker kubernetes nginx grpc http json "
+    "api cache index query latency throughput shard replica leader follower raft "
+    "deploy rollback release branch merge commit review test benchmark profile trace "
+    "metric alert dashboard oncall incident postmortem schema migration orm sql join "
+    "vector embedding model training inference batch stream pipeline etl spark flink "
+    "frontend backend react vue typescript golang rust java jvm gc heap thread lock "
+    "mutex queue worker cron s3 bucket cdn dns tls oauth jwt token session cookie"
+).split()
+
+# 各分类（capture.CATEGORIES 的顺序）的相对频率
+CATEGORY_WEIGHTS = [3, 4, 1, 2, 1]
+
+SOURCES = ["", "", "", "对话", "会议纪要", "代码评审", "周报"]
+
+# 合成长尾词用的音节
+_SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"]
+
+# 长尾词项（工单号）的取值范围与出现概率，提供高选择性的查询
+RARE_RANGE = 100000
+RARE_RATE = 0.3
+
+
+def zipf_weights(n: int, skew: float) -> List[float]:
+    """第 k 名的累积权重 ∝ Σ 1/k^skew，供 random.choices 的 cum_weights 使用"""
+    return list(itertools.accumulate(1 / (k ** skew) for k in range(1, n + 1)))
+
+
+def _vocabulary(base: List[str], size: int, make, rng: random.Random) -> List[str]:
+    """常用词在前，补足 size 个不重复的合成词"""
+    words = list(base)
+    seen = set(words)
+    while len(words) < size:
+        word = make(rng)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def parse_size(text: str) -> int:
+    """解析 1k / 100k / 1m 形式的条目数"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    number = text[:-1] if scale > 1 else text
+    return int(float(number) * scale)
+
+
+class CorpusGenerator:
+    """合成记忆条目生成器"""
+
+    def __init__(self, seed: int = 1, cjk_ratio: float = 0.6, dup_rate: float = 0.05,
+                 near_dup_ratio: float = 0.5, num_tags: int = 40, tag_skew: float = 1.2,
+                 word_skew: float = 1.0, mean_words: int = 18, vocab: int = 5000):
+        """
+        Args:
+            seed: 随机种子
+            cjk_ratio: 内容中 CJK 词的比例 (0-1)
+            dup_rate: 重复条目的比例 (0-1)
+            near_dup_ratio: 重复条目中近似重复（改动一个词）所占比例，其余为完全重复
+            num_tags: 标签总数
+            tag_skew: 标签 Zipf 分布的偏斜度，越大越集中于少数标签
+            word_skew: 词项 Zipf 分布的偏斜度
+            mean_words: 条目平均词数（对数正态分布）
+            vocab: 中、英文词表各自的大小（含内置常用词）
+        """
+        self.rng = random.Random(seed)
+        self.cjk_ratio = cjk_ratio
+        self.dup_rate = dup_rate
+        self.near_dup_ratio = near_dup_ratio
+        self.mean_words = mean_words
+
+        chars = sorted(set("".join(CJK_WORDS)))
+        vocab_rng = random.Random(seed)
+        self.cjk_words = _vocabulary(
+            CJK_WORDS, vocab,
+            lambda r: "".join(r.choice(chars) for _ in range(r.choice((2, 2, 3)))), vocab_rng)
+        self.ascii_words = _vocabulary(
+            ASCII_WORDS, vocab,
+            lambda r: "".join(r.choice(_SYLLABLES) for _ in range(r.choice((2, 3, 3)))),
+            vocab_rng)
+
+        self.tags = CJK_WORDS[:num_tags // 2] + ASCII_WORDS[:num_tags - num_tags // 2]
+        self._tag_weights = zipf_weights(len(self.tags), tag_skew)
+        self._cjk_weights = zipf_weights(len(self.cjk_words), word_skew)
+        self._ascii_weights = zipf_weights(len(self.ascii_words), word_skew)
+        # 供重复条目取样的近期内容
+        self._recent = []
+
+    def _words(self, count: int) -> List[str]:
+        cjk = sum(1 for _ in range(count) if self.rng.random() < self.cjk_ratio)
+        words = self.rng.choices(self.cjk_words, cum_weights=self._cjk_weights, k=cjk) + \
+            self.rng.choices(self.ascii_words, cum_weights=self._ascii_weights, k=count - cjk)
+        self.rng.shuffle(words)
+        return words
+
+    def _content(self) -> str:
+        if self._recent and self.rng.random() < self.dup_rate:
+            content = self.rng.choice(self._recent)
+            if self.rng.random() >= self.near_dup_ratio:
+                return content
+            # 近似重复：替换一个词
+            words = content.split(" ")
+            words[self.rng.randrange(len(words))] = self._words(1)[0]
+            return " ".join(words)
+
+        sigma = 0.5
+        count = max(3, int(self.rng.lognormvariate(math.log(self.mean_words) - sigma ** 2 / 2,
+                                                   sigma)))
+        words = self._words(count)
+        if self.rng.random() < RARE_RATE:
+            words.append(f"ticket{self.rng.randrange(RARE_RANGE)}")
+        content = " ".join(words)
+        if len(self._recent) < 1000:
+            self._recent.append(content)
+        else:
+            self._recent[self.rng.randrange(1000)] = content
+        return content
+
+    def record(self, date_str: str, time_str: str) -> Dict:
+        """生成一条记录，字段与 MemoryCapture.capture_batch 的输入一致"""
+        ntags = self.rng.choice([0, 1, 1, 2, 2, 3])
+        tags = list(dict.fromkeys(
+            self.rng.choices(self.tags, cum_weights=self._tag_weights, k=ntags)))
+        return {
+            'date': date_str,
+            'time': time_str,
+            'category': self.rng.choices(CATEGORIES, weights=CATEGORY_WEIGHTS)[0],
+            'content': self._content(),
+            'source': self.rng.choice(SOURCES),
+            'tags': tags,
+        }
+
+    def days(self, entries: int, per_day: int, end: Optional[date] = None
+             ) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        按日期升序生成 (日期, 当天记录)，每天条数在 per_day 上下浮动，总数恰为 entries
+
+        Args:
+            entries: 条目总数
+            per_day: 平均每天条目数
+            end: 最后一天 (默认今天)
+        """
+        end = end or date.today()
+        num_days = max(1, math.ceil(entries / per_day))
+        remaining = entries
+        for i in range(num_days):
+            day = end - timedelta(days=num_days - 1 - i)
+            left_days = num_days - i
+            if left_days == 1:
+                count = remaining
+            else:
+                average = remaining / left_days
+                count = min(remaining, max(1, int(self.rng.uniform(0.5, 1.5) * average)))
+            remaining -= count
+            minutes = sorted(self.rng.randrange(8 * 60, 23 * 60) for _ in range(count))
+            yield day.isoformat(), [self.record(day.isoformat(), f"{m // 60:02d}:{m % 60:02d}")
+                                    for m in minutes]
+            if remaining <= 0:
+                break
+
+    def queries(self, count: int, max_terms: int = 2, rare: float = 0.2) -> List[str]:
+        """按同样的词频分布抽取查询，1~max_terms 个词项；rare 比例的查询为长尾工单号"""
+        queries = []
+        for _ in range(count):
+            if self.rng.random() < rare:
+                queries.append(f"ticket{self.rng.randrange(RARE_RANGE)}")
+                continue
+            words = self._words(self.rng.randint(1, max_terms))
+            queries.append(" ".join(dict.fromkeys(words)))
+        return queries
+
+
+def write_corpus(output_dir: str, days: Iterator[Tuple[str, List[Dict]]]) -> Tuple[int, int]:
+    """
+    把生成的记录写成每日日志，格式与 capture 写入的完全一致
+
+    Returns:
+        (文件数, 条目数)
+    """
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    files = entries = 0
+    for date_str, records in days:
+        with open(output / f"{date_str}.md", 'w', encoding='utf-8') as f:
+            f.write(f"# 记忆日志 - {date_str}\n\n")
+            f.writelines(format_entry(r['date'], r['time'], r['category'], r['content'],
+                                      r['source'], r['tags'])
+                         for r in records)
+        files += 1
+        entries += len(records)
+    return files, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成记忆语料')
+    parser.add_argument('--output', '-o', required=True, help='输出的记忆目录')
+    parser.add_argument('--entries', '-n', default=None,
+                        help='条目总数，可写作 1k/100k/1m (默认: days × per-day)')
+    parser.add_argument('--days', type=int, default=365, help='天数 (默认: 365)')
+    parser.add_argument('--per-day', type=int, default=30, help='平均每天条目数 (默认: 30)')
+    parser.add_argument('--end', help='最后一天 (YYYY-MM-DD，默认今天)')
+    parser.add_argument('--cjk', type=float, default=0.6, help='CJK 词比例 (默认: 0.6)')
+    parser.add_argument('--dup-rate', type=float, default=0.05, help='重复条目比例 (默认: 0.05)')
+    parser.add_argument('--near-dup', type=float, default=0.5,
+                        help='重复中近似重复的比例 (默认: 0.5)')
+    parser.add_argument('--tags', type=int, default=40, help='标签总数 (默认: 40)')
+    parser.add_argument('--tag-skew', type=float, default=1.2,
+                        help='标签 Zipf 偏斜度 (默认: 1.2)')
+    parser.add_argument('--words', type=int, default=18, help='条目平均词数 (默认: 18)')
+    parser.add_argument('--vocab', type=int, default=5000,
+                        help='中、英文词表各自的大小 (默认: 5000)')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+
+    args = parser.parse_args()
+
+    entries = parse_size(args.entries) if args.entries else args.days * args.per_day
+    per_day = args.per_day if not args.entries else max(1, math.ceil(entries / args.days))
+    end = date.fromisoformat(args.end) if args.end else None
+
+    generator = CorpusGenerator(args.seed, args.cjk, args.dup_rate, args.near_dup,
+                                args.tags, args.tag_skew, mean_words=args.words,
+                                vocab=args.vocab)
+    files, written = write_corpus(args.output, generator.days(entries, per_day, end))
+    print(f"✓ 生成 {written} 条记忆，{files} 个日志文件: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
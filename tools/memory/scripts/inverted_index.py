@@ -0,0 +1,914 @@
+#!/usr/bin/env python3
+"""
+记忆倒排索引
+为每日日志维护持久化的 词项 → 条目位置 倒排表，回忆时只读取命中的条目
+
+目录结构:
+    memory/.index/
+    ├── meta.json            # 每个日志文件的已索引大小、mtime、代数
+    ├── vocab.txt            # 出现过的 ASCII 词项，每行一个，供子串查询展开
+    └── postings/
+        ├── a.tsv            # 以词项首字符分桶的倒排记录
+        └── u4e.tsv
+
+倒排记录格式 (TSV):
+    词项  文件名  代数  字节偏移  字节长度  词频  条目词数  内容字符数
+
+内容字符数是去掉来源、标签行后的正文长度（budget.plain_content），回忆按预算装入时
+读取条目之前即可据此得到代价下限。
+
+capture 把倒排记录追加到桶末尾；consolidate 压缩索引时把尾部较大的桶按词项整体排序，
+首行 `#sorted <结束位置>` 标出已排序部分。查找时在已排序部分二分定位词项的那几行，
+只有之后追加的尾部逐行查找。
+
+ASCII 查询词项按子串匹配（"sql" 命中 "postgresql"）：先在 vocab.txt 中找出包含它的词项，
+再按桶逐个精确查找。
+"""
+
+import os
+import re
+import json
+import uuid
+from pathlib import Path
+from collections import Counter, OrderedDict, defaultdict
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, NamedTuple, Union
+
+import metrics
+from budget import plain_content
+from bytescan import Buffer, ByteMatcher, mapped
+from query import BooleanQuery, intersect, union
+from ranking import bm25, recency_weight
+
+
+# 条目头部行，与 capture.py 写入的格式一致；其后须紧跟一个空行
+_HEADER_PATTERN = re.compile(
+    r'##\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2})\s+\[([^\]\n]+)\]\n\Z'
+)
+
+# ASCII 单词或连续的 CJK 字符
+_TOKEN_PATTERN = re.compile(
+    r'[a-z0-9_]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+'
+)
+
+SKIP_FILES = {"index.md", "template.md"}
+
+# 倒排记录格式变化时递增，旧索引自动重建
+INDEX_VERSION = 4
+
+# 常驻进程缓存的条目原文数
+ENTRY_CACHE_SIZE = 20000
+
+# 重新索引文件时每批写入倒排记录的条目数
+INDEX_BATCH = 1000
+
+# 倒排桶未排序的尾部超过这么多字节、且超过已排序部分的 1/SORT_TAIL_RATIO 时重新排序
+SORT_TAIL_BYTES = 64 * 1024
+SORT_TAIL_RATIO = 8
+
+# 已排序倒排桶的首行，定长，记录已排序部分的结束位置
+_SORTED_HEADER = re.compile(rb'#sorted (\d{12})\n')
+_SORTED_HEADER_LEN = len(b'#sorted 000000000000\n')
+
+
+def _is_ascii_term(term: str) -> bool:
+    return term[0] < '\u0080'
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分文本为索引词项
+
+    ASCII 按单词切分；CJK 没有空格分词，按单字 + 相邻双字切分。
+    """
+    terms = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _is_ascii_term(run):
+            terms.append(run)
+            continue
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(query: str) -> List[str]:
+    """
+    提取用于过滤候选条目的最小词项集合
+
+    CJK 片段只取双字（单字片段取单字），任何包含该片段的条目必然包含这些双字；
+    ASCII 单词按子串匹配，"sql" 命中 "postgresql"，与全量扫描的结果一致。
+    """
+    terms = []
+    for run in _TOKEN_PATTERN.findall(query.lower()):
+        if _is_ascii_term(run) or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def _bucket(term: str) -> str:
+    """按首字符分桶"""
+    first = term[0]
+    if _is_ascii_term(first):
+        return first
+    return f"u{ord(first) & 0xff:02x}"
+
+
+def _sorted_range(buffer: Buffer) -> Tuple[int, int]:
+    """桶文件中已排序部分的 (起点, 终点)；没有排序头部时整个文件都是追加的尾部"""
+    match = _SORTED_HEADER.match(buffer[:_SORTED_HEADER_LEN])
+    if not match:
+        return 0, 0
+    return _SORTED_HEADER_LEN, int(match.group(1))
+
+
+def _seek_sorted(buffer: Buffer, key: bytes, lo: int, hi: int) -> int:
+    """在 [lo, hi) 的有序行中二分查找第一个不小于 key 的行首"""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = buffer.rfind(b'\n', lo, mid) + 1 or lo
+        end = buffer.find(b'\n', start, hi)
+        if buffer[start:end] < key:
+            lo = end + 1
+        else:
+            hi = start
+    return lo
+
+
+def _prefixed_lines(buffer: Buffer, key: bytes, start: int, stop: int) -> Iterator[bytes]:
+    """[start, stop) 中以 key 开头的完整行，start 须为行首"""
+    end = buffer.find(b'\n', start, stop)
+    if end >= 0 and buffer[start:start + len(key)] == key:
+        yield buffer[start:end]
+    needle = b'\n' + key
+    pos = start
+    while True:
+        hit = buffer.find(needle, pos, stop)
+        if hit < 0:
+            return
+        end = buffer.find(b'\n', hit + 1, stop)
+        if end < 0:
+            return
+        yield buffer[hit + 1:end]
+        pos = end
+
+
+class EntrySpan(NamedTuple):
+    """日志中的一个条目"""
+    offset: int       # 字节偏移
+    length: int       # 字节长度
+    date: str
+    time: str
+    category: str
+    body: str         # 空行之后到 --- 分隔行之前的正文
+    text: str         # 条目原文（头部 + 空行 + 正文）
+
+
+def iter_entry_spans(source: Union[bytes, Iterable[bytes]], start: int = 0,
+                     end: Optional[int] = None) -> Iterator[EntrySpan]:
+    """
+    逐行流式解析条目
+
+    条目为头部行 + 空行 + 正文，正文到下一个以 --- 开头的行（或文件末尾）为止，
+    其间出现的头部行属于正文。每次只在内存中保留当前条目的行。
+
+    Args:
+        source: 文件内容或按行迭代的二进制文件对象
+        start: source 第一行在文件中的字节偏移
+        end: 只解析到此字节偏移为止（例如已索引的文件大小）
+    """
+    lines = source.splitlines(keepends=True) if isinstance(source, bytes) else source
+    pos = start
+    header = None    # 等待空行的头部 (偏移, 匹配, 头部字节)
+    entry = None     # 正文收集中的 [头部, 正文起点, 正文行]
+
+    for line in lines:
+        if end is not None:
+            if pos >= end:
+                break
+            line = line[:end - pos]
+        line_start = pos
+        pos += len(line)
+
+        if entry is not None:
+            # 正文至少一个字节，紧接空行的 --- 行不结束条目
+            if line.startswith(b'---') and line_start - 1 > entry[1]:
+                yield _entry_span(entry[0], b''.join(entry[2])[:-1])
+                entry = None
+            else:
+                entry[2].append(line)
+            continue
+
+        if header is not None:
+            if line == b'\n':
+                entry = [header, pos, []]
+                header = None
+                continue
+            header = None
+
+        if b'##' in line:
+            text = line.decode('utf-8', errors='replace')
+            match = _HEADER_PATTERN.search(text)
+            if match:
+                offset = line_start + len(text[:match.start()].encode('utf-8'))
+                header = (offset, match, line[offset - line_start:])
+
+    if entry is not None and entry[2]:
+        yield _entry_span(entry[0], b''.join(entry[2]))
+
+
+def iter_mapped_spans(buffer: Buffer, matcher: Optional[ByteMatcher] = None,
+                      start: int = 0, end: Optional[int] = None) -> Iterator[EntrySpan]:
+    """
+    在文件原文（通常是内存映射）上按字节定位条目，只为命中 matcher 的条目构建 EntrySpan
+
+    与 iter_entry_spans 的切分规则一致，但不逐行迭代：用 find 跳到下一个含 ## 的行
+    与下一个 --- 行，只解码头部行；不命中的条目不产生任何副本。
+
+    Args:
+        buffer: 文件原文，bytes 或 mmap
+        matcher: 字节匹配器（见 bytescan.py），None 表示全部条目
+        start: 开始解析的字节偏移，须为行首
+        end: 只解析到此字节偏移为止
+    """
+    end = len(buffer) if end is None else min(end, len(buffer))
+    pos = start
+    hit = -1
+    if matcher is not None:
+        hit = matcher.search(buffer, pos, end)
+        if hit == -1:
+            return
+
+    while pos < end:
+        mark = buffer.find(b'##', pos, end)
+        if mark == -1:
+            return
+        line_start = buffer.rfind(b'\n', pos, mark) + 1 or pos
+        line_end = buffer.find(b'\n', mark, end) + 1 or end
+        pos = line_end
+        # 头部行之后须紧跟空行
+        if buffer[line_end:line_end + 1] != b'\n' or line_end >= end:
+            continue
+        text = buffer[line_start:line_end].decode('utf-8', errors='replace')
+        match = _HEADER_PATTERN.search(text)
+        if not match:
+            continue
+
+        # 正文到下一个 --- 行为止；紧接空行的 --- 行不结束条目
+        body_start = line_end + 1
+        stop = buffer.find(b'\n---', body_start, end)
+        if stop == body_start:
+            stop = buffer.find(b'\n---', body_start + 1, end)
+        if stop == -1:
+            if body_start >= end:
+                return
+            stop = pos = end
+        else:
+            pos = buffer.find(b'\n', stop + 1, end) + 1 or end
+
+        offset = line_start + len(text[:match.start()].encode('utf-8'))
+        if matcher is not None:
+            if hit >= stop:
+                continue
+            if hit < offset:
+                hit = matcher.search(buffer, offset, stop)
+            if hit == -1 or hit >= stop:
+                # 条目内没有命中，从下一条开始找
+                hit = matcher.search(buffer, pos, end)
+                if hit == -1:
+                    return
+                continue
+        yield _entry_span((offset, match, buffer[offset:line_end]),
+                          buffer[body_start:stop])
+        if matcher is not None:
+            hit = matcher.search(buffer, pos, end)
+            if hit == -1:
+                return
+
+
+def _entry_span(header: Tuple[int, re.Match, bytes], body: bytes) -> EntrySpan:
+    offset, match, header_bytes = header
+    raw = header_bytes + b'\n' + body
+    return EntrySpan(offset, len(raw), match.group(1), match.group(2), match.group(3),
+                     body.decode('utf-8', errors='replace'),
+                     raw.decode('utf-8', errors='replace'))
+
+
+class InvertedIndex:
+    """记忆倒排索引"""
+
+    def __init__(self, memory_dir: str = "memory", cache: bool = False):
+        """
+        Args:
+            memory_dir: 记忆目录
+            cache: 在内存中保留已读入的倒排桶和最近读取的条目原文（常驻进程使用）
+        """
+        self.memory_dir = Path(memory_dir)
+        self.index_dir = self.memory_dir / ".index"
+        self.postings_dir = self.index_dir / "postings"
+        self.meta_file = self.index_dir / "meta.json"
+        self.vocab_file = self.index_dir / "vocab.txt"
+        self._meta = None
+        self._meta_stamp = None
+        self._buckets = {} if cache else None
+        self._entries = OrderedDict() if cache else None
+        self._vocab = None
+
+    @property
+    def meta(self) -> Dict:
+        if self._meta is None:
+            self._meta_stamp = self._stamp()
+            if self.meta_file.exists():
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    self._meta = json.load(f)
+            if not self._meta or self._meta.get("version") != INDEX_VERSION:
+                self._reset()
+        return self._meta
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        """元数据文件的 (inode, mtime)；每次保存都经 os.replace 换成新文件"""
+        try:
+            stat = self.meta_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _reset(self):
+        """清空倒排记录与元数据"""
+        if self.postings_dir.exists():
+            for bucket_file in self.postings_dir.glob("*.tsv"):
+                bucket_file.unlink()
+        if self.vocab_file.exists():
+            self.vocab_file.unlink()
+        self._vocab = None
+        # 纪元标识一次完整重建，依附于倒排索引代数的其他索引据此判断是否失效
+        self._meta = {"version": INDEX_VERSION, "epoch": uuid.uuid4().hex, "files": {}}
+
+    def reload(self):
+        """丢弃缓存的元数据，下次访问时重新读取（其他进程可能已更新）"""
+        self._meta = None
+
+    def refresh(self):
+        """元数据文件自上次读取后被其他进程替换过时才重新读取"""
+        if self._meta is not None and self._stamp() != self._meta_stamp:
+            self.reload()
+
+    def save_meta(self):
+        self.index_dir.mkdir(exist_ok=True)
+        tmp_file = self.meta_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_file, self.meta_file)
+        self._meta_stamp = self._stamp()
+
+    def _append_postings(self, name: str, gen: int, spans: List[EntrySpan]):
+        """写入一批条目的倒排记录"""
+        lines = defaultdict(list)
+        words = set()
+        for span in spans:
+            terms = tokenize(span.text)
+            chars = len(plain_content(span.body))
+            for term, tf in Counter(terms).items():
+                lines[_bucket(term)].append(
+                    f"{term}\t{name}\t{gen}\t{span.offset}\t{span.length}\t{tf}"
+                    f"\t{len(terms)}\t{chars}\n")
+                if _is_ascii_term(term):
+                    words.add(term)
+
+        self.postings_dir.mkdir(parents=True, exist_ok=True)
+        for bucket, bucket_lines in lines.items():
+            with open(self.postings_dir / f"{bucket}.tsv", 'a', encoding='utf-8') as f:
+                f.writelines(bucket_lines)
+
+        # 词表只追加，重复的词项留给 compact 去重
+        if self._vocab is not None:
+            words -= self._vocabulary()
+        if words:
+            with open(self.vocab_file, 'a', encoding='utf-8') as f:
+                f.writelines(f"{word}\n" for word in sorted(words))
+
+    def add_entries(self, memory_file: Path, spans: List[EntrySpan],
+                    size_before: int, save: bool = True):
+        """
+        记录 capture 刚追加的条目，倒排记录每个分桶只写一次
+
+        Args:
+            memory_file: 日志文件
+            spans: 刚追加的条目
+            size_before: 追加前的文件大小，用于判断索引是否与文件一致
+            save: 是否立即保存元数据；批量写入多个文件时由调用方最后统一 save_meta
+        """
+        name = memory_file.name
+        info = self.meta["files"].get(name)
+
+        if size_before == 0:
+            gen = info["gen"] + 1 if info else 0
+            info = {"size": 0, "mtime": 0, "gen": gen, "entries": 0, "tokens": 0}
+            self.meta["files"][name] = info
+        elif not info or info["size"] != size_before:
+            # 文件在索引之外被修改过，留给 sync 整体重建
+            return
+
+        self._append_postings(name, info["gen"], spans)
+
+        stat = memory_file.stat()
+        info["size"] = stat.st_size
+        info["mtime"] = stat.st_mtime
+        info["ino"] = stat.st_ino
+        info["entries"] += len(spans)
+        info["tokens"] += sum(len(tokenize(span.text)) for span in spans)
+        if save:
+            self.save_meta()
+
+    def _index_file(self, memory_file: Path):
+        """重新索引整个文件，旧代数的倒排记录随之失效"""
+        name = memory_file.name
+        old = self.meta["files"].get(name)
+        gen = old["gen"] + 1 if old else 0
+        if old:
+            self.meta["stale"] = self.meta.get("stale", 0) + old["entries"]
+
+        stat = memory_file.stat()
+        entries = 0
+        tokens = 0
+        spans = []
+        with open(memory_file, 'rb') as f:
+            for span in iter_entry_spans(f):
+                spans.append(span)
+                entries += 1
+                tokens += len(tokenize(span.text))
+                # 分批写入倒排记录，大文件也不必在内存中保留全部条目
+                if len(spans) >= INDEX_BATCH:
+                    self._append_postings(name, gen, spans)
+                    spans = []
+            size = f.tell()
+        self._append_postings(name, gen, spans)
+
+        self.meta["files"][name] = {
+            "size": size,
+            "mtime": stat.st_mtime,
+            "ino": stat.st_ino,
+            "gen": gen,
+            "entries": entries,
+            "tokens": tokens,
+        }
+
+    def memory_files(self) -> List[Path]:
+        return [p for p in self.memory_dir.glob("*.md") if p.name not in SKIP_FILES]
+
+    def changed(self) -> bool:
+        """是否有日志文件在索引之外新增、修改或删除，只做 stat，不写入"""
+        files = self.memory_files()
+        indexed = self.meta["files"]
+        if len(files) != len(indexed):
+            return True
+        for memory_file in files:
+            info = indexed.get(memory_file.name)
+            try:
+                stat = memory_file.stat()
+            except FileNotFoundError:
+                return True
+            if not info or info["size"] != stat.st_size or info["mtime"] != stat.st_mtime:
+                return True
+        return False
+
+    def sync(self) -> int:
+        """
+        索引新增或在外部被修改的文件
+
+        Returns:
+            重新索引的文件数
+        """
+        m = metrics.current()
+        files = self.memory_files()
+        present = {p.name for p in files}
+        changed = 0
+
+        for memory_file in files:
+            info = self.meta["files"].get(memory_file.name)
+            stat = memory_file.stat()
+            if info and info["size"] == stat.st_size and info["mtime"] == stat.st_mtime:
+                continue
+            m.lap('glob')
+            self._index_file(memory_file)
+            m.add('files_indexed')
+            m.add('bytes_indexed', stat.st_size)
+            m.lap('index')
+            changed += 1
+
+        removed = [name for name in self.meta["files"] if name not in present]
+        for name in removed:
+            self.meta["stale"] = self.meta.get("stale", 0) + self.meta["files"][name]["entries"]
+            del self.meta["files"][name]
+
+        m.lap('glob')
+        if changed or removed:
+            self.save_meta()
+            m.lap('index')
+        return changed
+
+    def rebuild(self):
+        """丢弃全部倒排记录并重建，用于整合后压缩索引"""
+        self._reset()
+        for memory_file in self.memory_files():
+            self._index_file(memory_file)
+        self.save_meta()
+
+    def compact(self, ratio: float = 0.5) -> bool:
+        """
+        增量同步；失效的倒排记录超过有效条目的 ratio 倍时才整体重建
+
+        Returns:
+            是否进行了整体重建
+        """
+        self.sync()
+        total_docs, _ = self.stats()
+        rebuilt = self.meta.get("stale", 0) > total_docs * ratio
+        if rebuilt:
+            self.rebuild()
+        self.sort_postings(force=rebuilt)
+        self._compact_vocabulary()
+        return rebuilt
+
+    def _vocabulary(self) -> set:
+        """
+        出现过的 ASCII 词项集合（只增不减，可能含已失效的词项）
+
+        词表在两次 compact 之间只追加，之后只读入新增的完整行；被替换或变短时整体重读。
+        """
+        try:
+            stat = self.vocab_file.stat()
+        except FileNotFoundError:
+            self._vocab = None
+            return set()
+        cached = self._vocab
+        if cached is None or cached[0] != stat.st_ino or stat.st_size < cached[1]:
+            cached = self._vocab = [stat.st_ino, 0, set()]
+        if stat.st_size > cached[1]:
+            with open(self.vocab_file, 'rb') as f:
+                f.seek(cached[1])
+                data = f.read(stat.st_size - cached[1])
+            # 并发写入中的半行留到下次再读
+            end = data.rfind(b"\n") + 1
+            cached[2].update(data[:end].decode('utf-8').split())
+            cached[1] += end
+        return cached[2]
+
+    def _compact_vocabulary(self):
+        """词表中有重复行时排序去重后整体替换，调用方持有写锁"""
+        if not self.vocab_file.exists():
+            return
+        with open(self.vocab_file, 'r', encoding='utf-8') as f:
+            lines = f.read().split()
+        words = sorted(set(lines))
+        if len(words) == len(lines):
+            return
+        tmp_file = self.vocab_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.writelines(f"{word}\n" for word in words)
+        os.replace(tmp_file, self.vocab_file)
+
+    def sort_postings(self, force: bool = False) -> int:
+        """
+        重新排序未排序尾部过大的倒排桶，顺带丢弃失效代数的倒排记录
+
+        调用方持有写锁；排序后的桶经临时文件 + os.replace 换入，正在读取旧桶的进程不受影响。
+
+        Args:
+            force: 尾部非空的桶全部排序（整体重建之后）
+
+        Returns:
+            排序的桶数
+        """
+        if not self.postings_dir.exists():
+            return 0
+        files = self.meta["files"]
+        sorted_count = 0
+        for bucket_file in self.postings_dir.glob("*.tsv"):
+            with open(bucket_file, 'rb') as f:
+                data = f.read()
+            start, end = _sorted_range(data)
+            tail = len(data) - end
+            if tail <= 0 or (not force and tail <= max(SORT_TAIL_BYTES, end // SORT_TAIL_RATIO)):
+                continue
+
+            rows = []
+            for line in data[start:].splitlines(keepends=True):
+                fields = line.split(b'\t', 3)
+                if len(fields) < 4 or not line.endswith(b'\n'):
+                    continue
+                info = files.get(fields[1].decode('utf-8'))
+                if info and info["gen"] == int(fields[2]):
+                    rows.append(line)
+            rows.sort()
+
+            body = b''.join(rows)
+            tmp_file = bucket_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(b'#sorted %012d\n' % (_SORTED_HEADER_LEN + len(body)))
+                f.write(body)
+            os.replace(tmp_file, bucket_file)
+            sorted_count += 1
+        return sorted_count
+
+    def _posting_rows(self, term: str) -> Iterable[List[str]]:
+        """词项（ASCII 词项含子串展开）的全部倒排行，未校验代数"""
+        if not _is_ascii_term(term):
+            words = [term]
+        else:
+            words = sorted(word for word in self._vocabulary() if term in word)
+        by_bucket = defaultdict(list)
+        for word in words:
+            by_bucket[_bucket(word)].append(word)
+
+        for bucket, bucket_words in by_bucket.items():
+            if self._buckets is not None:
+                rows = self._cached_bucket(bucket)
+                for word in bucket_words:
+                    yield from rows.get(word, ())
+            else:
+                yield from self._bucket_rows(bucket, bucket_words)
+
+    def _bucket_rows(self, bucket: str, words: List[str]) -> Iterator[List[str]]:
+        """从桶文件中读取给定词项（已排序）的倒排行"""
+        bucket_file = self.postings_dir / f"{bucket}.tsv"
+        if not bucket_file.exists():
+            return
+        # 词项连同分隔符一起比较；并发追加中的半行不读
+        keys = [word.encode('utf-8') + b'\t' for word in words]
+        with mapped(bucket_file) as buffer:
+            start, end = _sorted_range(buffer)
+            pos = start
+            for key in keys:
+                pos = _seek_sorted(buffer, key, pos, end)
+                while pos < end:
+                    line_end = buffer.find(b'\n', pos, end)
+                    if buffer[pos:pos + len(key)] != key:
+                        break
+                    yield buffer[pos:line_end].decode('utf-8').split('\t')
+                    pos = line_end + 1
+
+            tail_start = max(end, start)
+            tail_end = buffer.rfind(b'\n', tail_start) + 1
+            if len(keys) == 1:
+                for line in _prefixed_lines(buffer, keys[0], tail_start, tail_end):
+                    yield line.decode('utf-8').split('\t')
+                return
+            wanted = set(words)
+            for line in buffer[tail_start:tail_end].decode('utf-8').splitlines():
+                row = line.split('\t')
+                if row[0] in wanted:
+                    yield row
+
+    def _cached_bucket(self, bucket: str) -> Dict[str, List[List[str]]]:
+        """
+        倒排桶的内存副本 {词项: [倒排行]}
+
+        桶文件在两次排序之间只追加，之后只读入新增的完整行；
+        重建或重新排序后（纪元或 inode 变化、文件变短）整体重读。
+        """
+        bucket_file = self.postings_dir / f"{bucket}.tsv"
+        try:
+            stat = bucket_file.stat()
+        except FileNotFoundError:
+            self._buckets.pop(bucket, None)
+            return {}
+        size = stat.st_size
+
+        cached = self._buckets.get(bucket)
+        epoch = self.meta.get("epoch")
+        if (cached is None or cached["epoch"] != epoch or cached["ino"] != stat.st_ino
+                or size < cached["size"]):
+            cached = {"epoch": epoch, "ino": stat.st_ino, "size": 0, "terms": defaultdict(list)}
+            self._buckets[bucket] = cached
+
+        if size > cached["size"]:
+            with open(bucket_file, 'rb') as f:
+                f.seek(cached["size"])
+                data = f.read(size - cached["size"])
+            # 并发写入中的半行留到下次再读
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                if line.startswith('#'):
+                    continue
+                row = line.split('\t')
+                cached["terms"][row[0]].append(row)
+            cached["size"] += end
+        return cached["terms"]
+
+    def _postings(self, term: str) -> Dict[Tuple[str, int], List[int]]:
+        """
+        读取词项的有效倒排记录：{(文件, 偏移): [长度, 词频, 条目词数, 内容字符数]}
+
+        ASCII 词项按子串匹配，同一条目命中多个展开词时词频累加。
+        """
+        files = self.meta["files"]
+        postings = {}
+        for _, name, gen, offset, length, tf, dl, chars in self._posting_rows(term):
+            info = files.get(name)
+            if not info or info["gen"] != int(gen):
+                continue
+            key = (name, int(offset))
+            if key in postings:
+                postings[key][1] += int(tf)
+            else:
+                postings[key] = [int(length), int(tf), int(dl), int(chars)]
+        return postings
+
+    def _match(self, terms: List[str]) -> Tuple[Dict, List[Dict]]:
+        """求同时包含全部词项的候选条目，并返回各词项的倒排记录"""
+        candidates = None
+        term_postings = []
+        for term in terms:
+            postings = self._postings(term)
+            term_postings.append(postings)
+            if candidates is None:
+                candidates = dict(postings)
+            else:
+                candidates = {k: v for k, v in candidates.items() if k in postings}
+            if not candidates:
+                return {}, term_postings
+        return candidates, term_postings
+
+    def lookup(self, query: str) -> Optional[List[Tuple[str, int, int, int]]]:
+        """
+        查找可能匹配查询的条目
+
+        Returns:
+            (文件名, 偏移, 长度, 内容字符数) 列表，按文件名倒序、偏移正序；
+            查询不含可索引词项时返回 None，调用方应退回全量扫描
+        """
+        terms = query_terms(query)
+        if not terms:
+            return None
+
+        candidates, _ = self._match(terms)
+        results = sorted((name, offset, posting[0], posting[3])
+                         for (name, offset), posting in candidates.items())
+        results.sort(key=lambda c: c[0], reverse=True)
+        return results
+
+    def plan(self, query: BooleanQuery) -> Optional[Dict[Tuple[str, int], List[int]]]:
+        """
+        布尔查询的候选条目：各词项的候选按 AND 求交、按 OR 求并
+
+        Returns:
+            {(文件名, 偏移): [长度, 词频, 条目词数, 内容字符数]}；无法用索引缩小范围时返回 None
+        """
+        def leaf(text):
+            terms = query_terms(text)
+            return self._match(terms)[0] if terms else None
+
+        return query.reduce(leaf, intersect, union)
+
+    def score(self, candidates: Dict[Tuple[str, int], List[int]], query: str,
+              half_life: Optional[float] = None) -> List[Tuple[float, Tuple]]:
+        """
+        按 query 的词项为给定候选计算 BM25 得分，候选不含的词项计 0
+
+        Returns:
+            (得分, (文件名, 偏移, 长度, 内容字符数)) 列表（无序）
+        """
+        total_docs, avg_doc_len = self.stats()
+        term_postings = [self._postings(term) for term in query_terms(query)]
+        scored = []
+        for (name, offset), (length, _, doc_len, chars) in candidates.items():
+            score = sum(bm25(postings[(name, offset)][1], len(postings), doc_len,
+                             total_docs, avg_doc_len)
+                        for postings in term_postings if (name, offset) in postings)
+            score *= recency_weight(Path(name).stem, half_life)
+            scored.append((score, (name, offset, length, chars)))
+        return scored
+
+    def stats(self) -> Tuple[int, float]:
+        """全库条目数与平均条目词数"""
+        files = self.meta["files"].values()
+        total_docs = sum(info["entries"] for info in files)
+        total_tokens = sum(info["tokens"] for info in files)
+        return total_docs, (total_tokens / total_docs if total_docs else 0.0)
+
+    def ranked(self, query: str, half_life: Optional[float] = None, extra=None
+               ) -> Optional[List[Tuple[float, Tuple]]]:
+        """
+        为候选条目计算 BM25 得分，只使用倒排记录中的统计量，不读取日志
+
+        Args:
+            query: 查询
+            half_life: 新近度半衰期（天），None 表示不衰减
+            extra: 归档层的检索结果 (segments.ColdMatches)，其条目数、词数与文档频率
+                   计入统计量，命中条目与近期条目一起打分
+
+        Returns:
+            (得分, 键) 列表（无序），近期条目的键为 (文件名, 偏移, 长度, 内容字符数)，
+            归档条目的键为 ColdHit.key；查询不含可索引词项时返回 None
+        """
+        terms = query_terms(query)
+        if not terms:
+            return None
+
+        candidates, term_postings = self._match(terms)
+        total_docs, avg_doc_len = self.stats()
+        doc_freqs = [len(postings) for postings in term_postings]
+
+        if extra is not None:
+            total_tokens = avg_doc_len * total_docs + extra.tokens
+            total_docs += extra.docs
+            avg_doc_len = total_tokens / total_docs if total_docs else 0.0
+            # 近期候选为空时 _match 提前返回，归档命中仍需要全部词项的文档频率
+            if extra.hits:
+                doc_freqs.extend(len(self._postings(term)) for term in terms[len(doc_freqs):])
+            doc_freqs = [df + extra.doc_freqs.get(term, 0)
+                         for term, df in zip(terms, doc_freqs)]
+
+        scored = []
+        for (name, offset), (length, _, doc_len, chars) in candidates.items():
+            score = sum(bm25(postings[(name, offset)][1], df, doc_len,
+                             total_docs, avg_doc_len)
+                        for postings, df in zip(term_postings, doc_freqs))
+            score *= recency_weight(Path(name).stem, half_life)
+            scored.append((score, (name, offset, length, chars)))
+
+        for hit in (extra.hits if extra is not None else ()):
+            score = sum(bm25(hit.tfs[term], df, hit.doc_len, total_docs, avg_doc_len)
+                        for term, df in zip(terms, doc_freqs))
+            score *= recency_weight(hit.span.date, half_life)
+            scored.append((score, hit.key))
+        return scored
+
+    def _open_indexed(self, name: str):
+        """
+        打开索引所对应的那个日志文件；文件已被删除或经 os.replace 换成新文件时返回 None
+
+        追加写入不改变已有条目的偏移，只有整体改写才会换 inode。
+        """
+        try:
+            handle = open(self.memory_dir / name, 'rb')
+        except FileNotFoundError:
+            return None
+        info = self.meta["files"].get(name)
+        if info and info.get("ino") not in (None, os.fstat(handle.fileno()).st_ino):
+            handle.close()
+            return None
+        return handle
+
+    def read_entry(self, name: str, offset: int, length: int,
+                   matcher: Optional[ByteMatcher] = None) -> str:
+        """按位置读取单个条目原文"""
+        for _, text in self.read_entries([(name, offset, length)], matcher):
+            return text
+        return ""
+
+    def read_entries(self, candidates: Iterable[Tuple[str, int, int]],
+                     matcher: Optional[ByteMatcher] = None) -> Iterable[Tuple[str, str]]:
+        """
+        按位置读取条目原文，返回 (文件名, 文本)；同一文件只打开一次
+
+        Args:
+            candidates: (文件名, 偏移, 长度)
+            matcher: 字节匹配器，原文不含查询的条目直接跳过，不解码
+        """
+        m = metrics.current()
+        handle = None
+        handle_name = None
+        try:
+            for name, offset, length in candidates:
+                key = None
+                if self._entries is not None:
+                    # 文件被改写后代数递增，旧缓存自然失效
+                    info = self.meta["files"].get(name)
+                    key = (name, info["gen"] if info else -1, offset, length)
+                    text = self._entries.get(key)
+                    if text is not None:
+                        self._entries.move_to_end(key)
+                        m.add('entries_cached')
+                        m.lap('read')
+                        yield name, text
+                        continue
+
+                if name != handle_name:
+                    if handle:
+                        handle.close()
+                    handle = self._open_indexed(name)
+                    handle_name = name
+                    m.add('files_scanned')
+                if handle is None:
+                    # 文件在查找之后被整合改写或归档，倒排记录的偏移已不可信
+                    m.add('entries_stale')
+                    continue
+                handle.seek(offset)
+                raw = handle.read(length)
+                m.add('bytes_scanned', length)
+                if matcher is not None and matcher.search(raw) == -1:
+                    m.lap('read')
+                    continue
+                text = raw.decode('utf-8', errors='replace')
+
+                if key is not None:
+                    self._entries[key] = text
+                    if len(self._entries) > ENTRY_CACHE_SIZE:
+                        self._entries.popitem(last=False)
+                m.lap('read')
+                yield name, text
+        finally:
+            if handle:
+                handle.close()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+记忆索引日志
+capture 以 JSON Lines 追加写入 index.jsonl，consolidate 定期将其压缩进 index.json 快照；
+consolidate 删除或归档条目时追加删除记录，压缩时从快照中去掉对应的条目
+
+并发:
+    所有写操作都持有 memory/.lock 上的独占咨询锁，多个 Agent 进程并行 capture 不会丢条目
+"""
+
+import os
+import json
+from itertools import chain
+from collections import defaultdict
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """基于锁文件的进程间独占锁，可重入"""
+
+    def __init__(self, lock_file: Path):
+        self.lock_file = Path(lock_file)
+        self._handle = None
+        self._depth = 0
+
+    def acquire(self):
+        if self._depth == 0:
+            self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = open(self.lock_file, 'a+b')
+            if fcntl:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+            else:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if fcntl:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self._handle.seek(0)
+            msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        self._handle.close()
+        self._handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def memory_lock(memory_dir: str) -> FileLock:
+    """记忆目录的写锁"""
+    return FileLock(Path(memory_dir) / ".lock")
+
+
+class IndexJournal:
+    """index.json 快照 + index.jsonl 追加日志"""
+
+    def __init__(self, memory_dir: str = "memory", lock: Optional[FileLock] = None):
+        self.memory_dir = Path(memory_dir)
+        self.snapshot_file = self.memory_dir / "index.json"
+        self.journal_file = self.memory_dir / "index.jsonl"
+        self.lock = lock or memory_lock(memory_dir)
+
+    def append(self, record: Dict):
+        """追加一条索引记录，耗时与已有记录数无关"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict]):
+        """一次写入追加多条索引记录"""
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self.lock:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def remove(self, entries: List[Dict]):
+        """追加条目的删除记录，按 日期/时间/分类 对应快照中的条目"""
+        self.append_many([{"op": "remove", "date": entry['date'], "time": entry['time'],
+                           "category": entry['category']} for entry in entries])
+
+    def remove_dates(self, dates: List[str]):
+        """追加整天的删除记录（日志已归档）"""
+        self.append_many([{"op": "remove", "date": date} for date in dates])
+
+    @staticmethod
+    def _apply(entries: List[Dict], records: List[Dict]) -> List[Dict]:
+        """按顺序应用日志记录：普通记录追加，删除记录去掉一条对应的已有记录"""
+        merged = []
+        by_date = defaultdict(list)
+        for record in chain(entries, records):
+            if record.get("op") != "remove":
+                by_date[record.get("date")].append(len(merged))
+                merged.append(record)
+                continue
+
+            day = by_date.get(record.get("date"))
+            if not day:
+                continue
+            if "category" not in record:
+                for i in day:
+                    merged[i] = None
+                day.clear()
+                continue
+
+            # 旧版本的记录没有时间，只按分类对应
+            category = record["category"].upper()
+            for pos, i in enumerate(day):
+                entry = merged[i]
+                if (entry.get("category", "").upper() == category
+                        and entry.get("time", record.get("time")) == record.get("time")):
+                    merged[i] = None
+                    del day[pos]
+                    break
+        return [entry for entry in merged if entry is not None]
+
+    def _load_snapshot(self) -> Dict:
+        if not self.snapshot_file.exists():
+            return {"entries": []}
+        with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        snapshot.setdefault("entries", [])
+        return snapshot
+
+    def _load_journal(self) -> List[Dict]:
+        if not self.journal_file.exists():
+            return []
+        records = []
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 进程崩溃留下的半行，压缩时丢弃
+                    continue
+        return records
+
+    def entries(self) -> List[Dict]:
+        """快照与日志中的全部索引记录"""
+        return self._apply(self._load_snapshot()["entries"], self._load_journal())
+
+    def compact(self, files: Optional[List[Dict]] = None) -> int:
+        """
+        将日志合并进快照并清空日志
+
+        Args:
+            files: 文件级统计，提供时一并写入快照
+
+        Returns:
+            合并的日志记录数
+        """
+        with self.lock:
+            snapshot = self._load_snapshot()
+            records = self._load_journal()
+            snapshot["entries"] = self._apply(snapshot["entries"], records)
+            snapshot["last_updated"] = datetime.now().isoformat()
+            if files is not None:
+                snapshot["total_files"] = len(files)
+                snapshot["files"] = files
+
+            tmp_file = self.snapshot_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.snapshot_file)
+
+            with open(self.journal_file, 'w', encoding='utf-8'):
+                pass
+
+        return len(records)
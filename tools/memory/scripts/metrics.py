@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+记忆计量
+记录 capture / recall / consolidate 每次执行的分阶段耗时、扫描的文件与字节数、
+检查与返回的条目数，写入 JSON Lines 指标文件，或汇总为 Prometheus 文本格式
+
+阶段以计时点划分：lap(阶段) 把距上一个计时点的耗时计入该阶段，各阶段互不重叠，
+未计入任何阶段的耗时记为 other。流式读取的日志边读边解析，读取耗时计入 parse。
+
+阶段:
+    glob     列目录、比对文件指纹
+    index    重新索引外部修改过的文件
+    lookup   读取倒排表与归档词项字典、打分排序
+    read     读取日志条目、解压归档块
+    parse    解析条目
+    match    条件校验、查重比对
+    write    写入日志、倒排记录与日志索引
+
+计数:
+    files_scanned     打开读取的日志文件/归档块数
+    bytes_scanned     读取的日志字节数（归档块按压缩后大小）
+    entries_examined  解析并校验的条目数
+    entries_returned  回忆返回的条目数
+    entries_cached    守护进程条目缓存命中数
+    entries_stale     因日志被并发改写而跳过的倒排候选与待删除条目数
+    entries_written   捕获写入的条目数，bytes_written 为写入字节数
+    files_indexed     重新索引的文件数，bytes_indexed 为其字节数
+
+经守护进程转发时，客户端记录的是往返耗时（阶段 rpc），守护进程以 --metrics 启动时另行记录服务端明细。
+
+用法:
+    python recall.py "数据库" --metrics                  # 追加到 memory/.index/metrics.jsonl
+    python metrics.py summary --memory-dir memory        # 各操作 p50/p99、阶段耗时与目录规模
+    python metrics.py prom --memory-dir memory > memory.prom
+    python server.py --metrics-port 9108                 # 守护进程在 /metrics 提供实时指标
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Iterable, Iterator
+
+
+METRICS_FILE = "metrics.jsonl"
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0]
+
+
+def metrics_file(memory_dir: str) -> Path:
+    """默认的指标文件位置"""
+    return Path(memory_dir) / ".index" / METRICS_FILE
+
+
+def log_sinks(memory_dir: str, option: Optional[str]) -> List:
+    """
+    命令行 --metrics [FILE] 对应的 sink 列表
+
+    Args:
+        option: None 表示未开启；空字符串表示使用默认指标文件
+    """
+    if option is None:
+        return []
+    return [MetricsLog(option or metrics_file(memory_dir))]
+
+
+class Metrics:
+    """单次操作的计量"""
+
+    enabled = True
+
+    def __init__(self, op: str):
+        self.op = op
+        self.phases = defaultdict(float)
+        self.counters = Counter()
+        self.error = None
+        self._start = self._mark = time.perf_counter()
+        self.seconds = 0.0
+
+    def lap(self, phase: str):
+        """把距上一个计时点的耗时计入 phase"""
+        now = time.perf_counter()
+        self.phases[phase] += now - self._mark
+        self._mark = now
+
+    def add(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        other = self.seconds - sum(self.phases.values())
+        if other > 0:
+            self.phases["other"] += other
+
+    def record(self) -> Dict:
+        record = {
+            "op": self.op,
+            "ts": round(time.time(), 3),
+            "seconds": round(self.seconds, 6),
+            "phases": {k: round(v, 6) for k, v in sorted(self.phases.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class _Disabled:
+    """未开启计量时的空实现，埋点只付出一次方法调用"""
+
+    enabled = False
+
+    def lap(self, phase: str):
+        pass
+
+    def add(self, counter: str, n: int = 1):
+        pass
+
+
+_DISABLED = _Disabled()
+_current = _DISABLED
+
+
+def current():
+    """当前操作的计量对象；未开启时返回空实现"""
+    return _current
+
+
+@contextmanager
+def measure(op: str, sinks: Iterable = ()) -> Iterator:
+    """
+    计量一次操作，结束（含异常）时把记录交给各 sink 的 observe
+
+    没有 sink 时不计量。计量对象是进程内全局的，守护进程串行处理请求，无需区分线程。
+    """
+    global _current
+    sinks = [sink for sink in sinks if sink is not None]
+    if not sinks:
+        yield _DISABLED
+        return
+
+    previous = _current
+    m = _current = Metrics(op)
+    try:
+        yield m
+    except Exception as e:
+        m.error = type(e).__name__
+        raise
+    finally:
+        _current = previous
+        m.finish()
+        record = m.record()
+        for sink in sinks:
+            sink.observe(record)
+
+
+class MetricsLog:
+    """JSON Lines 指标文件，每次操作一行，多进程追加互不覆盖"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def observe(self, record: Dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+        # O_APPEND 单次 write，并发写入的行不会交错
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def records(self) -> Iterator[Dict]:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 被截断的最后一行
+                    continue
+
+
+class Aggregate:
+    """按操作累计的指标，渲染为 Prometheus 文本格式"""
+
+    def __init__(self, memory_dir: Optional[str] = None):
+        self.memory_dir = Path(memory_dir) if memory_dir else None
+        self._lock = threading.Lock()
+        self.ops = {}
+
+    def observe(self, record: Dict):
+        with self._lock:
+            op = self.ops.setdefault(record["op"], {
+                "count": 0, "errors": 0, "seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "phases": defaultdict(float), "counters": Counter(),
+            })
+            op["count"] += 1
+            op["errors"] += 1 if record.get("error") else 0
+            op["seconds"] += record["seconds"]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if record["seconds"] <= bound:
+                    op["buckets"][i] += 1
+            for phase, seconds in record["phases"].items():
+                op["phases"][phase] += seconds
+            op["counters"].update(record["counters"])
+
+    def render(self) -> str:
+        """Prometheus 文本格式（可供 node_exporter textfile 采集或 HTTP 抓取）"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            """samples: (指标名后缀, 标签, 值)"""
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{suffix}{{{label_str}}} {value!r}")
+
+        with self._lock:
+            ops = sorted(self.ops.items())
+            latency = []
+            for name, op in ops:
+                for bound, count in zip(LATENCY_BUCKETS, op["buckets"]):
+                    latency.append(("_bucket", (("op", name), ("le", f"{bound:g}")), count))
+                latency.append(("_bucket", (("op", name), ("le", "+Inf")), op["count"]))
+                latency.append(("_sum", (("op", name),), op["seconds"]))
+                latency.append(("_count", (("op", name),), op["count"]))
+            family("memory_operation_duration_seconds", "histogram", "操作耗时", latency)
+            family("memory_operation_errors_total", "counter", "失败的操作次数",
+                   [("", (("op", name),), op["errors"]) for name, op in ops])
+            family("memory_phase_seconds_total", "counter", "各阶段累计耗时",
+                   [("", (("op", name), ("phase", phase)), seconds)
+                    for name, op in ops for phase, seconds in sorted(op["phases"].items())])
+            counters = sorted({c for _, op in ops for c in op["counters"]})
+            for counter in counters:
+                family(f"memory_{counter}_total", "counter", counter.replace('_', ' '),
+                       [("", (("op", name),), op["counters"][counter])
+                        for name, op in ops if counter in op["counters"]])
+
+        if self.memory_dir is not None:
+            sizes = directory_size(self.memory_dir)
+            family("memory_dir_bytes", "gauge", "记忆目录各部分的字节数",
+                   [("", (("part", part),), info["bytes"]) for part, info in sizes.items()])
+            family("memory_dir_files", "gauge", "记忆目录各部分的文件数",
+                   [("", (("part", part),), info["files"]) for part, info in sizes.items()])
+        return "\n".join(lines) + "\n"
+
+
+def directory_size(memory_dir: Path) -> Dict[str, Dict[str, int]]:
+    """记忆目录规模：logs 每日日志，archive 归档段，index 索引与状态文件"""
+    sizes = {part: {"files": 0, "bytes": 0} for part in ("logs", "archive", "index")}
+    memory_dir = Path(memory_dir)
+    parts = [("logs", memory_dir.glob("*.md")),
+             ("archive", (memory_dir / "archive").glob("*")),
+             ("index", (memory_dir / ".index").rglob("*"))]
+    for part, paths in parts:
+        for path in paths:
+            if path.is_file():
+                sizes[part]["files"] += 1
+                sizes[part]["bytes"] += path.stat().st_size
+    return sizes
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数，values 须已排序"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def summarize(records: Iterable[Dict]) -> Dict[str, Dict]:
+    """按操作汇总：次数、p50/p99 耗时、各阶段平均耗时与计数合计"""
+    latencies = defaultdict(list)
+    phases = defaultdict(lambda: defaultdict(float))
+    counters = defaultdict(Counter)
+    for record in records:
+        op = record["op"]
+        latencies[op].append(record["seconds"])
+        for phase, seconds in record["phases"].items():
+            phases[op][phase] += seconds
+        counters[op].update(record["counters"])
+
+    summary = {}
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        summary[op] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+            "phases": {k: v / len(values) for k, v in sorted(phases[op].items())},
+            "counters": dict(counters[op]),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆计量')
+    parser.add_argument('command', choices=['summary', 'prom'],
+                        help='summary 汇总报告，prom 输出 Prometheus 文本格式')
+    parser.add_argument('--memory-dir', '-d', default='memory',
+                        help='记忆目录')
+    parser.add_argument('--file', '-f',
+                        help='指标文件 (默认: 记忆目录下的 .index/metrics.jsonl)')
+
+    args = parser.parse_args()
+
+    log = MetricsLog(args.file or metrics_file(args.memory_dir))
+
+    if args.command == 'prom':
+        aggregate = Aggregate(args.memory_dir)
+        for record in log.records():
+            aggregate.observe(record)
+        print(aggregate.render(), end="")
+        return
+
+    summary = summarize(log.records())
+    if not summary:
+        print(f"指标文件为空: {log.path}")
+    for op, info in summary.items():
+        print(f"{op}: {info['count']} 次  "
+              f"p50 {info['p50'] * 1000:.2f}ms  p99 {info['p99'] * 1000:.2f}ms  "
+              f"max {info['max'] * 1000:.2f}ms")
+        phases = "  ".join(f"{k} {v * 1000:.2f}ms" for k, v in info['phases'].items())
+        print(f"   平均阶段耗时: {phases}")
+        counts = "  ".join(f"{k} {v}" for k, v in sorted(info['counters'].items()))
+        if counts:
+            print(f"   累计: {counts}")
+        print()
+
+    print("记忆目录规模:")
+    for part, info in directory_size(args.memory_dir).items():
+        print(f"   {part}: {info['files']} 个文件, {info['bytes'] / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+近似重复检测
+字符 n-gram 的 MinHash 签名 + LSH 分桶，只比较落入同一桶的候选对，整体近似线性
+
+依赖:
+    numpy（可选）；安装时签名按矩阵一次算出，未安装时逐个排列计算，两者结果相同
+"""
+
+import zlib
+import random
+from array import array
+from collections import defaultdict
+from typing import List, Dict, Tuple, Iterable, Hashable, Optional, MutableMapping
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 签名长度 = 分带数 × 每带行数；候选阈值约为 (1/BANDS)^(1/ROWS)，8 × 8 时约 0.77，
+# 接近默认的相似度阈值 0.8，低相似度的对很少成为候选
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+
+_MASK64 = (1 << 64) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，不同进程/不同次运行得到的签名可以互相比较；
+# 排列为 ((a·h + b) mod 2^64) >> 32（a 为奇数），numpy 的 uint64 运算自然按 2^64 回绕
+_rng = random.Random(20240115)
+_PERMUTATIONS = [(_rng.randrange(1, 1 << 64) | 1, _rng.randrange(0, 1 << 64))
+                 for _ in range(NUM_PERM)]
+
+if np is not None:
+    _A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+
+
+def shingles(text: str, k: int = 3) -> set:
+    """去掉空白后的字符 k-gram，中英文通用"""
+    compact = ''.join(text.lower().split())
+    if len(compact) <= k:
+        return {compact} if compact else set()
+    return {compact[i:i + k] for i in range(len(compact) - k + 1)}
+
+
+def signature(features: Iterable[str]) -> Tuple[int, ...]:
+    """MinHash 签名"""
+    hashes = [zlib.crc32(f.encode('utf-8')) for f in features]
+    if not hashes:
+        return (_MAX_HASH,) * NUM_PERM
+    if np is not None:
+        values = (_A * np.array(hashes, dtype=np.uint64) + _B) >> np.uint64(32)
+        return tuple(values.min(axis=1).tolist())
+    return tuple(min(((a * h + b) & _MASK64) >> 32 for h in hashes)
+                 for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """由签名估计 Jaccard 相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def band_keys(sig: Tuple[int, ...]) -> List[str]:
+    """签名各带的桶键：带内各行的 CRC32，字符串形式可直接存入 JSON；碰撞只会多出候选，不影响结果"""
+    return [format(zlib.crc32(array('I', sig[band * ROWS:(band + 1) * ROWS]).tobytes()), '08x')
+            for band in range(BANDS)]
+
+
+class LSHIndex:
+    """
+    LSH 分桶，增量加入签名并返回已有的相似项
+
+    分桶只含桶键与项的键，可以与签名分开保存：载入时传入 buckets，
+    signatures 可以是按需解码签名的映射（只有成为候选的项才需要签名）。
+    """
+
+    def __init__(self, threshold: float = 0.8, buckets: Optional[List[Dict[str, list]]] = None,
+                 signatures: Optional[MutableMapping] = None):
+        self.threshold = threshold
+        self.buckets = ([defaultdict(list, band) for band in buckets] if buckets
+                        else [defaultdict(list) for _ in range(BANDS)])
+        self.signatures = {} if signatures is None else signatures
+
+    def query(self, sig: Tuple[int, ...]) -> List[Tuple[Hashable, float]]:
+        """返回相似度不低于阈值的已有项 (键, 相似度)，按相似度降序"""
+        candidates = set()
+        for buckets, key in zip(self.buckets, band_keys(sig)):
+            candidates.update(buckets.get(key, ()))
+
+        matches = []
+        for key in candidates:
+            score = similarity(sig, self.signatures[key])
+            if score >= self.threshold:
+                matches.append((key, score))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches
+
+    def insert(self, key: Hashable, sig: Tuple[int, ...]):
+        self.signatures[key] = sig
+        for buckets, band_key in zip(self.buckets, band_keys(sig)):
+            buckets[band_key].append(key)
+
+    def remove(self, key: Hashable, sig: Tuple[int, ...]):
+        self.signatures.pop(key, None)
+        for buckets, band_key in zip(self.buckets, band_keys(sig)):
+            bucket = buckets.get(band_key)
+            if bucket and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del buckets[band_key]
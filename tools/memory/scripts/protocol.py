@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+记忆守护进程协议
+套接字位置、按行 JSON 的请求/响应，以及命令行与存储层共用的选项常量
+
+只依赖标准库：capture/recall/consolidate 先经由这里尝试常驻的 server.py，
+连接不上时才加载存储层在本进程内执行。
+
+协议:
+    每个连接一次请求，客户端发送一行 {"op": ..., "params": {...}}，
+    服务端回复一行 {"ok": true, "result": ...} 或 {"ok": false, "error": "..."}
+"""
+
+import json
+import socket
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+
+BACKENDS = ['markdown', 'sqlite']
+
+# relevance: BM25 得分（可叠加新近度衰减）；date: 按日期倒序
+SORT_MODES = ['relevance', 'date']
+
+# keyword: 关键词；semantic: 向量相似度；hybrid: 两者加权
+SEARCH_MODES = ['keyword', 'semantic', 'hybrid']
+
+OPERATIONS = ['ping', 'capture', 'capture_batch', 'recall', 'consolidate', 'metrics']
+
+# 整合可能较慢，等待响应的上限
+RESPONSE_TIMEOUT = 600
+
+
+def socket_path(memory_dir: str, backend: str = "markdown") -> Path:
+    """守护进程的默认套接字位置，每个后端一个"""
+    return Path(memory_dir) / f".memory-{backend}.sock"
+
+
+def connect(memory_dir: str, backend: str = "markdown",
+            path: Optional[str] = None) -> Optional[socket.socket]:
+    """
+    连接守护进程
+
+    Returns:
+        已连接的套接字；套接字不存在或无人监听（守护进程未运行）时返回 None
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = Path(path) if path else socket_path(memory_dir, backend)
+    if not path.exists():
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        # 守护进程异常退出后残留的套接字文件
+        sock.close()
+        return None
+    sock.settimeout(RESPONSE_TIMEOUT)
+    return sock
+
+
+def call(sock: socket.socket, op: str, params: Dict) -> Any:
+    """
+    发送一次请求并关闭连接
+
+    Raises:
+        RuntimeError: 守护进程执行失败或连接中断
+    """
+    try:
+        with sock, sock.makefile('rwb') as stream:
+            stream.write(encode({"op": op, "params": params}))
+            stream.flush()
+            line = stream.readline()
+    except OSError as e:
+        raise RuntimeError(f"守护进程连接中断: {e}")
+
+    if not line:
+        raise RuntimeError("守护进程未返回结果")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error", "未知错误"))
+    return response.get("result")
+
+
+def encode(message: Dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n"
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+布尔查询
+recall 的查询可以组合多个词项，一次检索代替多次回忆
+
+语法:
+    redis kafka                 不含下列运算符时整串作为一个子串（与以往一致）
+    redis OR kafka OR 缓存      任一命中
+    数据库 AND 架构              同时命中；含运算符时相邻词项默认 AND
+    数据库 NOT mysql            排除，也可写作 数据库 -mysql
+    "数据库 架构"               引号内为短语，按整串子串匹配
+    (redis OR kafka) -测试      括号分组
+
+优先级 NOT > AND > OR。每个词项的语义与单个查询相同：大小写无关的子串，命中内容或分类即可。
+校验条目时每个条目只扫描一遍：词项较少时逐个子串查找并短路求值，
+较多时用 Aho-Corasick 自动机一遍找出全部出现的词项，耗时与词项数基本无关。
+"""
+
+import re
+from collections import deque
+from typing import List, Dict, Optional, Callable, Any
+
+# 运算符关键字（须大写，小写的 and/or/not 仍是普通词项）
+OPERATORS = {"AND", "OR", "NOT"}
+
+# 词项超过此数时用自动机一遍扫描；更少时逐个 in 查找（C 实现的子串查找更快）
+AUTOMATON_TERMS = 24
+
+_TOKEN = re.compile(r'"[^"]*"|“[^”]*”|[()]|[^\s()"“”]+')
+
+
+class QuerySyntaxError(ValueError):
+    """查询语法错误"""
+
+
+class Automaton:
+    """Aho-Corasick 自动机：一遍扫描文本，找出其中出现的全部模式"""
+
+    def __init__(self, patterns: List[str]):
+        self._goto = [{}]
+        self._out = [0]      # 每个状态结束的模式，按位记录模式编号
+        for i, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._out.append(0)
+                state = nxt
+            self._out[state] |= 1 << i
+
+        # 按层次计算失败转移，输出沿失败链合并
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0) if state else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def scan(self, text: str) -> int:
+        """文本中出现的模式，第 i 位为 1 表示模式 i 出现"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found |= out[state]
+        return found
+
+
+class BooleanQuery:
+    """解析后的布尔查询"""
+
+    def __init__(self, node: tuple, literals: List[str]):
+        """
+        Args:
+            node: 语法树，("term", 序号) / ("and", [子树]) / ("or", [子树]) / ("not", 子树)
+            literals: 小写词项，按序号排列
+        """
+        self.node = node
+        self.literals = literals
+        self.positive = [literals[i] for i in sorted(_positive(node))]
+        self._automaton = Automaton(literals) if len(literals) > AUTOMATON_TERMS else None
+
+    @property
+    def text(self) -> str:
+        """非排除词项拼成的文本，用于相关度打分与片段定位"""
+        return " ".join(self.positive)
+
+    def matches(self, content: str, category: str = "") -> bool:
+        """条目内容与分类是否满足查询"""
+        # 分隔符不会出现在词项中，词项不会跨越内容与分类
+        text = content.lower() + "\x00" + category.lower()
+        if self._automaton is None:
+            return _evaluate(self.node, lambda i: self.literals[i] in text)
+        found = self._automaton.scan(text)
+        return _evaluate(self.node, lambda i: found >> i & 1)
+
+    def required(self) -> Optional[str]:
+        """满足查询的条目必然包含的最长词项，可用作字节预筛；没有时返回 None"""
+        literals = [self.literals[i] for i in _required(self.node)]
+        return max(literals, key=lambda t: len(t.encode('utf-8')), default=None)
+
+    def reduce(self, leaf: Callable[[str], Any], both: Callable[[Any, Any], Any],
+               either: Callable[[Any, Any], Any]) -> Any:
+        """
+        按查询结构组合各词项的候选集合
+
+        Args:
+            leaf: 词项 → 可能包含它的候选；无法缩小范围时返回 None
+            both: 两个候选的交集（AND）
+            either: 两个候选的并集（OR）
+
+        Returns:
+            满足查询的条目的候选超集；None 表示无法缩小（如 NOT 或含不可索引词项的 OR）
+        """
+        def visit(node):
+            kind = node[0]
+            if kind == "term":
+                return leaf(self.literals[node[1]])
+            if kind == "not":
+                return None
+            parts = [visit(child) for child in node[1]]
+            if kind == "and":
+                parts = [part for part in parts if part is not None]
+                if not parts:
+                    return None
+                result = parts[0]
+                for part in parts[1:]:
+                    result = both(result, part)
+                return result
+            if any(part is None for part in parts):
+                return None
+            result = parts[0]
+            for part in parts[1:]:
+                result = either(result, part)
+            return result
+
+        return visit(self.node)
+
+
+def intersect(a: Dict, b: Dict) -> Dict:
+    """reduce 用的候选交集，保留 a 中的值"""
+    return {key: value for key, value in a.items() if key in b}
+
+
+def union(a: Dict, b: Dict) -> Dict:
+    """reduce 用的候选并集"""
+    return {**a, **b}
+
+
+def _evaluate(node: tuple, has: Callable[[int], Any]) -> bool:
+    kind = node[0]
+    if kind == "term":
+        return bool(has(node[1]))
+    if kind == "not":
+        return not _evaluate(node[1], has)
+    if kind == "and":
+        return all(_evaluate(child, has) for child in node[1])
+    return any(_evaluate(child, has) for child in node[1])
+
+
+def _positive(node: tuple) -> set:
+    """不在 NOT 之下的词项"""
+    kind = node[0]
+    if kind == "term":
+        return {node[1]}
+    if kind == "not":
+        return set()
+    return set().union(*(_positive(child) for child in node[1]))
+
+
+def _required(node: tuple) -> set:
+    """满足查询时必然出现的词项"""
+    kind = node[0]
+    if kind == "term":
+        return {node[1]}
+    if kind == "not":
+        return set()
+    parts = [_required(child) for child in node[1]]
+    if kind == "and":
+        return set().union(*parts)
+    return set.intersection(*parts)
+
+
+class _Parser:
+    """递归下降：expr := and (OR and)*；and := unary (AND? unary)*；unary := NOT unary | primary"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.pos = 0
+        self.literals = []
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def literal(self, text: str) -> tuple:
+        text = text.lower()
+        if text not in self.literals:
+            self.literals.append(text)
+        return ("term", self.literals.index(text))
+
+    def parse(self) -> tuple:
+        node = self.expr()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"多余的 '{self.peek()}'")
+        return node
+
+    def expr(self) -> tuple:
+        parts = [self.conjunction()]
+        while self.peek() == "OR":
+            self.take()
+            parts.append(self.conjunction())
+        return parts[0] if len(parts) == 1 else ("or", parts)
+
+    def conjunction(self) -> tuple:
+        parts = [self.unary()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            parts.append(self.unary())
+        return parts[0] if len(parts) == 1 else ("and", parts)
+
+    def unary(self) -> tuple:
+        token = self.peek()
+        if token == "NOT":
+            self.take()
+            return ("not", self.unary())
+        if token is not None and _is_negation(token):
+            self.take()
+            return ("not", self.literal(token[1:]))
+        return self.primary()
+
+    def primary(self) -> tuple:
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError("查询在运算符之后结束")
+        if token in OPERATORS or token == ")":
+            raise QuerySyntaxError(f"'{token}' 前缺少词项")
+        self.take()
+        if token == "(":
+            node = self.expr()
+            if self.peek() != ")":
+                raise QuerySyntaxError("括号不匹配")
+            self.take()
+            return node
+        if token[0] in '"“':
+            phrase = token[1:-1]
+            if not phrase.strip():
+                raise QuerySyntaxError("空短语")
+            return self.literal(phrase)
+        return self.literal(token)
+
+
+def _is_negation(token: str) -> bool:
+    """-词项 表示排除；"-" 后不是字母、数字或汉字时（如 "->"）仍是普通词项"""
+    return len(token) > 1 and token[0] == "-" and (token[1].isalnum() or token[1] == "_")
+
+
+def is_boolean(query: str) -> bool:
+    """查询是否使用了布尔语法"""
+    return any(token in OPERATORS or token in "()" or token[0] in '"“' or _is_negation(token)
+               for token in _TOKEN.findall(query))
+
+
+def parse_query(query: str) -> Optional[BooleanQuery]:
+    """
+    解析布尔查询
+
+    Returns:
+        未使用布尔语法时返回 None，调用方按整串子串匹配
+
+    Raises:
+        QuerySyntaxError: 括号不匹配、运算符缺少词项等
+    """
+    if not query or not is_boolean(query):
+        return None
+    tokens = _TOKEN.findall(query)
+    if query.count('"') % 2 or query.count('“') != query.count('”'):
+        raise QuerySyntaxError("引号不匹配")
+    parser = _Parser(tokens)
+    node = parser.parse()
+    return BooleanQuery(node, parser.literals)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+记忆相关度排序
+BM25 打分、按天数半衰的新近度衰减，以及带校验的 top-k 选取
+"""
+
+import math
+import heapq
+from datetime import date
+from typing import List, Dict, Tuple, Callable, Iterable, Optional, Any
+
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+def idf(total_docs: int, doc_freq: int) -> float:
+    """逆文档频率（BM25+ 平滑，恒为正）"""
+    return math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def bm25(tf: int, doc_freq: int, doc_len: int, total_docs: int, avg_doc_len: float) -> float:
+    """单个词项对单个条目的 BM25 得分"""
+    norm = K1 * (1 - B + B * doc_len / avg_doc_len) if avg_doc_len else K1
+    return idf(total_docs, doc_freq) * tf * (K1 + 1) / (tf + norm)
+
+
+def recency_weight(date_str: str, half_life: Optional[float],
+                   today: Optional[date] = None) -> float:
+    """
+    新近度权重，每经过 half_life 天减半
+
+    Args:
+        date_str: 条目日期 (YYYY-MM-DD)
+        half_life: 半衰期天数，None 表示不衰减
+    """
+    if not half_life:
+        return 1.0
+    today = today or date.today()
+    try:
+        age = (today - date.fromisoformat(date_str)).days
+    except ValueError:
+        return 1.0
+    return 0.5 ** (max(age, 0) / half_life)
+
+
+def top_k(scored: Iterable[Tuple[float, Any]], accept: Callable[[Any], Optional[Dict]],
+          k: int, budget=None, cost: Optional[Callable[[Any], int]] = None) -> List[Dict]:
+    """
+    按得分从高到低选出 k 个通过校验的结果
+
+    堆化 O(n)，之后只弹出需要的候选，不对全部候选排序；
+    accept 返回 None 表示候选未通过校验（例如子串不匹配）。
+
+    budget 为 budget.ContextBudget 时按得分贪心装入，预算用尽即停止；
+    cost(key) 给出读取前即可知道的代价下限，超出剩余预算的候选不调用 accept。
+    """
+    heap = [(-score, i, key) for i, (score, key) in enumerate(scored)]
+    heapq.heapify(heap)
+
+    results = []
+    while heap and len(results) < k:
+        if budget is not None and budget.exhausted:
+            break
+        neg_score, _, key = heapq.heappop(heap)
+        if budget is not None and cost is not None and cost(key) > budget.remaining:
+            continue
+        entry = accept(key)
+        if entry is None:
+            continue
+        entry['score'] = -neg_score
+        if budget is None or budget.take(entry):
+            results.append(entry)
+    return results
@@ -6,6 +6,14 @@
 用法:
     python recall.py "关键词" --limit 5
     python recall.py "数据库" --category tech --tags "架构"
+    python recall.py "数据库" --since 2024-01-01 --backend sqlite
+    python recall.py "数据库" --half-life 90
+    python recall.py "数据库选型" --mode hybrid
+    python recall.py "数据库" --metrics         # 记录耗时与扫描量，见 metrics.py
+    python recall.py "数据库 缓存" --budget 800  # 按 token 预算输出命中片段，供直接放入提示词
+    python recall.py "redis OR kafka -测试"      # 布尔查询，语法见 query.py
+
+server.py 运行时自动经由守护进程检索
 """
 
 import os
@@ -16,15 +24,33 @@ from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
 
+from protocol import BACKENDS, SORT_MODES, SEARCH_MODES, connect, call
+from metrics import measure, log_sinks
+from budget import BUDGET_UNITS, SNIPPET_CHARS, ContextBudget, render
+from query import QuerySyntaxError, parse_query
+
 
 class MemoryRecall:
     """记忆回忆器"""
 
-    def __init__(self, memory_dir: str = "memory"):
+    def __init__(self, memory_dir: str = "memory", backend: str = "markdown", store=None,
+                 metric_sinks: Optional[List] = None):
         self.memory_dir = Path(memory_dir)
+        if store is None:
+            # 延迟导入：经守护进程转发时无需加载存储层
+            from storage import open_store
+            store = open_store(memory_dir, backend)
+        self.store = store
+        # 每次回忆的计量记录交给这些 sink（见 metrics.py），为空时不计量
+        self.metric_sinks = list(metric_sinks or [])
 
     def recall(self, query: str, category: Optional[str] = None,
-               tags: Optional[List[str]] = None, limit: int = 10) -> List[Dict]:
+               tags: Optional[List[str]] = None, limit: int = 10,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               sort: str = "relevance", half_life: Optional[float] = None,
+               mode: str = "keyword", alpha: float = 0.5,
+               include_archived: bool = True, budget: Optional[int] = None,
+               budget_unit: str = "tokens", snippet: int = SNIPPET_CHARS) -> List[Dict]:
         """
         搜索记忆
 
@@ -33,108 +59,129 @@ class MemoryRecall:
             category: 分类过滤
             tags: 标签过滤
             limit: 返回数量限制
+            date_from: 起始日期 (YYYY-MM-DD，含)
+            date_to: 截止日期 (YYYY-MM-DD，含)
+            sort: relevance 按 BM25 相关度，date 按日期倒序
+            half_life: 相关度的新近度衰减半衰期（天）
+            mode: keyword 关键词，semantic 语义，hybrid 混合
+            alpha: 混合检索中语义得分的权重
+            include_archived: 同时检索归档层（仅关键词检索）
+            budget: 上下文预算；给出时在 limit 之内按排序贪心装入，条目带 snippet 与 cost
+            budget_unit: 预算单位，tokens（估算）或 chars
+            snippet: 片段窗口字符数
 
         Returns:
             匹配的记忆条目列表
         """
-        results = []
-
-        # 搜索所有记忆文件
-        for memory_file in sorted(self.memory_dir.glob("*.md"), reverse=True):
-            if memory_file.name == "index.md":
-                continue
-
-            with open(memory_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 按条目分割
-            entries = self._parse_entries(content, memory_file.stem)
-
-            for entry in entries:
-                # 检查是否匹配
-                if self._matches(entry, query, category, tags):
-                    results.append(entry)
-
-                    if len(results) >= limit:
-                        return results
-
+        context = None
+        if budget is not None:
+            boolean = parse_query(query) if mode == "keyword" else None
+            terms = boolean.positive if boolean else query.lower().split()
+            context = ContextBudget(budget, budget_unit, snippet, terms)
+        with measure('recall', self.metric_sinks) as m:
+            results = self.store.search(query, category, tags, date_from, date_to, limit,
+                                        sort, half_life, mode, alpha, include_archived,
+                                        context)
+            m.add('entries_returned', len(results))
         return results
 
-    def _parse_entries(self, content: str, date: str) -> List[Dict]:
-        """解析记忆条目"""
-        entries = []
-
-        # 按 ## 分割
-        pattern = r'##\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2})\s+\[([^\]]+)\]\n\n(.+?)(?=\n---|\Z)'
-        matches = re.findall(pattern, content, re.DOTALL)
-
-        for date_str, time_str, category, body in matches:
-            entry = {
-                'date': date_str,
-                'time': time_str,
-                'category': category,
-                'content': body.strip(),
-                'raw': f"## {date_str} {time_str} [{category}]\n\n{body}"
-            }
-
-            # 提取标签
-            tag_match = re.search(r'\*\*标签\*\*:\s*(.+)', body)
-            if tag_match:
-                entry['tags'] = [t.strip('#') for t in tag_match.group(1).split()]
-            else:
-                entry['tags'] = []
-
-            entries.append(entry)
-
-        return entries
-
-    def _matches(self, entry: Dict, query: str, category: Optional[str],
-                 tags: Optional[List[str]]) -> bool:
-        """检查条目是否匹配查询条件"""
-        # 检查关键词
-        query_lower = query.lower()
-        if query_lower not in entry['content'].lower() and \
-           query_lower not in entry['category'].lower():
-            return False
-
-        # 检查分类
-        if category and entry['category'].lower() != category.lower():
-            return False
-
-        # 检查标签
-        if tags:
-            entry_tags = set(t.lower() for t in entry['tags'])
-            if not any(t.lower() in entry_tags for t in tags):
-                return False
-
-        return True
-
 
 def main():
     parser = argparse.ArgumentParser(description='回忆记忆')
-    parser.add_argument('query', help='搜索关键词')
+    parser.add_argument('query', help='搜索关键词，支持 AND/OR/NOT、-排除、"短语" 与括号')
     parser.add_argument('--category', '-c', help='分类过滤')
     parser.add_argument('--tags', '-t', help='标签过滤，逗号分隔')
-    parser.add_argument('--limit', '-l', type=int, default=5,
-                        help='返回数量限制')
+    parser.add_argument('--limit', '-l', type=int,
+                        help='返回数量限制 (默认: 5，指定 --budget 时为 50)')
+    parser.add_argument('--since', help='起始日期 (YYYY-MM-DD)')
+    parser.add_argument('--until', help='截止日期 (YYYY-MM-DD)')
+    parser.add_argument('--sort', default='relevance', choices=SORT_MODES,
+                        help='排序方式 (默认: relevance)')
+    parser.add_argument('--half-life', type=float,
+                        help='新近度衰减半衰期（天），relevance 排序与混合检索生效')
+    parser.add_argument('--mode', '-m', default='keyword', choices=SEARCH_MODES,
+                        help='检索方式 (默认: keyword，semantic/hybrid 需要 numpy)')
+    parser.add_argument('--alpha', type=float, default=0.5,
+                        help='混合检索中语义得分的权重 (0-1)')
+    parser.add_argument('--no-archive', action='store_true',
+                        help='不检索归档层')
+    parser.add_argument('--budget', type=int,
+                        help='上下文预算，按排序装入命中片段并输出紧凑格式')
+    parser.add_argument('--budget-unit', default='tokens', choices=BUDGET_UNITS,
+                        help='预算单位 (默认: tokens，按 CJK 1 字/英文 4 字符估算)')
+    parser.add_argument('--snippet', type=int, default=SNIPPET_CHARS,
+                        help=f'片段窗口字符数 (默认: {SNIPPET_CHARS})')
     parser.add_argument('--memory-dir', '-d', default='memory',
                         help='记忆目录')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--socket', help='守护进程套接字 (默认: 记忆目录下的 .memory-<后端>.sock)')
+    parser.add_argument('--metrics', nargs='?', const='', metavar='FILE',
+                        help='记录计量数据 (默认: 记忆目录下的 .index/metrics.jsonl)')
 
     args = parser.parse_args()
+    if args.mode == 'keyword':
+        try:
+            parse_query(args.query)
+        except QuerySyntaxError as e:
+            parser.error(f"查询语法错误: {e}")
 
     tags = args.tags.split(',') if args.tags else []
-
-    recall = MemoryRecall(args.memory_dir)
-    results = recall.recall(args.query, args.category, tags, args.limit)
+    sinks = log_sinks(args.memory_dir, args.metrics)
+    limit = args.limit or (50 if args.budget is not None else 5)
+
+    conn = connect(args.memory_dir, args.backend, args.socket)
+    if conn is not None:
+        try:
+            with measure('recall', sinks) as m:
+                results = call(conn, 'recall', {
+                    'query': args.query, 'category': args.category, 'tags': tags,
+                    'limit': limit, 'date_from': args.since, 'date_to': args.until,
+                    'sort': args.sort, 'half_life': args.half_life,
+                    'mode': args.mode, 'alpha': args.alpha,
+                    'include_archived': not args.no_archive, 'budget': args.budget,
+                    'budget_unit': args.budget_unit, 'snippet': args.snippet})
+                m.lap('rpc')
+                m.add('entries_returned', len(results))
+        except RuntimeError as e:
+            print(f"回忆失败: {e}")
+            return
+    else:
+        recall = MemoryRecall(args.memory_dir, args.backend, metric_sinks=sinks)
+        try:
+            results = recall.recall(args.query, args.category, tags, limit,
+                                    args.since, args.until, args.sort, args.half_life,
+                                    args.mode, args.alpha, not args.no_archive,
+                                    args.budget, args.budget_unit, args.snippet)
+        except RuntimeError as e:
+            print(f"回忆失败: {e}")
+            return
+        finally:
+            recall.store.close()
 
     if not results:
         print(f"未找到与 '{args.query}' 相关的记忆")
         return
 
+    if args.budget is not None:
+        # 紧凑格式，每条一行，可直接放入提示词
+        for entry in results:
+            print(render(entry))
+        print(f"\n({len(results)} 条，约 {sum(e['cost'] for e in results)}/{args.budget} "
+              f"{args.budget_unit})")
+        return
+
     print(f"找到 {len(results)} 条相关记忆:\n")
 
     for i, entry in enumerate(results, 1):
-        print(f"{i}. [{entry['date']} {entry['time']}] {entry['category']}")
+        if 'score' in entry:
+            score = f"  (相关度 {entry['score']:.4g})"
+        elif 'similarity' in entry:
+            score = f"  (相似度 {entry['similarity']:.3f})"
+        else:
+            score = ""
+        archived = " [归档]" if entry.get('archived') else ""
+        print(f"{i}. [{entry['date']} {entry['time']}] {entry['category']}{archived}{score}")
 
         # 提取内容预览
         content_preview = entry['content'].split('\n')[0][:80]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+记忆检索回归检查
+每一项在新的临时记忆目录中构造最小场景，核对 capture / recall / consolidate 的结果:
+
+    子串匹配        英文查询词命中单词内部（SQL → PostgreSQL），相关度与日期排序、
+                    近期与归档层都能找到
+    预算下限        来源很长、内容很短的条目在小预算下仍被装入（来源不进片段，不计入代价下限）
+    重复捕获        同一分钟两次捕获相同内容都会写入（留给整合去重）；SQLite 导入按内容指纹跳过已有条目
+
+任何一项不符合预期时以非零状态退出。
+
+用法:
+    python regression.py                    # 两个后端都检查
+    python regression.py --backend sqlite
+"""
+
+import sys
+import shutil
+import tempfile
+import argparse
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from protocol import BACKENDS, SORT_MODES
+from capture import MemoryCapture
+from recall import MemoryRecall
+from consolidate import MemoryConsolidate
+from storage import MarkdownStore, SQLiteStore
+
+
+class RegressionCheck:
+    """检索回归检查"""
+
+    def __init__(self, backend: str = "markdown"):
+        self.backend = backend
+
+    def checks(self) -> List[Tuple[str, Callable[[str], Optional[str]]]]:
+        return [
+            ('子串匹配', self.check_substring),
+            ('预算下限', self.check_budget_bound),
+            ('重复捕获', self.check_duplicate_capture),
+        ]
+
+    def _found(self, memory_dir: str, query: str, expected: List[str], **kwargs) -> Optional[str]:
+        """检索 query，命中条目的内容须恰好是 expected（不计顺序）"""
+        recall = MemoryRecall(memory_dir, self.backend)
+        try:
+            results = recall.recall(query, limit=10, **kwargs)
+        finally:
+            recall.store.close()
+        got = sorted(entry['content'].split("\n", 1)[0].replace("**内容**: ", "")
+                     for entry in results)
+        if got != sorted(expected):
+            options = " ".join(f"{k}={v}" for k, v in kwargs.items())
+            return f"{query!r} {options}: 预期 {sorted(expected)}，实际 {got}"
+        return None
+
+    def check_substring(self, memory_dir: str) -> Optional[str]:
+        old = "PostgreSQL 与 MySQL 的取舍"
+        new = "mysqldump 备份脚本"
+        capture = MemoryCapture(memory_dir, self.backend)
+        capture.capture_batch([{'content': old, 'date': "2020-01-05", 'time': "10:00"},
+                               {'content': new, 'date': "2024-03-01", 'time': "10:00"},
+                               {'content': "无关的记录", 'date': "2024-03-01", 'time': "11:00"}])
+        capture.store.close()
+
+        cases = [("SQL", [old, new]), ("gres", [old]), ("sqldump", [new])]
+        for tier in ("近期", "归档"):
+            if tier == "归档":
+                consolidate = MemoryConsolidate(memory_dir, self.backend)
+                consolidate.consolidate(archive_before="2021-01-01")
+                consolidate.store.close()
+            for query, expected in cases:
+                for sort in SORT_MODES:
+                    problem = self._found(memory_dir, query, expected, sort=sort)
+                    if problem:
+                        return f"{tier}: {problem}"
+        return None
+
+    def check_budget_bound(self, memory_dir: str) -> Optional[str]:
+        old = "预算 下限 检查 旧的一条"
+        new = "预算 下限 检查 新的一条"
+        capture = MemoryCapture(memory_dir, self.backend)
+        capture.capture_batch([{'content': old, 'source': "x" * 900,
+                                'date': "2020-01-05", 'time': "10:00"},
+                               {'content': new, 'source': "y" * 900,
+                                'date': "2024-03-01", 'time': "10:00"}])
+        capture.store.close()
+
+        # 输出行约 40 个字符，远小于预算
+        for tier in ("近期", "归档"):
+            if tier == "归档":
+                consolidate = MemoryConsolidate(memory_dir, self.backend)
+                consolidate.consolidate(archive_before="2021-01-01")
+                consolidate.store.close()
+            for query in ("预算 下限", "预算 OR 不存在"):
+                for sort in SORT_MODES:
+                    problem = self._found(memory_dir, query, [old, new], sort=sort,
+                                          budget=120, budget_unit="chars")
+                    if problem:
+                        return f"{tier}: {problem}"
+        return None
+
+    def check_duplicate_capture(self, memory_dir: str) -> Optional[str]:
+        content = "重复 捕获 检查"
+        item = {'content': content, 'date': "2024-03-01", 'time': "10:00"}
+        capture = MemoryCapture(memory_dir, self.backend)
+        locations = capture.capture_batch([item]) + capture.capture_batch([item])
+        capture.store.close()
+
+        problem = self._found(memory_dir, "重复 捕获", [content, content])
+        if problem:
+            return problem
+        if self.backend != "sqlite":
+            return None
+        if len(set(locations)) != 2 or not all('#' in location for location in locations):
+            return f"两次捕获应返回不同的条目 id，实际 {locations}"
+
+        source_dir = Path(memory_dir) / "markdown"
+        MarkdownStore(str(source_dir)).add("2024-03-02", "10:00", "general", "导入 去重 检查")
+        store = SQLiteStore(memory_dir, db_name="import.db")
+        try:
+            imported = [store.import_markdown(str(source_dir)) for _ in range(2)]
+        finally:
+            store.close()
+        if imported != [1, 0]:
+            return f"重复导入同一目录应依次导入 [1, 0] 条，实际 {imported}"
+        return None
+
+    def run(self) -> List[str]:
+        """逐项检查，返回发现的问题"""
+        problems = []
+        for name, check in self.checks():
+            memory_dir = tempfile.mkdtemp(prefix='memory-regression-')
+            try:
+                problem = check(memory_dir)
+            finally:
+                shutil.rmtree(memory_dir, ignore_errors=True)
+            print(f"  {'✗' if problem else '✓'} {problem or name}")
+            if problem:
+                problems.append(f"{self.backend} {name}: {problem}")
+        return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆检索回归检查')
+    parser.add_argument('--backend', '-b', choices=BACKENDS,
+                        help='只检查这个存储后端 (默认: 全部)')
+
+    args = parser.parse_args()
+
+    problems = []
+    for backend in [args.backend] if args.backend else BACKENDS:
+        print(f"{backend}:")
+        problems.extend(RegressionCheck(backend).run())
+
+    if problems:
+        print(f"\n✗ 发现 {len(problems)} 个问题:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("\n✓ 全部检查通过")
+
+
+if __name__ == '__main__':
+    main()
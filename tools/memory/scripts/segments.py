@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+记忆归档层
+归档的日志按月打包为压缩段文件，每段附带词项字典，回忆时只解压字典命中的块
+
+目录结构:
+    memory/archive/
+    ├── 2024-01.seg      # 若干独立的 gzip 块首尾相接，可直接 zcat 查看
+    └── 2024-01.json     # 块位置、日期范围、条目/词数及 词项 → 块 字典
+
+段文件只追加：再次归档同一月份时追加新块并原子替换字典文件。
+同一天再次归档（归档后又写入了该日期的条目，或上次打包后、删除原文件前中断）时，
+只追加尚未归档的条目。
+"""
+
+import os
+import gzip
+import json
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, NamedTuple
+
+import metrics
+from budget import plain_content
+from inverted_index import EntrySpan, iter_entry_spans, tokenize, _is_ascii_term
+
+
+# 段字典格式变化时递增
+SEGMENT_VERSION = 1
+
+# 单个块压缩前的目标大小，越小解压越少、字典越大
+BLOCK_SIZE = 64 * 1024
+
+
+class ColdHit(NamedTuple):
+    """归档层中包含全部查询词项的条目"""
+    key: Tuple[str, int, int, int, int]   # (段名, 块号, 块内偏移, 长度, 内容字符数)
+    span: EntrySpan
+    tfs: Dict[str, int]                   # 查询词项 → 词频（ASCII 词项含子串展开）
+    doc_len: int
+
+
+class ColdMatches(NamedTuple):
+    """归档层的检索结果及其参与 BM25 的统计量"""
+    docs: int
+    tokens: int
+    doc_freqs: Dict[str, int]
+    hits: List[ColdHit]
+
+
+class SegmentArchive:
+    """按月分段的压缩归档"""
+
+    def __init__(self, archive_dir: Path):
+        self.archive_dir = Path(archive_dir)
+        self._metas = {}
+
+    def segments(self) -> List[str]:
+        """全部段名（月份），按时间倒序"""
+        if not self.archive_dir.exists():
+            return []
+        return sorted((p.stem for p in self.archive_dir.glob("*.seg")), reverse=True)
+
+    def _meta(self, segment: str) -> Optional[Dict]:
+        """读取段字典，按 (mtime, 大小) 缓存"""
+        meta_file = self.archive_dir / f"{segment}.json"
+        try:
+            stat = meta_file.stat()
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._metas.get(segment)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != SEGMENT_VERSION:
+            return None
+        # ASCII 词项按子串匹配，预先挑出字典中的 ASCII 词项
+        meta["ascii_terms"] = [t for t in meta["terms"] if _is_ascii_term(t)]
+        self._metas[segment] = (stamp, meta)
+        return meta
+
+    def _save_meta(self, segment: str, meta: Dict):
+        meta_file = self.archive_dir / f"{segment}.json"
+        tmp_file = meta_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in meta.items() if k != "ascii_terms"},
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, meta_file)
+        self._metas.pop(segment, None)
+
+    def packed(self, memory_file: Path) -> bool:
+        """日志文件中的全部条目是否都已写入归档，为真时才可以删除原文件"""
+        segment = memory_file.stem[:7]
+        meta = self._meta(segment)
+        if not meta or memory_file.name not in meta["days"]:
+            return False
+        return not self._unarchived(segment, meta, memory_file)
+
+    def _unarchived(self, segment: str, meta: Dict, memory_file: Path) -> List[EntrySpan]:
+        """日志文件中尚未归档的条目；原文相同的条目按出现次数抵消"""
+        with open(memory_file, 'rb') as f:
+            spans = list(iter_entry_spans(f))
+        if memory_file.name not in meta["days"]:
+            return spans
+        # 每个块只来自一个日志文件，同一天的条目只可能在日期范围覆盖这一天的块中
+        day = memory_file.stem
+        archived = Counter(span.text
+                           for info in meta["blocks"] if info["from"] <= day <= info["to"]
+                           for span in iter_entry_spans(self._read_block(segment, info)))
+        missing = []
+        for span in spans:
+            if archived[span.text]:
+                archived[span.text] -= 1
+            else:
+                missing.append(span)
+        return missing
+
+    def pack(self, memory_file: Path) -> int:
+        """
+        把一个日志文件中尚未归档的条目追加进所属月份的段
+
+        调用方应在 packed() 确认后再删除原文件。
+
+        Returns:
+            写入的条目数
+        """
+        segment = memory_file.stem[:7]
+        meta = self._meta(segment) or {"version": SEGMENT_VERSION, "days": [],
+                                       "blocks": [], "terms": {}}
+        spans = self._unarchived(segment, meta, memory_file)
+        if not spans and memory_file.name in meta["days"]:
+            return 0
+
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        seg_file = self.archive_dir / f"{segment}.seg"
+        written = 0
+        with open(seg_file, 'ab') as out:
+            batch = []
+            batch_size = 0
+            for span in spans:
+                chunk = f"\n{span.text}\n---\n".encode('utf-8')
+                batch.append((span, chunk))
+                batch_size += len(chunk)
+                if batch_size >= BLOCK_SIZE:
+                    self._write_block(out, meta, batch)
+                    written += len(batch)
+                    batch, batch_size = [], 0
+            if batch:
+                self._write_block(out, meta, batch)
+                written += len(batch)
+
+        if memory_file.name not in meta["days"]:
+            meta["days"].append(memory_file.name)
+        self._save_meta(segment, meta)
+        return written
+
+    @staticmethod
+    def _write_block(out, meta: Dict, batch: List[Tuple[EntrySpan, bytes]]):
+        """压缩并追加一个块，更新块表和词项字典"""
+        data = gzip.compress(b''.join(chunk for _, chunk in batch))
+        offset = out.seek(0, os.SEEK_END)
+        out.write(data)
+
+        block = len(meta["blocks"])
+        doc_freq = Counter()
+        tokens = 0
+        for span, _ in batch:
+            terms = tokenize(span.text)
+            tokens += len(terms)
+            doc_freq.update(set(terms))
+        for term, df in doc_freq.items():
+            meta["terms"].setdefault(term, []).append([block, df])
+
+        dates = [span.date for span, _ in batch]
+        meta["blocks"].append({"offset": offset, "length": len(data),
+                               "from": min(dates), "to": max(dates),
+                               "entries": len(batch), "tokens": tokens})
+
+    def _read_block(self, segment: str, block: Dict) -> bytes:
+        m = metrics.current()
+        with open(self.archive_dir / f"{segment}.seg", 'rb') as f:
+            f.seek(block["offset"])
+            data = gzip.decompress(f.read(block["length"]))
+        m.add('files_scanned')
+        m.add('bytes_scanned', block["length"])
+        m.lap('read')
+        return data
+
+    @staticmethod
+    def _expand(meta: Dict, term: str) -> Iterable[str]:
+        """字典中与查询词项匹配的词项，ASCII 展开为包含它的全部词项"""
+        if not _is_ascii_term(term):
+            if term in meta["terms"]:
+                yield term
+            return
+        yield from (key for key in meta["ascii_terms"] if term in key)
+
+    @staticmethod
+    def _in_range(meta_block: Dict, date_from: Optional[str], date_to: Optional[str]) -> bool:
+        if date_from and meta_block["to"] < date_from:
+            return False
+        if date_to and meta_block["from"] > date_to:
+            return False
+        return True
+
+    def match(self, terms: List[str], date_from: Optional[str] = None,
+              date_to: Optional[str] = None) -> ColdMatches:
+        """
+        查找包含全部词项的归档条目
+
+        先用各段字典求出包含全部词项的块，只解压这些块，再逐条校验词项。
+        文档频率按块字典累加，子串展开时为近似值。
+        """
+        m = metrics.current()
+        docs = tokens = 0
+        doc_freqs = Counter()
+        hits = []
+        for segment in self.segments():
+            meta = self._meta(segment)
+            if not meta:
+                continue
+            docs += sum(b["entries"] for b in meta["blocks"])
+            tokens += sum(b["tokens"] for b in meta["blocks"])
+
+            blocks = None
+            for term in terms:
+                term_blocks = set()
+                for key in self._expand(meta, term):
+                    for block, df in meta["terms"][key]:
+                        doc_freqs[term] += df
+                        term_blocks.add(block)
+                blocks = term_blocks if blocks is None else blocks & term_blocks
+
+            m.lap('lookup')
+            for block in sorted(blocks or ()):
+                info = meta["blocks"][block]
+                if not self._in_range(info, date_from, date_to):
+                    continue
+                for span in iter_entry_spans(self._read_block(segment, info)):
+                    m.lap('parse')
+                    m.add('entries_examined')
+                    if date_from and span.date < date_from or date_to and span.date > date_to:
+                        continue
+                    counts = Counter(tokenize(span.text))
+                    tfs = {}
+                    for term in terms:
+                        if _is_ascii_term(term):
+                            tfs[term] = sum(c for t, c in counts.items() if term in t)
+                        else:
+                            tfs[term] = counts.get(term, 0)
+                    if all(tfs.values()):
+                        key = (segment, block, span.offset, span.length,
+                               len(plain_content(span.body)))
+                        hits.append(ColdHit(key, span, tfs, sum(counts.values())))
+                    m.lap('match')
+        return ColdMatches(docs, tokens, dict(doc_freqs), hits)
+
+    def iter_spans(self, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> Iterator[EntrySpan]:
+        """按日期倒序遍历归档条目（同一天内保持写入顺序），逐块解压"""
+        blocks = []
+        for segment in self.segments():
+            meta = self._meta(segment)
+            if meta:
+                blocks.extend((info["to"], segment, info) for info in meta["blocks"]
+                              if self._in_range(info, date_from, date_to))
+        # 每个块只来自一个日志文件；倒序排序是稳定的，同一天的块保持写入顺序
+        blocks.sort(key=lambda b: b[0], reverse=True)
+
+        for _, segment, info in blocks:
+            yield from iter_entry_spans(self._read_block(segment, info))
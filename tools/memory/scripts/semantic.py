@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+记忆语义检索
+离线的哈希 n-gram 向量化 + 内存映射的 float32 向量矩阵，分块点积求相似度
+
+目录结构:
+    memory/.index/
+    ├── vectors.f32      # 行优先的 float32 矩阵，每行一个条目，只追加
+    ├── vectors.keys     # 与矩阵逐行对应的条目键
+    └── vectors.json     # 维度、所属索引纪元及各后端的同步进度
+
+依赖:
+    numpy（可选）；未安装时关键词检索不受影响，语义/混合检索会提示安装
+"""
+
+import os
+import re
+import json
+import math
+import zlib
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Tuple, Optional, Callable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from inverted_index import tokenize
+
+
+DIM = 512
+
+# 每次点积处理的行数，控制临时内存
+CHUNK_ROWS = 65536
+
+_LABEL_PATTERN = re.compile(r'\*\*(内容|来源|标签|主题|相关)\*\*:')
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("语义检索需要 numpy: pip install numpy")
+
+
+def _features(text: str) -> Counter:
+    """词项 + ASCII 单词的字符三元组，后者让词形变化也能相互命中"""
+    terms = tokenize(_LABEL_PATTERN.sub(' ', text))
+    features = Counter(terms)
+    for term in terms:
+        if term[0] < '\u0080' and len(term) > 3:
+            padded = f"<{term}>"
+            features.update(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def embed(text: str, dim: int = DIM):
+    """哈希向量化：特征经 crc32 映射到 dim 维并带符号，对数词频加权后 L2 归一化"""
+    require_numpy()
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in _features(text).items():
+        h = zlib.crc32(feature.encode('utf-8'))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vector[h % dim] += sign * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class VectorIndex:
+    """只追加的内存映射向量索引，条目键的有效性由调用方判断"""
+
+    def __init__(self, index_dir: Path, name: str = "vectors", dim: int = DIM):
+        self.index_dir = Path(index_dir)
+        self.matrix_file = self.index_dir / f"{name}.f32"
+        self.keys_file = self.index_dir / f"{name}.keys"
+        self.meta_file = self.index_dir / f"{name}.json"
+        self.dim = dim
+        self._meta = None
+
+    @property
+    def meta(self) -> Dict:
+        if self._meta is None:
+            if self.meta_file.exists():
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    self._meta = json.load(f)
+            if not self._meta or self._meta.get("dim") != self.dim:
+                self.reset()
+        return self._meta
+
+    def reload(self):
+        self._meta = None
+
+    def save_meta(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.meta_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_file, self.meta_file)
+
+    def reset(self, epoch: str = ""):
+        """清空向量，条目需重新向量化"""
+        for path in (self.matrix_file, self.keys_file):
+            if path.exists():
+                path.unlink()
+        self._meta = {"dim": self.dim, "epoch": epoch}
+
+    def append(self, keys: List[str], texts: List[str]):
+        """向量化并追加一批条目"""
+        if not keys:
+            return
+        require_numpy()
+        matrix = np.vstack([embed(text, self.dim) for text in texts]).astype(np.float32)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.matrix_file, 'ab') as f:
+            f.write(matrix.tobytes())
+        with open(self.keys_file, 'a', encoding='utf-8') as f:
+            f.writelines(f"{key}\n" for key in keys)
+
+    def _load(self) -> Tuple[Optional["np.memmap"], List[str]]:
+        """只读映射矩阵；进程崩溃导致行数不一致时取两者较小值"""
+        if not self.matrix_file.exists() or not self.keys_file.exists():
+            return None, []
+        with open(self.keys_file, 'r', encoding='utf-8') as f:
+            keys = f.read().splitlines()
+        rows = min(len(keys), self.matrix_file.stat().st_size // (self.dim * 4))
+        if rows == 0:
+            return None, []
+        matrix = np.memmap(self.matrix_file, dtype=np.float32, mode='r',
+                           shape=(rows, self.dim))
+        return matrix, keys[:rows]
+
+    def nearest(self, query: str, accept: Callable[[str], Optional[Dict]],
+                k: int) -> List[Dict]:
+        """
+        余弦相似度最高的 k 个通过 accept 校验的条目（只返回相似度为正的条目）
+
+        先取 4k 个候选，失效或被过滤掉的条目过多时候选数翻倍重试。
+        """
+        require_numpy()
+        matrix, keys = self._load()
+        if matrix is None:
+            return []
+
+        scores = self._scores(matrix, embed(query, self.dim))
+        want = min(len(scores), max(k * 4, 32))
+        while True:
+            top = np.argpartition(-scores, want - 1)[:want]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for row in top:
+                # 相似度不为正的条目与查询没有共同特征
+                if scores[row] <= 0:
+                    return results
+                entry = accept(keys[row])
+                if entry is not None:
+                    entry['similarity'] = float(scores[row])
+                    results.append(entry)
+                    if len(results) >= k:
+                        return results
+            if want >= len(scores):
+                return results
+            want = min(len(scores), want * 2)
+
+    def similarities(self, query: str, keys: List[str]) -> Dict[str, float]:
+        """计算指定条目与查询的相似度，未向量化的条目不返回"""
+        require_numpy()
+        matrix, all_keys = self._load()
+        if matrix is None:
+            return {}
+        wanted = set(keys)
+        rows = {key: row for row, key in enumerate(all_keys) if key in wanted}
+        if not rows:
+            return {}
+        qvec = embed(query, self.dim)
+        order = list(rows.items())
+        sims = matrix[[row for _, row in order]] @ qvec
+        return {key: float(sim) for (key, _), sim in zip(order, sims)}
+
+    def hybrid_scores(self, query: str, keyword: Dict[str, float], alpha: float,
+                      depth: int, valid: Callable[[str], bool]) -> Dict[str, float]:
+        """
+        混合打分：alpha * 余弦相似度 + (1 - alpha) * 归一化关键词得分
+
+        Args:
+            query: 查询
+            keyword: 关键词检索的 {条目键: 得分}
+            alpha: 语义得分权重 (0-1)
+            depth: 语义候选数
+            valid: 判断条目键是否仍然有效
+        """
+        semantic = {entry['key']: entry['similarity'] for entry in self.nearest(
+            query, lambda key: {'key': key} if valid(key) else None, depth)}
+        semantic.update(self.similarities(
+            query, [key for key in keyword if key not in semantic]))
+
+        top = max(keyword.values(), default=0.0)
+        combined = {key: alpha * max(semantic.get(key, 0.0), 0.0)
+                    + (1 - alpha) * (keyword.get(key, 0.0) / top if top else 0.0)
+                    for key in set(semantic) | set(keyword)}
+        return {key: score for key, score in combined.items() if score > 0}
+
+    @staticmethod
+    def _scores(matrix, qvec):
+        """分块批量点积，避免一次性把整个映射矩阵读入内存"""
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], CHUNK_ROWS):
+            scores[start:start + CHUNK_ROWS] = matrix[start:start + CHUNK_ROWS] @ qvec
+        return scores
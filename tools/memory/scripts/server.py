@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+记忆守护进程
+常驻内存持有存储后端、倒排表缓存和最近读取的条目，通过 Unix 套接字提供捕获/回忆/整合，
+并定期检查记忆目录，索引在守护进程之外被修改的日志文件。
+
+capture.py / recall.py / consolidate.py 检测到套接字时自动转发请求，命令行参数不变；
+守护进程未运行时照常在本进程内执行。
+
+守护进程在内存中累计每个请求的计量数据（见 metrics.py），可经 metrics 操作或
+--metrics-port 的 HTTP /metrics 以 Prometheus 文本格式读取。
+
+用法:
+    python server.py --memory-dir memory
+    python server.py --memory-dir memory --backend sqlite --poll 2
+    python server.py --memory-dir memory --metrics-port 9108 --metrics
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+import http.server
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from protocol import BACKENDS, OPERATIONS, socket_path, connect, encode
+from metrics import Aggregate, log_sinks
+from storage import open_store
+from capture import MemoryCapture
+from recall import MemoryRecall
+from consolidate import MemoryConsolidate
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """每个连接处理一行请求"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            result = self.server.dispatch(request.get("op"), request.get("params") or {})
+            response = {"ok": True, "result": result}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write(encode(response))
+
+
+# Windows 上没有 Unix 套接字，main 中会提前退出
+_UnixStreamServer = getattr(socketserver, 'UnixStreamServer', socketserver.TCPServer)
+
+
+class MemoryServer(_UnixStreamServer):
+    """
+    记忆守护进程
+
+    请求逐个串行处理：存储对象（含 SQLite 连接）只在服务线程中使用，
+    单次检索在内存缓存命中时远快于建立连接本身。
+    """
+
+    def __init__(self, memory_dir: str = "memory", backend: str = "markdown",
+                 path: str = None, poll: float = 1.0, metric_sinks: Optional[List] = None):
+        self.memory_dir = Path(memory_dir)
+        self.memory_dir.mkdir(exist_ok=True)
+        self.backend = backend
+        self.path = Path(path) if path else socket_path(memory_dir, backend)
+        self.poll = poll
+        self._last_refresh = 0.0
+
+        # 计量数据始终在内存中累计，另可追加写入指标文件
+        self.aggregate = Aggregate(memory_dir)
+        sinks = [self.aggregate] + list(metric_sinks or [])
+
+        self.store = open_store(memory_dir, backend, resident=True)
+        self.capture = MemoryCapture(memory_dir, backend, store=self.store, metric_sinks=sinks)
+        self.recall = MemoryRecall(memory_dir, backend, store=self.store, metric_sinks=sinks)
+        self.consolidate = MemoryConsolidate(memory_dir, backend, store=self.store,
+                                             metric_sinks=sinks)
+
+        # 预热：建立索引并读入元数据
+        self.store.refresh()
+        self._last_refresh = time.monotonic()
+
+        self._claim_socket()
+        super().__init__(str(self.path), _RequestHandler)
+        os.chmod(self.path, 0o600)
+
+    def _claim_socket(self):
+        """已有守护进程在监听时拒绝启动，否则清理残留的套接字文件"""
+        conn = connect(self.memory_dir, self.backend, self.path)
+        if conn is not None:
+            conn.close()
+            raise RuntimeError(f"守护进程已在运行: {self.path}")
+        if self.path.exists():
+            self.path.unlink()
+
+    def dispatch(self, op: str, params: Dict) -> Any:
+        if op not in OPERATIONS:
+            raise ValueError(f"未知的操作: {op}")
+        if op == "ping":
+            return {"pid": os.getpid(), "backend": self.backend,
+                    "memory_dir": str(self.memory_dir)}
+        if op == "capture":
+            return self.capture.capture(**params)
+        if op == "capture_batch":
+            return self.capture.capture_batch(**params)
+        if op == "recall":
+            return self.recall.recall(**params)
+        if op == "metrics":
+            return self.aggregate.render()
+        return self.consolidate.consolidate(**params)
+
+    def service_actions(self):
+        """serve_forever 每轮调用：按间隔检查目录中的外部修改"""
+        now = time.monotonic()
+        if now - self._last_refresh >= self.poll:
+            self.store.refresh()
+            self._last_refresh = now
+
+    def server_close(self):
+        super().server_close()
+        self.store.close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+def serve_metrics(aggregate: Aggregate, port: int, host: str = "127.0.0.1"
+                  ) -> http.server.HTTPServer:
+    """在后台线程中以 HTTP 提供 /metrics，供 Prometheus 抓取"""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = aggregate.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆守护进程')
+    parser.add_argument('--memory-dir', '-d', default='memory',
+                        help='记忆目录')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--socket', help='套接字路径 (默认: 记忆目录下的 .memory-<后端>.sock)')
+    parser.add_argument('--poll', type=float, default=1.0,
+                        help='检查外部修改的间隔秒数 (默认: 1)')
+    parser.add_argument('--metrics', nargs='?', const='', metavar='FILE',
+                        help='另将计量数据追加到文件 (默认: 记忆目录下的 .index/metrics.jsonl)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='在 127.0.0.1 的此端口以 HTTP 提供 /metrics')
+
+    args = parser.parse_args()
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print("当前平台不支持 Unix 套接字，无法启动守护进程")
+        sys.exit(1)
+
+    try:
+        server = MemoryServer(args.memory_dir, args.backend, args.socket, args.poll,
+                              log_sinks(args.memory_dir, args.metrics))
+    except RuntimeError as e:
+        print(f"启动失败: {e}")
+        sys.exit(1)
+
+    if args.metrics_port:
+        try:
+            serve_metrics(server.aggregate, args.metrics_port)
+        except OSError as e:
+            server.server_close()
+            print(f"启动失败: 无法监听指标端口 {args.metrics_port}: {e}")
+            sys.exit(1)
+        print(f"✓ 指标: http://127.0.0.1:{args.metrics_port}/metrics")
+
+    # SIGTERM 与 Ctrl-C 一样正常退出并清理套接字
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"✓ 记忆守护进程已启动: {server.path}")
+    try:
+        server.serve_forever(poll_interval=min(args.poll, 0.5))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
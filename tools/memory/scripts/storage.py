@@ -0,0 +1,1251 @@
+#!/usr/bin/env python3
+"""
+记忆存储后端
+capture、recall、consolidate 通过统一的 MemoryStore 接口读写记忆
+
+后端:
+    markdown  每日日志 + 倒排索引（默认）
+    sqlite    memory/memory.db，FTS5 全文检索，分类/标签/日期走 SQL 索引
+
+用法:
+    python storage.py import --memory-dir memory --archive
+    python storage.py export --memory-dir memory --output memory-export
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import argparse
+import itertools
+from pathlib import Path
+from datetime import datetime
+from collections import defaultdict
+from typing import List, Dict, Optional, Iterable, Tuple, Union
+
+import metrics
+from budget import plain_content
+from bytescan import byte_matcher, mapped
+from inverted_index import (InvertedIndex, EntrySpan, iter_entry_spans, iter_mapped_spans,
+                            query_terms, tokenize)
+from journal import IndexJournal, memory_lock
+from query import BooleanQuery, parse_query, intersect, union
+from ranking import recency_weight, top_k
+from semantic import VectorIndex, np, require_numpy
+from segments import SegmentArchive
+
+
+def format_entry(date_str: str, time_str: str, category: str, content: str,
+                 source: str = "", tags: Optional[List[str]] = None) -> str:
+    """按日志格式构建记忆条目"""
+    memory_entry = f"""
+## {date_str} {time_str} [{category.upper()}]
+
+**内容**: {content}
+
+"""
+    if source:
+        memory_entry += f"**来源**: {source}\n\n"
+
+    if tags:
+        tag_str = " ".join(f"#{tag}" for tag in tags)
+        memory_entry += f"**标签**: {tag_str}\n\n"
+
+    memory_entry += "---\n"
+    return memory_entry
+
+
+def entry_from_span(span: EntrySpan) -> Dict:
+    """由解析出的条目构建条目字典"""
+    date_str, time_str, category, body = span.date, span.time, span.category, span.body
+    entry = {
+        'date': date_str,
+        'time': time_str,
+        'category': category,
+        'content': body.strip(),
+        'raw': f"## {date_str} {time_str} [{category}]\n\n{body}"
+    }
+
+    # 提取标签
+    tag_match = re.search(r'\*\*标签\*\*:\s*(.+)', body)
+    if tag_match:
+        entry['tags'] = [t.strip('#') for t in tag_match.group(1).split()]
+    else:
+        entry['tags'] = []
+
+    return entry
+
+
+def _span_digest(span: EntrySpan) -> str:
+    """条目原文的摘要，用于在改写过的文件中确认条目仍是扫描时的那一条"""
+    return hashlib.sha1(span.text.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_entries(content: str) -> List[Dict]:
+    """解析记忆条目"""
+    return [entry_from_span(span) for span in iter_entry_spans(content.encode('utf-8'))]
+
+
+def entry_matches(entry: Dict, query: Union[str, BooleanQuery], category: Optional[str] = None,
+                  tags: Optional[List[str]] = None, date_from: Optional[str] = None,
+                  date_to: Optional[str] = None) -> bool:
+    """检查条目是否匹配查询条件，query 为字符串（整串子串）或布尔查询"""
+    # 检查关键词
+    if isinstance(query, BooleanQuery):
+        if not query.matches(entry['content'], entry['category']):
+            return False
+    else:
+        query_lower = query.lower()
+        if query_lower not in entry['content'].lower() and \
+           query_lower not in entry['category'].lower():
+            return False
+
+    # 检查分类
+    if category and entry['category'].lower() != category.lower():
+        return False
+
+    # 检查标签
+    if tags:
+        entry_tags = set(t.lower() for t in entry['tags'])
+        if not any(t.lower() in entry_tags for t in tags):
+            return False
+
+    # 检查日期
+    if date_from and entry['date'] < date_from:
+        return False
+    if date_to and entry['date'] > date_to:
+        return False
+
+    return True
+
+
+def query_matcher(query: Union[str, BooleanQuery]):
+    """查询的字节预筛（见 bytescan.py）；布尔查询取必然出现的最长词项"""
+    if isinstance(query, BooleanQuery):
+        required = query.required()
+        return byte_matcher(required) if required else None
+    return byte_matcher(query)
+
+
+class MemoryStore:
+    """存储后端接口"""
+
+    def add(self, date_str: str, time_str: str, category: str, content: str,
+            source: str = "", tags: Optional[List[str]] = None) -> str:
+        """写入一条记忆，返回存储位置"""
+        return self.add_batch([{'date': date_str, 'time': time_str, 'category': category,
+                                'content': content, 'source': source, 'tags': tags}])[0]
+
+    def add_batch(self, records: List[Dict]) -> List[str]:
+        """
+        批量写入记忆
+
+        Args:
+            records: [{'date', 'time', 'category', 'content', 'source', 'tags'}]
+
+        Returns:
+            与 records 一一对应的存储位置
+        """
+        raise NotImplementedError
+
+    def search(self, query: str, category: Optional[str] = None,
+               tags: Optional[List[str]] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None, limit: int = 10,
+               sort: str = "relevance", half_life: Optional[float] = None,
+               mode: str = "keyword", alpha: float = 0.5,
+               include_archived: bool = True, budget=None) -> List[Dict]:
+        """
+        搜索记忆
+
+        sort 为 relevance 时按 BM25 得分返回 top-k（条目带 score），
+        half_life 指定新近度衰减的半衰期天数；为 date 时按日期倒序返回。
+        mode 为 semantic/hybrid 时按向量相似度（条目带 similarity）或混合得分排序，
+        只应用分类/标签/日期过滤，不要求关键词字面命中；alpha 为混合打分中语义得分的权重。
+        include_archived 为真时关键词检索同时覆盖归档层，归档条目带 archived=True。
+        budget 为 budget.ContextBudget 时在 limit 之内按排序贪心装入预算，
+        条目带 snippet（命中词附近的片段）与 cost；能在读取前得知条目长度的后端据此跳过放不下的候选。
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _collect(results: List[Dict], entry: Dict, limit: int, budget=None) -> bool:
+        """按顺序收集结果（有预算时须放得下），返回是否已收集完毕"""
+        if budget is None or budget.take(entry):
+            results.append(entry)
+        return len(results) >= limit or (budget is not None and budget.exhausted)
+
+    @staticmethod
+    def _pack(entries: List[Dict], budget=None) -> List[Dict]:
+        """已排好序的结果按预算装入（语义检索的候选在向量索引内部重试，只能事后装入）"""
+        if budget is None:
+            return entries
+        return [entry for entry in entries if not budget.exhausted and budget.take(entry)]
+
+    def iter_entries(self) -> Iterable[Dict]:
+        """遍历全部未归档条目，每项带有可传给 remove 的 id"""
+        raise NotImplementedError
+
+    def iter_sources(self) -> Iterable[Tuple[str, str]]:
+        """
+        按天划分的数据源 (键, 快速指纹)
+
+        快速指纹不读取内容即可得到（如文件大小 + mtime），指纹不变即可认为内容未变。
+        """
+        raise NotImplementedError
+
+    def load_source(self, key: str) -> Tuple[str, List[Dict]]:
+        """读取一个数据源，返回 (内容哈希, 条目列表)"""
+        raise NotImplementedError
+
+    def remove(self, entries: List[Dict]) -> int:
+        """删除条目，返回实际删除数"""
+        raise NotImplementedError
+
+    def archive(self, before_date: str, dry_run: bool = False) -> int:
+        """归档指定日期之前的记忆，返回归档数量"""
+        raise NotImplementedError
+
+    def refresh(self):
+        """常驻进程定期调用：载入其他进程的写入并索引外部修改过的文件"""
+
+    def rebuild(self, entry_counts: Optional[Dict[str, int]] = None):
+        """
+        整合后重建/压缩索引
+
+        Args:
+            entry_counts: 各数据源的条目数；调用方已知时传入，免去重新读取
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MarkdownStore(MemoryStore):
+    """每日 markdown 日志存储"""
+
+    def __init__(self, memory_dir: str = "memory", resident: bool = False):
+        """
+        Args:
+            memory_dir: 记忆目录
+            resident: 常驻进程模式，在内存中缓存倒排表与条目原文，
+                      由调用方定期 refresh 而不是每次检索前扫描目录
+        """
+        self.memory_dir = Path(memory_dir)
+        self.archive_dir = self.memory_dir / "archive"
+        self.index = InvertedIndex(memory_dir, cache=resident)
+        self.vectors = VectorIndex(self.index.index_dir)
+        self.segments = SegmentArchive(self.archive_dir)
+        self.lock = memory_lock(memory_dir)
+        self.journal = IndexJournal(memory_dir, self.lock)
+        self.sync_on_search = not resident
+
+    def add_batch(self, records: List[Dict]) -> List[str]:
+        # 按日期分组，每个日志文件只追加写入一次
+        by_date = defaultdict(list)
+        for record in records:
+            by_date[record['date']].append(record)
+
+        self.memory_dir.mkdir(exist_ok=True)
+        locations = {}
+        m = metrics.current()
+
+        with self.lock:
+            self.index.refresh()
+            for date_str, day_records in by_date.items():
+                memory_file = self.memory_dir / f"{date_str}.md"
+                size_before = memory_file.stat().st_size if memory_file.exists() else 0
+                prefix = "" if memory_file.exists() else f"# 记忆日志 - {date_str}\n\n"
+                chunk = prefix + "".join(
+                    format_entry(r['date'], r['time'], r['category'], r['content'],
+                                 r.get('source') or "", r.get('tags'))
+                    for r in day_records)
+
+                # 写入文件
+                with open(memory_file, 'a' if size_before else 'w', encoding='utf-8') as f:
+                    f.write(chunk)
+                m.add('bytes_written', len(chunk.encode('utf-8')))
+                m.lap('write')
+
+                # 更新倒排索引
+                spans = list(iter_entry_spans(chunk.encode('utf-8'), size_before))
+                self.index.add_entries(memory_file, spans, size_before, save=False)
+                locations[date_str] = str(memory_file)
+            self.index.save_meta()
+            m.lap('index')
+
+            # 已启用语义检索时同步向量化新条目
+            if np is not None and self.vectors.meta_file.exists():
+                self.vectors.reload()
+                self._sync_vectors()
+
+            # 追加索引记录，由 consolidate 定期压缩进 index.json
+            self.journal.append_many([{
+                "date": r['date'],
+                "time": r['time'],
+                "category": r['category'],
+                "preview": r['content'][:100] + "..." if len(r['content']) > 100 else r['content'],
+                "tags": r.get('tags') or []
+            } for r in records])
+            m.lap('write')
+
+        return [locations[r['date']] for r in records]
+
+    def search(self, query: str, category: Optional[str] = None,
+               tags: Optional[List[str]] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None, limit: int = 10,
+               sort: str = "relevance", half_life: Optional[float] = None,
+               mode: str = "keyword", alpha: float = 0.5,
+               include_archived: bool = True, budget=None) -> List[Dict]:
+        # 补索引在外部新增或修改的文件，再只读取倒排表命中的条目；
+        # 只有确实需要补索引时才取写锁，与并发的 capture/consolidate 互斥
+        m = metrics.current()
+        if self.sync_on_search:
+            self.index.refresh()
+            if self.index.changed():
+                self.refresh()
+
+        if mode != "keyword":
+            return self._semantic_search(query, category, tags, date_from, date_to,
+                                         limit, half_life, mode, alpha, budget)
+
+        boolean = parse_query(query)
+        if boolean is not None:
+            return self._boolean_search(boolean, category, tags, date_from, date_to, limit,
+                                        sort, half_life, include_archived, budget)
+
+        terms = query_terms(query)
+        if sort == "relevance" and terms:
+            # 归档层只解压词项字典命中的块，与近期日志按同一套 BM25 统计量打分
+            cold = self.segments.match(terms, date_from, date_to) if include_archived else None
+            cold_spans = {hit.key: hit.span for hit in cold.hits} if cold else {}
+            matcher = query_matcher(query)
+            scored = [(score, key) for score, key in self.index.ranked(query, half_life, cold)
+                      if key in cold_spans or self._in_range(Path(key[0]).stem,
+                                                             date_from, date_to)]
+
+            def accept(key):
+                m.lap('lookup')
+                if key in cold_spans:
+                    entries = [self._archived_entry(cold_spans[key])]
+                else:
+                    entries = parse_entries(self.index.read_entry(*key[:3], matcher))
+                return self._first_match(entries, query, category, tags, date_from, date_to)
+
+            # 键的最后一项是条目内容的字符数（近期与归档条目相同）
+            return top_k(scored, accept, limit, budget,
+                         lambda key: budget.bound(key[-1]))
+
+        candidates = self.index.lookup(query)
+        m.lap('lookup')
+        if candidates is None:
+            results = self._scan(query, category, tags, date_from, date_to, limit, budget)
+        else:
+            results = self._read_candidates(candidates, query, category, tags,
+                                            date_from, date_to, limit, budget)
+
+        # 近期日志不足 limit 条时继续检索归档层（归档的日期都更早）
+        if include_archived and len(results) < limit and \
+                (budget is None or not budget.exhausted):
+            if terms:
+                spans = sorted((hit.span for hit in
+                                self.segments.match(terms, date_from, date_to).hits),
+                               key=lambda span: span.date, reverse=True)
+            else:
+                spans = self.segments.iter_spans(date_from, date_to)
+            self._extend_archived(results, spans, query, category, tags, date_from, date_to,
+                                  limit, budget)
+
+        return results
+
+    def _boolean_search(self, query: BooleanQuery, category: Optional[str],
+                        tags: Optional[List[str]], date_from: Optional[str],
+                        date_to: Optional[str], limit: int, sort: str,
+                        half_life: Optional[float], include_archived: bool,
+                        budget=None) -> List[Dict]:
+        """
+        布尔查询：各词项的倒排候选按查询结构求交/并，每个候选条目只校验一遍
+
+        无法用索引缩小候选（NOT 或含不可索引词项的 OR 分支）时按日期全量扫描；
+        相关度只为近期日志打分，近期不足 limit 条时按日期倒序补充归档条目。
+        """
+        m = metrics.current()
+        candidates = self.index.plan(query)
+        m.lap('lookup')
+        if candidates is None:
+            results = self._scan(query, category, tags, date_from, date_to, limit, budget)
+        elif sort == "relevance":
+            candidates = {key: posting for key, posting in candidates.items()
+                          if self._in_range(Path(key[0]).stem, date_from, date_to)}
+            scored = self.index.score(candidates, query.text, half_life)
+            matcher = query_matcher(query)
+
+            def accept(key):
+                m.lap('lookup')
+                entries = parse_entries(self.index.read_entry(*key[:3], matcher))
+                return self._first_match(entries, query, category, tags, date_from, date_to)
+
+            results = top_k(scored, accept, limit, budget, lambda key: budget.bound(key[-1]))
+        else:
+            keys = sorted((name, offset, posting[0], posting[3])
+                          for (name, offset), posting in candidates.items())
+            keys.sort(key=lambda c: c[0], reverse=True)
+            results = self._read_candidates(keys, query, category, tags,
+                                            date_from, date_to, limit, budget)
+
+        if include_archived and len(results) < limit and \
+                (budget is None or not budget.exhausted):
+            def leaf(text):
+                terms = query_terms(text)
+                if not terms:
+                    return None
+                return {hit.key: hit.span for hit in
+                        self.segments.match(terms, date_from, date_to).hits}
+
+            cold = query.reduce(leaf, intersect, union)
+            if cold is None:
+                spans = self.segments.iter_spans(date_from, date_to)
+            else:
+                spans = sorted(cold.values(), key=lambda span: span.date, reverse=True)
+            self._extend_archived(results, spans, query, category, tags, date_from, date_to,
+                                  limit, budget)
+        return results
+
+    @staticmethod
+    def _first_match(entries: List[Dict], query: Union[str, BooleanQuery],
+                     category: Optional[str], tags: Optional[List[str]],
+                     date_from: Optional[str], date_to: Optional[str]) -> Optional[Dict]:
+        """校验读出的条目，返回第一个匹配的"""
+        m = metrics.current()
+        m.lap('parse')
+        m.add('entries_examined', len(entries))
+        for entry in entries:
+            if entry_matches(entry, query, category, tags, date_from, date_to):
+                m.lap('match')
+                return entry
+        m.lap('match')
+        return None
+
+    def _extend_archived(self, results: List[Dict], spans: Iterable[EntrySpan],
+                         query: Union[str, BooleanQuery], category: Optional[str],
+                         tags: Optional[List[str]], date_from: Optional[str],
+                         date_to: Optional[str], limit: int, budget=None):
+        """用归档条目补足结果"""
+        m = metrics.current()
+        for span in spans:
+            m.lap('parse')
+            if budget is not None and \
+                    budget.bound(len(plain_content(span.body))) > budget.remaining:
+                continue
+            entry = self._archived_entry(span)
+            m.add('entries_examined')
+            matched = entry_matches(entry, query, category, tags, date_from, date_to)
+            m.lap('match')
+            if matched and self._collect(results, entry, limit, budget):
+                break
+
+    def _read_candidates(self, candidates: List[Tuple[str, int, int, int]],
+                         query: Union[str, BooleanQuery],
+                         category: Optional[str], tags: Optional[List[str]],
+                         date_from: Optional[str], date_to: Optional[str],
+                         limit: int, budget=None) -> List[Dict]:
+        """按倒排表候选 (文件名, 偏移, 长度, 内容字符数) 读取并校验条目"""
+        # 文件名即日期，日期过滤无需读取文件
+        candidates = [c for c in candidates
+                      if self._in_range(Path(c[0]).stem, date_from, date_to)]
+        if budget is not None:
+            # 惰性过滤：每个候选读取前按当时的剩余预算判断
+            candidates = (c for c in candidates if budget.bound(c[3]) <= budget.remaining)
+
+        m = metrics.current()
+        results = []
+        # 原文不含查询的候选（如只命中包含该子串的其他词）不解码
+        for _, text in self.index.read_entries((c[:3] for c in candidates),
+                                               query_matcher(query)):
+            entries = parse_entries(text)
+            m.lap('parse')
+            m.add('entries_examined', len(entries))
+            for entry in entries:
+                matched = entry_matches(entry, query, category, tags, date_from, date_to)
+                m.lap('match')
+                if matched and self._collect(results, entry, limit, budget):
+                    return results
+
+        return results
+
+    @staticmethod
+    def _archived_entry(span: EntrySpan) -> Dict:
+        entry = entry_from_span(span)
+        entry['archived'] = True
+        return entry
+
+    @staticmethod
+    def _vector_key(name: str, gen: int, offset: int, length: int) -> str:
+        return f"{name}:{gen}:{offset}:{length}"
+
+    def _vector_valid(self, key: str) -> bool:
+        name, gen, _, _ = key.rsplit(':', 3)
+        info = self.index.meta["files"].get(name)
+        return bool(info) and info["gen"] == int(gen)
+
+    def _sync_vectors(self):
+        """向量化倒排索引中尚未向量化的条目，文件被重建索引后整体重新向量化"""
+        epoch = self.index.meta.get("epoch", "")
+        if self.vectors.meta.get("epoch") != epoch:
+            self.vectors.reset(epoch)
+        done_files = self.vectors.meta.setdefault("files", {})
+
+        changed = False
+        for name, info in self.index.meta["files"].items():
+            done = done_files.get(name)
+            if done and done["gen"] == info["gen"] and done["size"] == info["size"]:
+                continue
+            start = done["size"] if done and done["gen"] == info["gen"] else 0
+
+            # 同一代数下文件只追加，从上次同步的位置接着解析
+            keys, texts = [], []
+            with open(self.memory_dir / name, 'rb') as f:
+                f.seek(start)
+                for span in iter_entry_spans(f, start, info["size"]):
+                    keys.append(self._vector_key(name, info["gen"], span.offset, span.length))
+                    texts.append(span.body)
+            self.vectors.append(keys, texts)
+            done_files[name] = {"gen": info["gen"], "size": info["size"]}
+            changed = True
+
+        if changed or not self.vectors.meta_file.exists():
+            self.vectors.save_meta()
+
+    def _semantic_search(self, query: str, category: Optional[str], tags: Optional[List[str]],
+                         date_from: Optional[str], date_to: Optional[str], limit: int,
+                         half_life: Optional[float], mode: str, alpha: float,
+                         budget=None) -> List[Dict]:
+        """语义或混合检索"""
+        require_numpy()
+        with self.lock:
+            self.vectors.reload()
+            self._sync_vectors()
+
+        def accept(key):
+            if not self._vector_valid(key):
+                return None
+            name, _, offset, length = key.rsplit(':', 3)
+            if not self._in_range(Path(name).stem, date_from, date_to):
+                return None
+            for entry in parse_entries(self.index.read_entry(name, int(offset), int(length))):
+                if entry_matches(entry, "", category, tags, date_from, date_to):
+                    return entry
+            return None
+
+        if mode == "semantic":
+            return self._pack(self.vectors.nearest(query, accept, limit), budget)
+
+        files = self.index.meta["files"]
+        keyword = {}
+        chars = {}
+        for score, (name, offset, length, content_chars) in self.index.ranked(query) or []:
+            key = self._vector_key(name, files[name]["gen"], offset, length)
+            keyword[key] = score
+            chars[key] = content_chars
+        combined = self.vectors.hybrid_scores(query, keyword, alpha, limit * 4,
+                                              self._vector_valid)
+        scored = [(score * recency_weight(Path(key.rsplit(':', 3)[0]).stem, half_life), key)
+                  for key, score in combined.items()]
+        # 只有语义命中的条目不知道内容长度，按空内容估计下限
+        return top_k(scored, accept, limit, budget, lambda key: budget.bound(chars.get(key, 0)))
+
+    @staticmethod
+    def _in_range(date_str: str, date_from: Optional[str], date_to: Optional[str]) -> bool:
+        if date_from and date_str < date_from:
+            return False
+        if date_to and date_str > date_to:
+            return False
+        return True
+
+    def _scan(self, query: Union[str, BooleanQuery], category: Optional[str], tags: Optional[List[str]],
+              date_from: Optional[str], date_to: Optional[str], limit: int,
+              budget=None) -> List[Dict]:
+        """
+        全量扫描所有记忆文件，用于无法使用索引的查询；凑够 limit 条即停止读取
+
+        日志经内存映射在原文字节上查找查询，只为命中的条目构建字符串
+        """
+        m = metrics.current()
+        # 空查询按分类过滤时，以头部行的 [分类] 作字节预筛
+        matcher = query_matcher(query) or (byte_matcher(f"[{category}]") if category else None)
+        results = []
+
+        # 搜索所有记忆文件
+        memory_files = sorted(self.index.memory_files(), reverse=True)
+        m.lap('glob')
+        for memory_file in memory_files:
+            if not self._in_range(memory_file.stem, date_from, date_to):
+                continue
+
+            m.add('files_scanned')
+            with mapped(memory_file) as view:
+                # 查找与解析交替进行，耗时计入 parse
+                for span in iter_mapped_spans(view, matcher):
+                    entry = entry_from_span(span)
+                    m.lap('parse')
+                    m.add('entries_examined')
+                    matched = entry_matches(entry, query, category, tags, date_from, date_to)
+                    m.lap('match')
+                    if matched and self._collect(results, entry, limit, budget):
+                        m.add('bytes_scanned', span.offset + span.length)
+                        return results
+                m.add('bytes_scanned', len(view))
+
+        return results
+
+    @staticmethod
+    def _file_entries(name: str, lines: Iterable[bytes]) -> Iterable[Dict]:
+        for span in iter_entry_spans(lines):
+            entry = entry_from_span(span)
+            entry.update({
+                'id': f"{name}:{span.offset}",
+                'file': name,
+                'offset': span.offset,
+                'length': span.length,
+                'digest': _span_digest(span),
+            })
+            yield entry
+
+    def iter_entries(self) -> Iterable[Dict]:
+        for memory_file in sorted(self.index.memory_files()):
+            with open(memory_file, 'rb') as f:
+                yield from self._file_entries(memory_file.name, f)
+
+    def iter_sources(self) -> Iterable[Tuple[str, str]]:
+        m = metrics.current()
+        for memory_file in sorted(self.index.memory_files()):
+            stat = memory_file.stat()
+            m.lap('glob')
+            yield memory_file.name, f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def load_source(self, key: str) -> Tuple[str, List[Dict]]:
+        m = metrics.current()
+        digest = hashlib.sha1()
+
+        def hashed(f):
+            for line in f:
+                digest.update(line)
+                yield line
+
+        with open(self.memory_dir / key, 'rb') as f:
+            entries = list(self._file_entries(key, hashed(f)))
+            m.add('files_scanned')
+            m.add('bytes_scanned', f.tell())
+        m.add('entries_examined', len(entries))
+        # 边读边解析，读取耗时计入 parse
+        m.lap('parse')
+        return digest.hexdigest(), entries
+
+    def remove(self, entries: List[Dict]) -> int:
+        by_file = defaultdict(list)
+        located = {}
+        for entry in entries:
+            by_file[entry['file']].append(
+                (entry['offset'], entry['length'], entry.get('digest')))
+            located[entry['file'], entry['offset'], entry['length']] = entry
+
+        removed = []
+        m = metrics.current()
+        with self.lock:
+            for name, spans in by_file.items():
+                memory_file = self.memory_dir / name
+                try:
+                    with open(memory_file, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    m.add('entries_stale', len(spans))
+                    continue
+
+                # 条目位置来自不持锁的扫描，期间文件可能已被其他进程改写，按当前内容重新定位
+                targets = self._locate(data, spans)
+                m.add('entries_stale', len(spans) - len(targets))
+                if not targets:
+                    continue
+
+                # 从后往前删除，前面条目的偏移保持不变
+                for offset, length in sorted(targets, reverse=True):
+                    start, end = offset, offset + length
+                    if data[end:end + 4] == b"\n---":
+                        line_end = data.find(b"\n", end + 1)
+                        end = len(data) if line_end == -1 else line_end + 1
+                    if start > 0 and data[start - 1:start] == b"\n":
+                        start -= 1
+                    data = data[:start] + data[end:]
+                    removed.append(located[name, offset, length])
+
+                # 写入新文件后替换，正在映射读取旧文件的进程不受截断影响
+                tmp_file = memory_file.with_suffix('.tmp')
+                with open(tmp_file, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_file, memory_file)
+
+            # index.json 快照在下次压缩时去掉这些条目
+            if removed:
+                self.journal.remove(removed)
+
+        m.lap('write')
+        return len(removed)
+
+    @staticmethod
+    def _locate(data: bytes, spans: List[Tuple[int, int, Optional[str]]]) -> set:
+        """
+        待删除条目中仍在原位置、内容未变的那些 (偏移, 长度)
+
+        并发 capture 只在文件末尾追加，原位置的条目仍然有效；其他进程删除过条目后位置前移，
+        这时不按内容去找（完全重复的条目内容相同，可能误删保留的那一份），留给下次整合重新扫描。
+        扫描时尚未写完的末尾条目长度对不上，同样不会删除。
+        """
+        current = {(span.offset, span.length): span for span in iter_entry_spans(data)}
+        targets = set()
+        for offset, length, digest in spans:
+            span = current.get((offset, length))
+            if span is not None and (digest is None or _span_digest(span) == digest):
+                targets.add((offset, length))
+        return targets
+
+    def archive(self, before_date: str, dry_run: bool = False) -> int:
+        cutoff = datetime.strptime(before_date, "%Y-%m-%d")
+        archived = 0
+        days = []
+
+        with self.lock:
+            for memory_file in self.index.memory_files():
+                # 解析文件名日期
+                try:
+                    file_date = datetime.strptime(memory_file.stem, "%Y-%m-%d")
+                except ValueError:
+                    continue
+
+                if file_date < cutoff:
+                    if not dry_run:
+                        # 打包进压缩段，确认全部条目已写入后才删除原文件，回忆仍可检索到
+                        self.segments.pack(memory_file)
+                        if not self.segments.packed(memory_file):
+                            continue
+                        memory_file.unlink()
+                        days.append(memory_file.stem)
+                    archived += 1
+
+            # 旧版本直接移入 archive/ 的日志一并打包
+            if not dry_run and self.archive_dir.exists():
+                for legacy_file in sorted(self.archive_dir.glob("*.md")):
+                    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', legacy_file.stem):
+                        self.segments.pack(legacy_file)
+                        if self.segments.packed(legacy_file):
+                            legacy_file.unlink()
+                            days.append(legacy_file.stem)
+
+            # 归档的日期不再出现在 index.json 快照中
+            if days:
+                self.journal.remove_dates(days)
+
+        metrics.current().lap('write')
+        return archived
+
+    def rebuild(self, entry_counts: Optional[Dict[str, int]] = None):
+        files = []
+
+        if entry_counts is not None:
+            files = [{'file': name, 'date': Path(name).stem, 'entry_count': count}
+                     for name, count in entry_counts.items()]
+        else:
+            for memory_file in self.index.memory_files():
+                with open(memory_file, 'rb') as f:
+                    first_line = f.readline()
+                    # 提取基本信息
+                    date_match = re.search(r'# 记忆日志 - (\d{4}-\d{2}-\d{2})',
+                                           first_line.decode('utf-8', errors='replace'))
+                    if date_match:
+                        files.append({
+                            'file': memory_file.name,
+                            'date': date_match.group(1),
+                            'entry_count': sum(1 for _ in iter_entry_spans(f, len(first_line)))
+                        })
+
+        # 把 capture 追加的 index.jsonl 压缩进 index.json 快照
+        files.sort(key=lambda x: x['date'], reverse=True)
+        with self.lock:
+            self.journal.compact(files)
+
+            # 只重新索引改动过的文件，失效记录过多时才整体重建
+            self.index.refresh()
+            self.index.compact()
+            metrics.current().lap('index')
+
+    def refresh(self):
+        with self.lock:
+            self.index.refresh()
+            self.index.sync()
+
+
+class SQLiteStore(MemoryStore):
+    """SQLite + FTS5 存储"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        category TEXT NOT NULL COLLATE NOCASE,
+        content TEXT NOT NULL,
+        source TEXT NOT NULL DEFAULT '',
+        raw TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        archived INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(archived, date);
+    CREATE INDEX IF NOT EXISTS idx_entries_category ON entries(category, date);
+    -- 只有导入按内容指纹去重，capture 照常写入重复内容（与 markdown 后端一致，留给整合处理）
+    CREATE INDEX IF NOT EXISTS idx_entries_fingerprint ON entries(fingerprint);
+
+    CREATE TABLE IF NOT EXISTS entry_tags (
+        tag TEXT NOT NULL COLLATE NOCASE,
+        entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+        PRIMARY KEY (tag, entry_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_entry_tags_entry ON entry_tags(entry_id);
+
+    -- terms 列存放 tokenize() 的结果，CJK 单字/双字在 unicode61 下各成一个词
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(terms, tokenize='unicode61');
+
+    -- entries_fts 中出现过的 ASCII 词（只增不减），ASCII 查询词按子串展开为包含它的这些词
+    CREATE TABLE IF NOT EXISTS fts_terms (term TEXT PRIMARY KEY) WITHOUT ROWID;
+    """
+
+    # 库结构版本（PRAGMA user_version）：1 起有 fts_terms，2 起 fingerprint 不再唯一
+    SCHEMA_VERSION = 2
+
+    # ASCII 查询词展开出的词超过这么多时不下推到 FTS（长 OR 表达式比扫描还慢），
+    # 由 entry_matches 校验
+    FTS_EXPANSION_LIMIT = 128
+
+    def __init__(self, memory_dir: str = "memory", db_name: str = "memory.db"):
+        self.memory_dir = Path(memory_dir)
+        self.memory_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = self.memory_dir / db_name
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+        self.lock = memory_lock(memory_dir)
+        self.vectors = VectorIndex(self.memory_dir / ".index", name="sqlite-vectors")
+
+    def _migrate(self):
+        """按 PRAGMA user_version 升级旧库，多个进程同时打开时只有一个执行"""
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+            return
+        # 重建 entries 表时不能让外键级联删掉标签；外键开关在事务内无效
+        self.conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < 1:
+                    # 补齐 fts_terms：从 FTS 索引自身的词表中取出 ASCII 词
+                    self.conn.execute("CREATE VIRTUAL TABLE temp.entries_vocab "
+                                      "USING fts5vocab(main, entries_fts, 'row')")
+                    self.conn.execute("INSERT OR IGNORE INTO fts_terms "
+                                      "SELECT term FROM temp.entries_vocab WHERE term < char(128)")
+                    self.conn.execute("DROP TABLE temp.entries_vocab")
+                if version < 2:
+                    self._drop_fingerprint_unique()
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        finally:
+            self.conn.execute("PRAGMA foreign_keys=ON")
+
+    def _drop_fingerprint_unique(self):
+        """旧库的 fingerprint 列带 UNIQUE 约束，按 SCHEMA 中的定义重建 entries 表（保留 id）"""
+        sql = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone()[0]
+        if "UNIQUE" not in sql:
+            return
+        columns = "id, date, time, category, content, source, raw, fingerprint, archived"
+        # SCHEMA 的第一条语句即 entries 表
+        self.conn.execute(self.SCHEMA.split(";")[0].replace("IF NOT EXISTS entries",
+                                                            "entries_new"))
+        self.conn.execute(f"INSERT INTO entries_new ({columns}) SELECT {columns} FROM entries")
+        self.conn.execute("DROP TABLE entries")
+        self.conn.execute("ALTER TABLE entries_new RENAME TO entries")
+        # 索引随旧表删除，按 SCHEMA 补建
+        for statement in self.SCHEMA.split(";")[1:]:
+            if "CREATE INDEX" in statement and " ON entries(" in statement:
+                self.conn.execute(statement)
+
+    def _insert(self, span: EntrySpan, source: str, tags: List[str],
+                archived: bool = False, dedupe: bool = False) -> Optional[int]:
+        """插入一个已解析条目；dedupe 时原文相同的条目已存在则跳过并返回 None"""
+        date_str, time_str, category, body = span.date, span.time, span.category, span.body
+        raw = span.text
+        fingerprint = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        if dedupe and self.conn.execute("SELECT 1 FROM entries WHERE fingerprint = ?",
+                                        (fingerprint,)).fetchone():
+            return None
+        cursor = self.conn.execute(
+            "INSERT INTO entries "
+            "(date, time, category, content, source, raw, fingerprint, archived) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (date_str, time_str, category, body.strip(), source, raw, fingerprint,
+             int(archived)))
+
+        entry_id = cursor.lastrowid
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO entry_tags (tag, entry_id) VALUES (?, ?)",
+            [(tag, entry_id) for tag in tags])
+        terms = tokenize(raw)
+        self.conn.execute(
+            "INSERT INTO entries_fts (rowid, terms) VALUES (?, ?)",
+            (entry_id, " ".join(terms)))
+        # unicode61 把下划线当作分隔符，词表记录的是 FTS 实际索引的词
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO fts_terms (term) VALUES (?)",
+            [(word,) for word in {w for t in terms if t[0] < '\u0080' for w in t.split('_') if w}])
+        return entry_id
+
+    def add_batch(self, records: List[Dict]) -> List[str]:
+        # 整批在一个事务中提交
+        entry_ids = []
+        with self.conn:
+            for r in records:
+                memory_entry = format_entry(r['date'], r['time'], r['category'], r['content'],
+                                            r.get('source') or "", r.get('tags'))
+                span = next(iter_entry_spans(memory_entry.encode('utf-8')))
+                entry_ids.append(self._insert(span, r.get('source') or "", r.get('tags') or []))
+        metrics.current().lap('write')
+
+        # 已启用语义检索时同步向量化新条目
+        if np is not None and self.vectors.meta_file.exists():
+            with self.lock:
+                self.vectors.reload()
+                self._sync_vectors()
+
+        return [f"{self.db_file}#{entry_id}" for entry_id in entry_ids]
+
+    def _sync_vectors(self):
+        """向量化 id 大于已同步位置的条目"""
+        max_id = self.vectors.meta.get("max_id", 0)
+        rows = self.conn.execute(
+            "SELECT id, content FROM entries WHERE id > ? ORDER BY id", (max_id,)).fetchall()
+        if rows:
+            self.vectors.append([str(row['id']) for row in rows],
+                                [row['content'] for row in rows])
+            self.vectors.meta["max_id"] = rows[-1]['id']
+        if rows or not self.vectors.meta_file.exists():
+            self.vectors.save_meta()
+
+    def _fts_query(self, terms: List[str]) -> Optional[str]:
+        """
+        词项全部命中（AND）的 FTS 表达式，ASCII 词项展开为包含它的词（OR）
+
+        含下划线或展开过宽的词项无法下推，不参与过滤；全部词项都无法下推时返回 None。
+        """
+        parts = []
+        for t in terms:
+            if t[0] >= '\u0080':
+                parts.append(f'"{t}"')
+                continue
+            if '_' in t:
+                continue
+            words = [row[0] for row in self.conn.execute(
+                "SELECT term FROM fts_terms WHERE instr(term, ?) > 0 LIMIT ?",
+                (t, self.FTS_EXPANSION_LIMIT + 1))]
+            if len(words) > self.FTS_EXPANSION_LIMIT:
+                continue
+            # 没有任何词包含它时保留原词，表达式照常不命中
+            parts.append("(" + " OR ".join(f'"{w}"' for w in words or [t]) + ")")
+        return " AND ".join(parts) or None
+
+    def _row_to_entry(self, row: sqlite3.Row) -> Dict:
+        tags = row['tags'].split('\x1f') if row['tags'] else []
+        return {
+            'id': row['id'],
+            'date': row['date'],
+            'time': row['time'],
+            'category': row['category'],
+            'content': row['content'],
+            'tags': tags,
+            'raw': row['raw'],
+            'archived': bool(row['archived']),
+        }
+
+    _SELECT = ("SELECT e.*, (SELECT group_concat(tag, char(31)) FROM entry_tags "
+               "WHERE entry_id = e.id) AS tags FROM entries e")
+
+    def search(self, query: str, category: Optional[str] = None,
+               tags: Optional[List[str]] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None, limit: int = 10,
+               sort: str = "relevance", half_life: Optional[float] = None,
+               mode: str = "keyword", alpha: float = 0.5,
+               include_archived: bool = True, budget=None) -> List[Dict]:
+        where = ["1 = 1" if include_archived else "e.archived = 0"]
+        params = []
+
+        if category:
+            where.append("e.category = ?")
+            params.append(category)
+        if tags:
+            where.append("e.id IN (SELECT entry_id FROM entry_tags WHERE tag IN (%s))"
+                         % ",".join("?" * len(tags)))
+            params.extend(tags)
+        if date_from:
+            where.append("e.date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("e.date <= ?")
+            params.append(date_to)
+
+        m = metrics.current()
+        terms = query_terms(query)
+        if mode != "keyword":
+            return self._semantic_search(query, terms, where, params, category, tags,
+                                         date_from, date_to, limit, half_life, mode, alpha,
+                                         budget)
+
+        # 布尔查询的各词项在 FTS 表达式中按同样结构组合；NOT 分支不下推，由 entry_matches 校验
+        condition = parse_query(query) or query
+        if isinstance(condition, BooleanQuery):
+            fts = condition.reduce(lambda text: self._fts_query(query_terms(text)),
+                                   lambda a, b: f"({a}) AND ({b})",
+                                   lambda a, b: f"({a}) OR ({b})")
+        else:
+            fts = self._fts_query(terms) if terms else None
+
+        def accept(row):
+            # SQL 取行的耗时计入 lookup
+            m.lap('lookup')
+            if row is None:
+                # 打分之后被并发的整合删除
+                m.add('entries_stale')
+                return None
+            entry = self._row_to_entry(row)
+            m.lap('parse')
+            m.add('entries_examined')
+            matched = entry_matches(entry, condition, category, tags, date_from, date_to)
+            m.lap('match')
+            return entry if matched else None
+
+        if fts and sort == "relevance":
+            # 只取 id/日期/得分参与堆选，命中后再按 id 取整行
+            scored = [(score * recency_weight(date_str, half_life), entry_id)
+                      for entry_id, date_str, score in self._bm25(fts, where, params)]
+            return top_k(scored, lambda entry_id: accept(self.conn.execute(
+                f"{self._SELECT} WHERE e.id = ?", (entry_id,)).fetchone()), limit, budget)
+
+        if fts:
+            where.append("e.id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)")
+            params.append(fts)
+
+        sql = (f"{self._SELECT} WHERE {' AND '.join(where)} "
+               "ORDER BY e.date DESC, e.time, e.id")
+
+        # FTS 只做候选过滤，子串语义仍由 entry_matches 校验
+        results = []
+        for row in self.conn.execute(sql, params):
+            entry = accept(row)
+            if entry is not None and self._collect(results, entry, limit, budget):
+                break
+        return results
+
+    def _bm25(self, fts: str, where: List[str], params: List) -> List[tuple]:
+        """FTS 表达式命中条目的 (id, 日期, BM25 得分)"""
+        sql = ("SELECT e.id, e.date, -bm25(entries_fts) AS score FROM entries_fts "
+               "JOIN entries e ON e.id = entries_fts.rowid "
+               f"WHERE entries_fts MATCH ? AND {' AND '.join(where)}")
+        return [tuple(row) for row in self.conn.execute(sql, [fts] + params)]
+
+    def _semantic_search(self, query: str, terms: List[str], where: List[str], params: List,
+                         category: Optional[str], tags: Optional[List[str]],
+                         date_from: Optional[str], date_to: Optional[str], limit: int,
+                         half_life: Optional[float], mode: str, alpha: float,
+                         budget=None) -> List[Dict]:
+        """语义或混合检索，过滤条件仍走 SQL"""
+        require_numpy()
+        with self.lock:
+            self.vectors.reload()
+            self._sync_vectors()
+
+        def accept(key):
+            row = self.conn.execute(f"{self._SELECT} WHERE e.id = ? AND {' AND '.join(where)}",
+                                    [int(key)] + params).fetchone()
+            return self._row_to_entry(row) if row else None
+
+        if mode == "semantic":
+            return self._pack(self.vectors.nearest(query, accept, limit), budget)
+
+        keyword = {}
+        dates = {}
+        fts = self._fts_query(terms) if terms else None
+        if fts:
+            for entry_id, date_str, score in self._bm25(fts, where, params):
+                keyword[str(entry_id)] = score
+                dates[str(entry_id)] = date_str
+        combined = self.vectors.hybrid_scores(query, keyword, alpha, limit * 4,
+                                              lambda key: True)
+        if half_life:
+            missing = [int(key) for key in combined if key not in dates]
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                dates.update((str(row[0]), row[1]) for row in self.conn.execute(
+                    "SELECT id, date FROM entries WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+                    chunk))
+        scored = [(score * recency_weight(dates.get(key, ""), half_life), key)
+                  for key, score in combined.items()]
+        return top_k(scored, accept, limit, budget)
+
+    def iter_entries(self) -> Iterable[Dict]:
+        sql = f"{self._SELECT} WHERE e.archived = 0 ORDER BY e.date, e.id"
+        for row in self.conn.execute(sql).fetchall():
+            yield self._row_to_entry(row)
+
+    def iter_sources(self) -> Iterable[Tuple[str, str]]:
+        for row in self.conn.execute(
+                "SELECT date, count(*), max(id), total(length(raw)) FROM entries "
+                "WHERE archived = 0 GROUP BY date ORDER BY date"):
+            yield row[0], f"{row[1]}:{row[2]}:{int(row[3])}"
+
+    def load_source(self, key: str) -> Tuple[str, List[Dict]]:
+        m = metrics.current()
+        rows = self.conn.execute(
+            f"{self._SELECT} WHERE e.archived = 0 AND e.date = ? ORDER BY e.id", (key,)).fetchall()
+        m.lap('read')
+        digest = hashlib.sha1(",".join(str(row['id']) for row in rows).encode()).hexdigest()
+        entries = [self._row_to_entry(row) for row in rows]
+        m.add('entries_examined', len(entries))
+        m.lap('parse')
+        return digest, entries
+
+    def remove(self, entries: List[Dict]) -> int:
+        ids = [(entry['id'],) for entry in entries]
+        with self.conn:
+            self.conn.executemany("DELETE FROM entries_fts WHERE rowid = ?", ids)
+            cursor = self.conn.executemany("DELETE FROM entries WHERE id = ?", ids)
+        return cursor.rowcount
+
+    def archive(self, before_date: str, dry_run: bool = False) -> int:
+        if dry_run:
+            row = self.conn.execute(
+                "SELECT count(*) FROM entries WHERE archived = 0 AND date < ?",
+                (before_date,)).fetchone()
+            return row[0]
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE entries SET archived = 1 WHERE archived = 0 AND date < ?",
+                (before_date,))
+        return cursor.rowcount
+
+    def rebuild(self, entry_counts: Optional[Dict[str, int]] = None):
+        with self.conn:
+            self.conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('optimize')")
+        self.conn.execute("ANALYZE")
+
+    def import_markdown(self, memory_dir: Optional[str] = None,
+                        include_archive: bool = False) -> int:
+        """
+        从 markdown 日志批量导入，已导入的条目按内容指纹跳过
+
+        Returns:
+            新导入的条目数
+        """
+        source_dir = Path(memory_dir) if memory_dir else self.memory_dir
+        sources = [(source_dir, False)]
+        if include_archive:
+            sources.append((source_dir / "archive", True))
+
+        def spans(directory: Path) -> Iterable[EntrySpan]:
+            for memory_file in sorted(MarkdownStore(str(directory)).index.memory_files()):
+                with open(memory_file, 'rb') as f:
+                    yield from iter_entry_spans(f)
+
+        imported = 0
+        with self.conn:
+            for directory, archived in sources:
+                directory_spans = spans(directory)
+                if archived:
+                    # 归档层的压缩段
+                    directory_spans = itertools.chain(
+                        directory_spans, SegmentArchive(directory).iter_spans())
+                for span in directory_spans:
+                    source_match = re.search(r'\*\*来源\*\*:\s*(.+)', span.body)
+                    source = source_match.group(1).strip() if source_match else ""
+                    tags = entry_from_span(span)['tags']
+                    if self._insert(span, source, tags, archived, dedupe=True) is not None:
+                        imported += 1
+        return imported
+
+    def export_markdown(self, output_dir: str) -> int:
+        """
+        导出为每日 markdown 日志，已归档条目写入 archive/ 子目录
+
+        Returns:
+            写出的文件数
+        """
+        output = Path(output_dir)
+        days = defaultdict(list)
+        for row in self.conn.execute(
+                "SELECT date, raw, archived FROM entries ORDER BY date, time, id"):
+            days[(row['date'], row['archived'])].append(row['raw'])
+
+        for (date_str, archived), raws in days.items():
+            target_dir = output / "archive" if archived else output
+            target_dir.mkdir(parents=True, exist_ok=True)
+            with open(target_dir / f"{date_str}.md", 'w', encoding='utf-8') as f:
+                f.write(f"# 记忆日志 - {date_str}\n\n")
+                for raw in raws:
+                    f.write(f"\n{raw}\n---\n")
+
+        return len(days)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_store(memory_dir: str = "memory", backend: str = "markdown",
+               resident: bool = False) -> MemoryStore:
+    """按名称打开存储后端，resident 表示由常驻进程持有（SQLite 长连接本身即缓存）"""
+    if backend == "sqlite":
+        return SQLiteStore(memory_dir)
+    if backend == "markdown":
+        return MarkdownStore(memory_dir, resident)
+    raise ValueError(f"未知的存储后端: {backend}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆存储导入导出')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='从 markdown 日志导入 SQLite')
+    import_parser.add_argument('--archive', action='store_true',
+                               help='同时导入 archive/ 中的归档日志')
+
+    export_parser = subparsers.add_parser('export', help='从 SQLite 导出 markdown 日志')
+    export_parser.add_argument('--output', '-o', required=True, help='导出目录')
+
+    for sub in (import_parser, export_parser):
+        sub.add_argument('--memory-dir', '-d', default='memory', help='记忆目录')
+
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.memory_dir)
+    try:
+        if args.command == 'import':
+            imported = store.import_markdown(include_archive=args.archive)
+            print(f"✓ 导入 {imported} 条记忆到: {store.db_file}")
+        else:
+            written = store.export_markdown(args.output)
+            print(f"✓ 导出 {written} 个日志文件到: {args.output}")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
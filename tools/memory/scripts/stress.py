@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+记忆并发压力测试
+多个进程同时捕获、整合、回忆同一个记忆目录，结束后校验没有条目丢失、重复或损坏
+
+写入进程各自写入带唯一标记的条目，并穿插写入过短条目与完全重复的条目；
+整合进程在写入期间反复运行，删除短条目与重复项；回忆进程随机检索已写入的标记。
+全部进程结束后再整合一次，然后校验:
+    每个标记恰好出现一次、内容未被截断或拼接
+    不再有过短条目
+    每个标记都能经倒排索引（或 FTS）检索到
+任一项不满足或任一进程抛出异常时以非零状态退出。
+
+用法:
+    python stress.py                                   # 32 个写入进程
+    python stress.py --writers 64 --entries 200 --consolidators 4
+    python stress.py --backend sqlite --keep /tmp/stress-memory
+"""
+
+import re
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import traceback
+import multiprocessing
+from collections import Counter
+from typing import List, Dict
+
+from protocol import BACKENDS
+from capture import MemoryCapture
+from recall import MemoryRecall
+from consolidate import MemoryConsolidate
+
+
+# 写入日期的个数，日期越少各进程越集中地追加同一个日志文件
+DATES = 3
+
+# 每写入这么多条正常条目，穿插一条过短条目和一条重复条目
+NOISE_EVERY = 5
+
+_WORDS = ["数据库", "缓存", "索引", "队列", "部署", "架构", "监控", "迁移", "测试", "发布",
+          "redis", "kafka", "python", "postgres", "schema", "latency", "replica", "shard",
+          "rollback", "throughput", "cluster", "token", "pipeline", "budget"]
+
+
+_MARKER = re.compile(r'k(\d{3})x(\d{5})z')
+
+
+def marker(writer: int, index: int) -> str:
+    """条目的唯一标记，定长且首尾带字母，不会成为其他标记的子串"""
+    return f"k{writer:03d}x{index:05d}z"
+
+
+def content_for(writer: int, index: int) -> str:
+    rng = random.Random(writer * 100003 + index)
+    words = " ".join(rng.choice(_WORDS) + str(rng.randrange(1000)) for _ in range(12))
+    return f"{marker(writer, index)} {words}"
+
+
+def _writer(memory_dir: str, backend: str, writer: int, entries: int, errors):
+    try:
+        capture = MemoryCapture(memory_dir, backend)
+        rng = random.Random(writer)
+        index = 0
+        while index < entries:
+            # 每批 1-4 条，日期随机，模拟多个 Agent 交错追加
+            batch = []
+            for _ in range(min(rng.randint(1, 4), entries - index)):
+                item = {'content': content_for(writer, index),
+                        'date': f"2024-01-{rng.randint(1, DATES):02d}", 'time': "10:00"}
+                batch.append(item)
+                if index % NOISE_EVERY == 0:
+                    batch.append({'content': "ok", 'date': item['date'], 'time': "10:00"})
+                    batch.append(dict(item, date=f"2024-01-{rng.randint(1, DATES):02d}"))
+                index += 1
+            capture.capture_batch(batch)
+        capture.store.close()
+    except Exception:
+        errors.put(f"writer {writer}: {traceback.format_exc()}")
+
+
+def _consolidator(memory_dir: str, backend: str, done, errors, runs):
+    try:
+        consolidate = MemoryConsolidate(memory_dir, backend)
+        while not done.is_set():
+            consolidate.consolidate(similarity=0.9)
+            with runs.get_lock():
+                runs.value += 1
+        consolidate.store.close()
+    except Exception:
+        errors.put(f"consolidator: {traceback.format_exc()}")
+
+
+def _reader(memory_dir: str, backend: str, writers: int, entries: int, done, errors, runs):
+    try:
+        recall = MemoryRecall(memory_dir, backend)
+        rng = random.Random(-1)
+        while not done.is_set():
+            query = marker(rng.randrange(writers), rng.randrange(entries))
+            for entry in recall.recall(query, limit=5):
+                # 命中的条目必须是完整的原条目，不能是被截断或错位读取的片段
+                if query not in entry['content']:
+                    errors.put(f"reader: {query} 返回了不含查询的条目")
+            with runs.get_lock():
+                runs.value += 1
+        recall.store.close()
+    except Exception:
+        errors.put(f"reader: {traceback.format_exc()}")
+
+
+class StressTest:
+    """并发压力测试"""
+
+    def __init__(self, memory_dir: str, backend: str = "markdown", writers: int = 32,
+                 entries: int = 100, consolidators: int = 2, readers: int = 2):
+        self.memory_dir = memory_dir
+        self.backend = backend
+        self.writers = writers
+        self.entries = entries
+        self.consolidators = consolidators
+        self.readers = readers
+
+    def run(self) -> Dict:
+        """运行压力测试，返回计数与发现的问题"""
+        errors = multiprocessing.Queue()
+        done = multiprocessing.Event()
+        consolidations = multiprocessing.Value('i', 0)
+        recalls = multiprocessing.Value('i', 0)
+
+        writers = [multiprocessing.Process(
+            target=_writer, args=(self.memory_dir, self.backend, w, self.entries, errors))
+            for w in range(self.writers)]
+        others = [multiprocessing.Process(
+            target=_consolidator, args=(self.memory_dir, self.backend, done, errors,
+                                        consolidations))
+            for _ in range(self.consolidators)]
+        others += [multiprocessing.Process(
+            target=_reader, args=(self.memory_dir, self.backend, self.writers, self.entries,
+                                  done, errors, recalls))
+            for _ in range(self.readers)]
+
+        start = time.perf_counter()
+        for process in writers + others:
+            process.start()
+        for process in writers:
+            process.join()
+        write_seconds = time.perf_counter() - start
+        done.set()
+        for process in others:
+            process.join()
+
+        problems = []
+        while not errors.empty():
+            problems.append(errors.get())
+        for process in writers + others:
+            if process.exitcode != 0:
+                problems.append(f"进程 {process.pid} 退出码 {process.exitcode}")
+
+        # 写入结束后整合一次，之后目录应处于稳定状态
+        consolidate = MemoryConsolidate(self.memory_dir, self.backend)
+        consolidate.consolidate(similarity=0.9)
+        consolidate.store.close()
+        problems.extend(self.verify())
+
+        written = self.writers * self.entries
+        noise = self.writers * len(range(0, self.entries, NOISE_EVERY)) * 2
+        return {
+            'entries_written': written + noise,
+            'write_seconds': write_seconds,
+            'entries_per_second': (written + noise) / write_seconds,
+            'consolidations': consolidations.value,
+            'recalls': recalls.value,
+            'problems': problems,
+        }
+
+    def verify(self) -> List[str]:
+        """校验最终状态：标记恰好出现一次、内容完整、没有短条目、索引可检索"""
+        recall = MemoryRecall(self.memory_dir, self.backend)
+        problems = []
+        counts = Counter()
+        for entry in recall.store.iter_entries():
+            content = entry['content'].split("\n", 1)[0].replace("**内容**: ", "")
+            if content == "ok":
+                problems.append(f"短条目未清理: {entry.get('id')}")
+                continue
+            match = _MARKER.match(content)
+            if not match or content != content_for(int(match.group(1)), int(match.group(2))):
+                problems.append(f"内容损坏: {content[:80]!r}")
+                continue
+            counts[match.group(0)] += 1
+
+        for writer in range(self.writers):
+            for index in range(self.entries):
+                key = marker(writer, index)
+                if counts[key] != 1:
+                    problems.append(f"{key} 出现 {counts[key]} 次")
+                    continue
+                found = recall.recall(key, limit=5)
+                if len(found) != 1:
+                    problems.append(f"{key} 检索到 {len(found)} 条")
+        recall.store.close()
+        return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='记忆并发压力测试')
+    parser.add_argument('--writers', '-w', type=int, default=32, help='写入进程数 (默认: 32)')
+    parser.add_argument('--entries', '-n', type=int, default=100,
+                        help='每个写入进程的条目数 (默认: 100)')
+    parser.add_argument('--consolidators', type=int, default=2,
+                        help='同时运行的整合进程数 (默认: 2)')
+    parser.add_argument('--readers', type=int, default=2, help='同时运行的回忆进程数 (默认: 2)')
+    parser.add_argument('--backend', '-b', default='markdown', choices=BACKENDS,
+                        help='存储后端')
+    parser.add_argument('--keep', metavar='DIR',
+                        help='在此目录运行并保留结果（须为空目录），默认使用临时目录并在结束后删除')
+
+    args = parser.parse_args()
+
+    memory_dir = args.keep or tempfile.mkdtemp(prefix='memory-stress-')
+    try:
+        result = StressTest(memory_dir, args.backend, args.writers, args.entries,
+                            args.consolidators, args.readers).run()
+    finally:
+        if not args.keep:
+            shutil.rmtree(memory_dir, ignore_errors=True)
+
+    print(f"写入 {result['entries_written']} 条 ({args.writers} 个进程)，"
+          f"耗时 {result['write_seconds']:.1f}s，{result['entries_per_second']:.0f} 条/s")
+    print(f"期间整合 {result['consolidations']} 次，回忆 {result['recalls']} 次")
+    if result['problems']:
+        print(f"\n✗ 发现 {len(result['problems'])} 个问题:")
+        for problem in result['problems'][:20]:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("✓ 没有丢失、重复或损坏的条目")
+
+
+if __name__ == '__main__':
+    main()